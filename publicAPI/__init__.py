@@ -24,7 +24,11 @@ def create_app(
 
     import publicAPI.crest_endpoint as crest_endpoint
     import publicAPI.config as config
+    import publicAPI.cache_utils as cache_utils
+    import publicAPI.crest_utils as crest_utils
     import publicAPI.split_utils as split_utils
+    import publicAPI.http_utils as http_utils
+    import publicAPI.job_utils as job_utils
 
     import prosper.common.prosper_logging as p_logging
 
@@ -57,6 +61,12 @@ def create_app(
 
     config.CONFIG = local_configs
     config.load_globals(local_configs)
+    http_utils.SESSIONS.configure(local_configs)
+    http_utils.RATE_LIMITER.configure(local_configs)
+    http_utils.RETRY_POLICY.configure(local_configs)
+    job_utils.FORECAST_JOBS.configure(local_configs)
+    cache_utils.ACCESS_COUNTS.configure(local_configs)
+    crest_utils.HISTORY_CACHE.configure(local_configs)
     crest_endpoint.LOGGER = app.logger
 
     config.SPLIT_INFO = split_utils.read_split_info(logger=crest_endpoint.LOGGER)
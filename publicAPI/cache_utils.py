@@ -0,0 +1,1170 @@
+"""cache_utils.py: sqlite storage layer for publicAPI caches"""
+from os import path, makedirs, listdir, stat, getpid
+from datetime import datetime
+import atexit
+import sqlite3
+import logging
+import threading
+import time
+
+import ujson as json
+import pandas as pd
+
+import publicAPI.exceptions as exceptions
+
+LOGGER = logging.getLogger('publicAPI')
+HERE = path.abspath(path.dirname(__file__))
+
+CACHE_PATH = path.join(HERE, 'cache')
+makedirs(CACHE_PATH, exist_ok=True)
+
+CACHE_DB = 'publicAPI_cache.db'
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS id_cache (
+        endpoint TEXT NOT NULL,
+        index_key INTEGER NOT NULL,
+        cache_datetime REAL NOT NULL,
+        payload TEXT NOT NULL,
+        PRIMARY KEY (endpoint, index_key)
+    )""",
+    """CREATE TABLE IF NOT EXISTS forecast_cache (
+        region_id INTEGER NOT NULL,
+        type_id INTEGER NOT NULL,
+        model TEXT NOT NULL,
+        cache_date TEXT NOT NULL,
+        last_write REAL NOT NULL,
+        prediction TEXT NOT NULL,
+        PRIMARY KEY (region_id, type_id, model, cache_date)
+    )""",
+    """CREATE TABLE IF NOT EXISTS split_cache (
+        region_id INTEGER NOT NULL,
+        type_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        avgPrice REAL,
+        highPrice REAL,
+        lowPrice REAL,
+        volume INTEGER,
+        orders INTEGER,
+        data_source TEXT,
+        cache_date TEXT,
+        PRIMARY KEY (region_id, type_id, date)
+    )""",
+    """CREATE TABLE IF NOT EXISTS http_cache (
+        url TEXT NOT NULL PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        expires REAL NOT NULL,
+        body TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS response_cache (
+        cache_key TEXT NOT NULL PRIMARY KEY,
+        content_type TEXT NOT NULL,
+        etag TEXT NOT NULL,
+        last_modified REAL NOT NULL,
+        expires REAL NOT NULL,
+        body BLOB NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS response_variants (
+        cache_key TEXT NOT NULL,
+        encoding TEXT NOT NULL,
+        body BLOB NOT NULL,
+        PRIMARY KEY (cache_key, encoding)
+    )""",
+    """CREATE TABLE IF NOT EXISTS forecast_params (
+        region_id INTEGER NOT NULL,
+        type_id INTEGER NOT NULL,
+        last_write REAL NOT NULL,
+        params TEXT NOT NULL,
+        PRIMARY KEY (region_id, type_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS access_counts (
+        endpoint TEXT NOT NULL,
+        region_id INTEGER NOT NULL,
+        type_id INTEGER NOT NULL,
+        access_date TEXT NOT NULL,
+        hits INTEGER NOT NULL,
+        PRIMARY KEY (endpoint, region_id, type_id, access_date)
+    )""",
+    """CREATE TABLE IF NOT EXISTS forecast_jobs (
+        job_id TEXT NOT NULL PRIMARY KEY,
+        job_key TEXT NOT NULL,
+        status TEXT NOT NULL,
+        submitted REAL NOT NULL,
+        finished REAL,
+        error TEXT
+    )""",
+    """CREATE INDEX IF NOT EXISTS forecast_jobs_key ON forecast_jobs (job_key, status)""",
+]
+
+_LOCAL = threading.local()
+def connect(db_path):
+    """fetch this thread's connection to a cache db, building tables on first use
+
+    Notes:
+        WAL mode lets readers in other workers keep going during writes.
+        Connections are kept per thread (and per pid, so a forked worker
+        opens its own) and reused; schema/PRAGMAs run once per connection.
+        A db file removed or replaced underneath is reopened
+
+    Args:
+        db_path (str): path to sqlite file
+
+    Returns:
+        sqlite3.Connection: db handle (do not close)
+
+    """
+    connections = getattr(_LOCAL, 'connections', None)
+    if connections is None or _LOCAL.pid != getpid():
+        connections = _LOCAL.connections = {}
+        _LOCAL.pid = getpid()
+
+    cached = connections.get(db_path)
+    if cached is not None:
+        conn, inode = cached
+        try:
+            if stat(db_path).st_ino == inode:
+                return conn
+        except OSError:
+            pass
+        del connections[db_path]
+        conn.close()
+
+    makedirs(path.dirname(db_path), exist_ok=True)
+    try:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        connections[db_path] = (conn, stat(db_path).st_ino)
+    except (sqlite3.Error, OSError) as err_msg:
+        raise exceptions.CacheSetupFailure(
+            'Unable to open cache {0}: {1}'.format(db_path, repr(err_msg))
+        )
+
+    return conn
+
+## id_cache: validate_id ##
+def read_id_cache(
+        endpoint_name,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """read every cached id for an endpoint
+
+    Args:
+        endpoint_name (str): name of endpoint
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        dict: index_key:(cache_datetime, payload)
+
+    """
+    conn = connect(db_path)
+    rows = conn.execute(
+        'SELECT index_key, cache_datetime, payload FROM id_cache WHERE endpoint=?',
+        (endpoint_name,)
+    ).fetchall()
+
+    return {
+        index_key: (cache_datetime, json.loads(payload))
+        for index_key, cache_datetime, payload in rows
+    }
+
+def read_id_index(
+        endpoint_name,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """read every cached id's timestamp for an endpoint (no payloads)
+
+    Args:
+        endpoint_name (str): name of endpoint
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        dict: index_key:cache_datetime
+
+    """
+    conn = connect(db_path)
+    return dict(conn.execute(
+        'SELECT index_key, cache_datetime FROM id_cache WHERE endpoint=?',
+        (endpoint_name,)
+    ).fetchall())
+
+def read_id_payload(
+        endpoint_name,
+        index_key,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """read one cached id's payload
+
+    Args:
+        endpoint_name (str): name of endpoint
+        index_key (int): id to look up
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        dict: cached payload, None if missing
+
+    """
+    conn = connect(db_path)
+    row = conn.execute(
+        'SELECT payload FROM id_cache WHERE endpoint=? AND index_key=?',
+        (endpoint_name, index_key)
+    ).fetchone()
+    if row is None:
+        return None
+
+    return json.loads(row[0])
+
+def write_id_cache(
+        endpoint_name,
+        entries,
+        db_path=path.join(CACHE_PATH, CACHE_DB),
+        cache_datetime=None
+):
+    """write ids to cache in one transaction
+
+    Args:
+        endpoint_name (str): name of endpoint
+        entries (:obj:`list`): (index_key, payload) pairs
+        db_path (str, optional): path to sqlite file
+        cache_datetime (float, optional): timestamp override (default now)
+
+    Returns:
+        None
+
+    """
+    write_id_caches(
+        {endpoint_name: entries},
+        db_path=db_path,
+        cache_datetime=cache_datetime
+    )
+
+def write_id_caches(
+        endpoint_entries,
+        db_path=path.join(CACHE_PATH, CACHE_DB),
+        cache_datetime=None
+):
+    """write ids for many endpoints in one transaction
+
+    Args:
+        endpoint_entries (:obj:`dict`): endpoint_name:[(index_key, payload)]
+        db_path (str, optional): path to sqlite file
+        cache_datetime (float, optional): timestamp override (default now)
+
+    Returns:
+        int: rows written
+
+    """
+    if cache_datetime is None:
+        cache_datetime = datetime.utcnow().timestamp()
+
+    rows = [
+        (endpoint_name, index_key, cache_datetime, json.dumps(payload))
+        for endpoint_name, entries in endpoint_entries.items()
+        for index_key, payload in entries
+    ]
+    conn = connect(db_path)
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO id_cache ' +
+            '(endpoint, index_key, cache_datetime, payload) VALUES (?, ?, ?, ?)',
+            rows
+        )
+
+    return len(rows)
+
+## http_cache: fetch_esi_endpoint ##
+def read_http_cache(
+        url,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """fetch stored response + validators for a url
+
+    Args:
+        url (str): request address
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        dict: {etag, last_modified, expires, body}, None if missing
+
+    """
+    conn = connect(db_path)
+    row = conn.execute(
+        'SELECT etag, last_modified, expires, body FROM http_cache WHERE url=?',
+        (url,)
+    ).fetchone()
+
+    if not row:
+        return None
+    return dict(zip(['etag', 'last_modified', 'expires', 'body'], row))
+
+def write_http_cache(
+        url,
+        body,
+        expires,
+        etag=None,
+        last_modified=None,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """store response + validators for a url
+
+    Args:
+        url (str): request address
+        body (str): raw response text
+        expires (float): timestamp response goes stale
+        etag (str, optional): `ETag` header
+        last_modified (str, optional): `Last-Modified` header
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        None
+
+    """
+    conn = connect(db_path)
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO http_cache ' +
+            '(url, etag, last_modified, expires, body) VALUES (?, ?, ?, ?, ?)',
+            (url, etag, last_modified, expires, body)
+        )
+
+def touch_http_cache(
+        url,
+        expires,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """push back expiry of a stored response (after `304 Not Modified`)
+
+    Args:
+        url (str): request address
+        expires (float): new timestamp response goes stale
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        None
+
+    """
+    conn = connect(db_path)
+    with conn:
+        conn.execute(
+            'UPDATE http_cache SET expires=? WHERE url=?',
+            (expires, url)
+        )
+
+def prune_http_cache(
+        before,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """drop stored responses that went stale before `before`
+
+    Notes:
+        recently expired rows are still worth keeping for their validators
+
+    Args:
+        before (float): timestamp, rows with older `expires` are removed
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        int: rows removed
+
+    """
+    conn = connect(db_path)
+    with conn:
+        removed = conn.execute(
+            'DELETE FROM http_cache WHERE expires<?',
+            (before,)
+        ).rowcount
+
+    return removed
+
+## response_cache: crest_endpoint ##
+RESPONSE_FIELDS = ['content_type', 'etag', 'last_modified', 'expires', 'body']
+def read_response(
+        cache_key,
+        encodings=(),
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """fetch a pre-rendered response body if still fresh
+
+    Args:
+        cache_key (str): response identity (endpoint/ids/format/range)
+        encodings (:obj:`list`, optional): acceptable `Content-Encoding`s, best first
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        dict: {content_type, etag, last_modified, expires, body, encoding},
+            None if missing/stale.  `encoding` is None for the plain body
+
+    """
+    conn = connect(db_path)
+    row = conn.execute(
+        'SELECT ' + ', '.join(RESPONSE_FIELDS) + ' FROM response_cache ' +
+        'WHERE cache_key=? AND expires>?',
+        (cache_key, datetime.utcnow().timestamp())
+    ).fetchone()
+    variants = {}
+    if row and encodings:
+        variants = dict(conn.execute(
+            'SELECT encoding, body FROM response_variants WHERE cache_key=? ' +
+            'AND encoding IN ({0})'.format(', '.join('?' * len(encodings))),
+            (cache_key, *encodings)
+        ).fetchall())
+
+    if not row:
+        return None
+    response = dict(zip(RESPONSE_FIELDS, row), encoding=None)
+    for encoding in encodings:
+        if encoding in variants:
+            response['body'] = variants[encoding]
+            response['encoding'] = encoding
+            break
+    return response
+
+def write_response(
+        cache_key,
+        body,
+        content_type,
+        etag,
+        last_modified,
+        expires,
+        variants=None,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """store a pre-rendered response body, dropping stale ones
+
+    Args:
+        cache_key (str): response identity (endpoint/ids/format/range)
+        body (bytes): encoded response body
+        content_type (str): `Content-Type` header
+        etag (str): strong validator for body
+        last_modified (float): timestamp body was rendered
+        expires (float): timestamp body goes stale
+        variants (:obj:`dict`, optional): {`Content-Encoding`: compressed body}
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        None
+
+    """
+    conn = connect(db_path)
+    with conn:
+        conn.execute(
+            'DELETE FROM response_variants WHERE cache_key IN ' +
+            '(SELECT cache_key FROM response_cache WHERE expires<=?) OR cache_key=?',
+            (datetime.utcnow().timestamp(), cache_key)
+        )
+        conn.execute(
+            'DELETE FROM response_cache WHERE expires<=?',
+            (datetime.utcnow().timestamp(),)
+        )
+        conn.execute(
+            'INSERT OR REPLACE INTO response_cache ' +
+            '(cache_key, content_type, etag, last_modified, expires, body) ' +
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (cache_key, content_type, etag, last_modified, expires, sqlite3.Binary(body))
+        )
+        conn.executemany(
+            'INSERT INTO response_variants (cache_key, encoding, body) VALUES (?, ?, ?)',
+            [
+                (cache_key, encoding, sqlite3.Binary(encoded))
+                for encoding, encoded in (variants or {}).items()
+            ]
+        )
+
+## forecast_cache: forecast_utils ##
+def read_prediction(
+        region_id,
+        type_id,
+        cache_date,
+        model='prophet',
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """fetch a cached prediction
+
+    Args:
+        region_id (int): EVE Online region ID
+        type_id (int): EVE Online type ID
+        cache_date (str): %Y-%m-%d date of prediction
+        model (str, optional): forecast backend
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        bytes: prediction payload (str for legacy JSON), None if missing
+
+    """
+    conn = connect(db_path)
+    row = conn.execute(
+        'SELECT prediction FROM forecast_cache ' +
+        'WHERE region_id=? AND type_id=? AND model=? AND cache_date=?',
+        (int(region_id), int(type_id), model, cache_date)
+    ).fetchone()
+
+    if row:
+        return row[0]
+    return None
+
+def write_prediction(
+        region_id,
+        type_id,
+        cache_date,
+        prediction,
+        model='prophet',
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """replace cached prediction, clearing older entries for the pair
+
+    Args:
+        region_id (int): EVE Online region ID
+        type_id (int): EVE Online type ID
+        cache_date (str): %Y-%m-%d date of prediction
+        prediction (bytes): prediction payload
+        model (str, optional): forecast backend
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        None
+
+    """
+    write_predictions(
+        [(region_id, type_id, prediction)],
+        cache_date,
+        model=model,
+        db_path=db_path
+    )
+
+def write_predictions(
+        entries,
+        cache_date,
+        model='prophet',
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """replace many cached predictions of one model in one transaction
+
+    Args:
+        entries (:obj:`list`): (region_id, type_id, prediction) rows
+        cache_date (str): %Y-%m-%d date of predictions
+        model (str, optional): forecast backend
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        int: rows written
+
+    """
+    last_write = datetime.utcnow().timestamp()
+    rows = [
+        (int(region_id), int(type_id), model, cache_date, last_write, prediction)
+        for region_id, type_id, prediction in entries
+    ]
+    conn = connect(db_path)
+    with conn:
+        conn.executemany(
+            'DELETE FROM forecast_cache ' +
+            'WHERE region_id=? AND type_id=? AND model=? AND cache_date<=?',
+            [row[:4] for row in rows]
+        )
+        conn.executemany(
+            'INSERT INTO forecast_cache ' +
+            '(region_id, type_id, model, cache_date, last_write, prediction) ' +
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            rows
+        )
+
+    return len(rows)
+
+## forecast_params: forecast_utils warm starts ##
+def read_forecast_params(
+        region_id,
+        type_id,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """fetch last fitted model parameters for a pair
+
+    Args:
+        region_id (int): EVE Online region ID
+        type_id (int): EVE Online type ID
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        str: JSON parameter payload, None if missing
+
+    """
+    conn = connect(db_path)
+    row = conn.execute(
+        'SELECT params FROM forecast_params WHERE region_id=? AND type_id=?',
+        (int(region_id), int(type_id))
+    ).fetchone()
+
+    if row:
+        return row[0]
+    return None
+
+def write_forecast_params(
+        entries,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """replace fitted model parameters for many pairs in one transaction
+
+    Args:
+        entries (:obj:`list`): (region_id, type_id, params) rows, params as JSON str
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        int: rows written
+
+    """
+    last_write = datetime.utcnow().timestamp()
+    rows = [
+        (int(region_id), int(type_id), last_write, params)
+        for region_id, type_id, params in entries
+    ]
+    conn = connect(db_path)
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO forecast_params ' +
+            '(region_id, type_id, last_write, params) VALUES (?, ?, ?, ?)',
+            rows
+        )
+
+    return len(rows)
+
+## access_counts: precompute_forecasts ##
+def record_access(
+        endpoint,
+        region_id,
+        type_id,
+        access_date=None,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """count one request for a region/type pair
+
+    Args:
+        endpoint (str): endpoint name (prophet/ohlc)
+        region_id (int): EVE Online region ID
+        type_id (int): EVE Online type ID
+        access_date (str, optional): %Y-%m-%d day to count against (default: UTC today)
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        None
+
+    """
+    access_date = access_date or datetime.utcnow().strftime('%Y-%m-%d')
+    record_accesses(
+        [(endpoint, region_id, type_id, access_date, 1)],
+        db_path=db_path
+    )
+
+def record_accesses(
+        entries,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """add many request counts in one transaction
+
+    Args:
+        entries (:obj:`list`): (endpoint, region_id, type_id, access_date, hits) rows
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        int: rows touched
+
+    """
+    rows = [
+        (endpoint, int(region_id), int(type_id), access_date, int(hits))
+        for endpoint, region_id, type_id, access_date, hits in entries
+    ]
+    conn = connect(db_path)
+    with conn:
+        ## no UPSERT on older sqlite builds ##
+        conn.executemany(
+            'INSERT OR IGNORE INTO access_counts ' +
+            '(endpoint, region_id, type_id, access_date, hits) VALUES (?, ?, ?, ?, 0)',
+            [row[:4] for row in rows]
+        )
+        conn.executemany(
+            'UPDATE access_counts SET hits=hits+? ' +
+            'WHERE endpoint=? AND region_id=? AND type_id=? AND access_date=?',
+            [(row[4], *row[:4]) for row in rows]
+        )
+    return len(rows)
+
+class AccessCounter(object):
+    """count requests in memory, write them to access_counts in batches
+
+    Notes:
+        a sqlite write per request takes the db write lock from every
+        other worker.  Counts are flushed from the request thread at most
+        every `flush_interval` seconds (or `flush_size` pending pairs), and
+        at exit.  Counts taken before a fork stay with the parent
+
+    Args:
+        flush_interval (float, optional): seconds between flushes
+        flush_size (int, optional): pending pairs that force a flush
+
+    """
+    def __init__(
+            self,
+            flush_interval=60.0,
+            flush_size=1000,
+    ):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._lock = threading.Lock()
+        self._counts = {}   # {(db_path, endpoint, region_id, type_id, access_date): hits}
+        self._pid = getpid()
+        self._last_flush = time.monotonic()
+
+    def configure(self, config):
+        """load settings from [FORECAST] section
+
+        Args:
+            config (:obj:`prosper.common.ProsperConfig`): configuration object
+
+        """
+        self.flush_interval = float(config.get_option(
+            'FORECAST', 'access_flush', args_default=self.flush_interval))
+
+    def hit(
+            self,
+            endpoint,
+            region_id,
+            type_id,
+            db_path=path.join(CACHE_PATH, CACHE_DB)
+    ):
+        """count one request for a region/type pair (see `record_access`)
+
+        Args:
+            endpoint (str): endpoint name (prophet/ohlc)
+            region_id (int): EVE Online region ID
+            type_id (int): EVE Online type ID
+            db_path (str, optional): path to sqlite file
+
+        """
+        key = (
+            db_path, endpoint, int(region_id), int(type_id),
+            datetime.utcnow().strftime('%Y-%m-%d')
+        )
+        with self._lock:
+            if self._pid != getpid():
+                self._counts = {}
+                self._pid = getpid()
+            self._counts[key] = self._counts.get(key, 0) + 1
+            due = len(self._counts) >= self.flush_size or \
+                time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """write pending counts
+
+        Returns:
+            int: pairs written
+
+        """
+        with self._lock:
+            if self._pid != getpid():
+                self._counts = {}
+                self._pid = getpid()
+            counts, self._counts = self._counts, {}
+            self._last_flush = time.monotonic()
+
+        by_db = {}
+        for (db_path, *key), hits in counts.items():
+            by_db.setdefault(db_path, []).append((*key, hits))
+        written = 0
+        for db_path, entries in by_db.items():
+            try:
+                written += record_accesses(entries, db_path=db_path)
+            except Exception:   #pragma: no cover
+                LOGGER.warning('unable to flush %d access counts', len(entries), exc_info=True)
+        return written
+
+ACCESS_COUNTS = AccessCounter()
+atexit.register(ACCESS_COUNTS.flush)
+
+def read_top_accessed(
+        endpoint,
+        limit,
+        since_date,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """most requested region/type pairs
+
+    Args:
+        endpoint (str): endpoint name (prophet/ohlc)
+        limit (int): pairs to return
+        since_date (str): %Y-%m-%d first day to count
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        list: (region_id, type_id, hits), busiest first
+
+    """
+    conn = connect(db_path)
+    rows = conn.execute(
+        'SELECT region_id, type_id, SUM(hits) AS total FROM access_counts ' +
+        'WHERE endpoint=? AND access_date>=? ' +
+        'GROUP BY region_id, type_id ORDER BY total DESC, region_id, type_id LIMIT ?',
+        (endpoint, since_date, int(limit))
+    ).fetchall()
+
+    return [tuple(row) for row in rows]
+
+def prune_access_counts(
+        before_date,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """drop access counts older than `before_date`
+
+    Args:
+        before_date (str): %Y-%m-%d first day to keep
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        int: rows removed
+
+    """
+    conn = connect(db_path)
+    with conn:
+        removed = conn.execute(
+            'DELETE FROM access_counts WHERE access_date<?',
+            (before_date,)
+        ).rowcount
+
+    return removed
+
+## forecast_jobs: job_utils ##
+JOB_FIELDS = ['job_id', 'key', 'status', 'submitted', 'finished', 'error']
+JOB_DONE = ('done', 'failed')
+def _job_record(row):
+    """forecast_jobs row -> dict (`JOB_FIELDS`)"""
+    record = dict(zip(JOB_FIELDS, row))
+    record['key'] = tuple(json.loads(record['key']))
+    return record
+
+def claim_job(
+        job_id,
+        key,
+        submitted,
+        stale_before,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """register a job for `key`, unless another worker already has one in flight
+
+    Notes:
+        runs under `BEGIN IMMEDIATE`, so two workers can't both claim a key.
+        In-flight jobs submitted before `stale_before` are marked failed
+        (their worker died or was restarted) and no longer block the key
+
+    Args:
+        job_id (str): new job's id
+        key (tuple): identity of the work (JSON-able)
+        submitted (float): timestamp job was queued
+        stale_before (float): timestamp, older in-flight jobs are lost
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        dict: in-flight job holding `key` (`JOB_FIELDS`), None if claimed
+
+    """
+    job_key = json.dumps(list(key))
+    conn = connect(db_path)
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(
+            'UPDATE forecast_jobs SET status=?, finished=?, error=? ' +
+            'WHERE job_key=? AND status NOT IN (?, ?) AND submitted<?',
+            ('failed', submitted, 'job lost', job_key, *JOB_DONE, stale_before)
+        )
+        row = conn.execute(
+            'SELECT job_id, job_key, status, submitted, finished, error FROM forecast_jobs ' +
+            'WHERE job_key=? AND status NOT IN (?, ?) ORDER BY submitted LIMIT 1',
+            (job_key, *JOB_DONE)
+        ).fetchone()
+        if row is not None:
+            return _job_record(row)
+
+        conn.execute(
+            'INSERT INTO forecast_jobs (job_id, job_key, status, submitted) VALUES (?, ?, ?, ?)',
+            (job_id, job_key, 'queued', submitted)
+        )
+    return None
+
+def finish_job(
+        job_id,
+        status,
+        finished,
+        error=None,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """record a job's outcome
+
+    Args:
+        job_id (str): job to update
+        status (str): done/failed
+        finished (float): timestamp job resolved
+        error (str, optional): failure report
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        None
+
+    """
+    conn = connect(db_path)
+    with conn:
+        conn.execute(
+            'UPDATE forecast_jobs SET status=?, finished=?, error=? WHERE job_id=?',
+            (status, finished, error, job_id)
+        )
+
+def read_job(
+        job_id,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """look up a job from any worker
+
+    Args:
+        job_id (str): job to look up
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        dict: `JOB_FIELDS`, None if missing
+
+    """
+    conn = connect(db_path)
+    row = conn.execute(
+        'SELECT job_id, job_key, status, submitted, finished, error FROM forecast_jobs ' +
+        'WHERE job_id=?',
+        (job_id,)
+    ).fetchone()
+
+    if row is None:
+        return None
+    return _job_record(row)
+
+def read_active_job(
+        key,
+        stale_before,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """look up the in-flight job for `key` from any worker
+
+    Args:
+        key (tuple): identity of the work
+        stale_before (float): timestamp, older in-flight jobs are ignored
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        dict: `JOB_FIELDS`, None if nothing is running
+
+    """
+    conn = connect(db_path)
+    row = conn.execute(
+        'SELECT job_id, job_key, status, submitted, finished, error FROM forecast_jobs ' +
+        'WHERE job_key=? AND status NOT IN (?, ?) AND submitted>=? ' +
+        'ORDER BY submitted LIMIT 1',
+        (json.dumps(list(key)), *JOB_DONE, stale_before)
+    ).fetchone()
+
+    if row is None:
+        return None
+    return _job_record(row)
+
+def prune_jobs(
+        before,
+        db_path=path.join(CACHE_PATH, CACHE_DB)
+):
+    """drop jobs that finished before `before`
+
+    Args:
+        before (float): timestamp
+        db_path (str, optional): path to sqlite file
+
+    Returns:
+        int: rows removed
+
+    """
+    conn = connect(db_path)
+    with conn:
+        removed = conn.execute(
+            'DELETE FROM forecast_jobs WHERE finished<?',
+            (before,)
+        ).rowcount
+
+    return removed
+
+## split_cache: split_utils ##
+SPLIT_COLUMNS = [
+    'date', 'avgPrice', 'highPrice', 'lowPrice', 'volume', 'orders'
+]
+def read_split_history(
+        region_id,
+        type_id,
+        db_path,
+        split_date=None,
+        keep_columns=SPLIT_COLUMNS
+):
+    """fetch cached history for a split item
+
+    Args:
+        region_id (int): EVE Online region ID
+        type_id (int): EVE Online type ID
+        db_path (str): path to sqlite file
+        split_date (str, optional): %Y-%m-%d last date to fetch
+        keep_columns (:obj:`list`, optional): columns to return
+
+    Returns:
+        pandas.DataFrame: cached rows (empty if none)
+
+    """
+    query = 'SELECT {0} FROM split_cache WHERE region_id=? AND type_id=?'.format(
+        ', '.join(keep_columns)
+    )
+    params = [int(region_id), int(type_id)]
+    if split_date:
+        query += ' AND date<=?'
+        params.append(split_date)
+
+    conn = connect(db_path)
+    data = pd.read_sql_query(query, conn, params=params)
+
+    return data
+
+def write_split_history(
+        data,
+        db_path,
+        type_id=0,
+        region_id=0
+):
+    """write history rows into split cache
+
+    Notes:
+        rows with matching (region_id, type_id, date) are replaced
+
+    Args:
+        data (:obj:`pandas.DataFrame`): history with `region_id`/`type_id` columns
+        db_path (str): path to sqlite file
+        type_id (int, optional): clear existing entries for type_id/region_id
+        region_id (int, optional): clear existing entries for type_id/region_id
+
+    Returns:
+        None
+
+    """
+    rows = pd.DataFrame({
+        'region_id': pd.to_numeric(data['region_id']).astype(int),
+        'type_id': pd.to_numeric(data['type_id']).astype(int),
+        'date': pd.to_datetime(data['date']).dt.strftime('%Y-%m-%d'),
+        'avgPrice': pd.to_numeric(data['avgPrice']),
+        'highPrice': pd.to_numeric(data['highPrice']),
+        'lowPrice': pd.to_numeric(data['lowPrice']),
+        'volume': pd.to_numeric(data['volume']),
+        'orders': pd.to_numeric(data['orders']),
+        'data_source': data.get('data_source'),
+        'cache_date': data.get('cache_date'),
+    })
+
+    conn = connect(db_path)
+    with conn:
+        if type_id and region_id:
+            conn.execute(
+                'DELETE FROM split_cache WHERE region_id=? AND type_id=? AND date>=?',
+                (int(region_id), int(type_id), rows['date'].min())
+            )
+        conn.executemany(
+            'INSERT OR REPLACE INTO split_cache ({0}) VALUES ({1})'.format(
+                ', '.join(rows.columns),
+                ', '.join(['?'] * len(rows.columns))
+            ),
+            rows.astype(object).where(rows.notnull(), None).values.tolist()
+        )
+
+## Migration from tinydb ##
+def read_tinydb_file(json_filepath):
+    """read every document out of a tinydb file
+
+    Args:
+        json_filepath (str): path to tinydb .json file
+
+    Returns:
+        list: documents in `_default` table
+
+    """
+    with open(json_filepath, 'r') as tdb_fh:
+        raw_data = json.load(tdb_fh)
+
+    return list(raw_data.get('_default', {}).values())
+
+def migrate_tinydb_caches(
+        cache_path=CACHE_PATH,
+        db_filename=CACHE_DB,
+        logger=LOGGER
+):
+    """one-shot copy of legacy tinydb caches into sqlite
+
+    Notes:
+        id caches (`<endpoint>.json`) and `prophet.json` go to `db_filename`
+        split caches (`*splitcache.json`) go to a matching `*splitcache.db`
+        tinymongo files (api keys) are left alone
+
+    Args:
+        cache_path (str, optional): path to cache folder
+        db_filename (str, optional): name of sqlite cache
+        logger (:obj:`logging.logger`, optional): logging handle
+
+    Returns:
+        dict: filename:rows migrated
+
+    """
+    db_path = path.join(cache_path, db_filename)
+    report = {}
+    for filename in sorted(listdir(cache_path)):
+        if not filename.endswith('.json'):
+            continue
+        json_filepath = path.join(cache_path, filename)
+        try:
+            documents = read_tinydb_file(json_filepath)
+        except Exception:
+            logger.warning('Unable to read %s, skipping', json_filepath, exc_info=True)
+            continue
+        if not documents:
+            continue
+
+        stem = filename[:-len('.json')]
+        if 'index_key' in documents[0]:
+            logger.info('--migrating id cache: %s', filename)
+            conn = connect(db_path)
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO id_cache ' +
+                    '(endpoint, index_key, cache_datetime, payload) VALUES (?, ?, ?, ?)',
+                    [
+                        (stem, doc['index_key'], doc['cache_datetime'], json.dumps(doc['payload']))
+                        for doc in documents
+                    ]
+                )
+        elif 'prediction' in documents[0]:
+            logger.info('--migrating prediction cache: %s', filename)
+            for doc in documents:
+                write_prediction(
+                    doc['region_id'],
+                    doc['type_id'],
+                    doc['cache_date'],
+                    doc['prediction'],
+                    db_path=db_path
+                )
+        elif 'date' in documents[0] and 'region_id' in documents[0]:
+            logger.info('--migrating split cache: %s', filename)
+            write_split_history(
+                pd.DataFrame(documents),
+                path.join(cache_path, stem + '.db')
+            )
+        else:
+            logger.info('--not a cache file: %s', filename)
+            continue
+
+        report[filename] = len(documents)
+
+    return report
@@ -18,8 +18,80 @@ DEFAULT_RANGE = 60
 MAX_RANGE = 180
 DEFAULT_HISTORY_RANGE = 700
 EXPECTED_CREST_RANGE = 400
+WARM_START = True
+DEFAULT_MODEL = 'prophet'
+PRECISION = 'full'
+UNCERTAINTY_SAMPLES = 100
 
-SPLIT_CACHE_FILE = path.join(HERE, 'cache', 'splitcache.json')
+SPLIT_CACHE_FILE = path.join(HERE, 'cache', 'splitcache.db')
+
+REGION_LIST = [
+    10000001,   #'Derelik',
+    10000002,   #'The Forge',
+    10000003,   #'Vale of the Silent',
+    10000005,   #'Detorid',
+    10000006,   #'Wicked Creek',
+    10000007,   #'Cache',
+    10000008,   #'Scalding Pass',
+    10000009,   #'Insmother',
+    10000010,   #'Tribute',
+    10000011,   #'Great Wildlands',
+    10000012,   #'Curse',
+    10000013,   #'Malpais',
+    10000014,   #'Catch',
+    10000015,   #'Venal',
+    10000016,   #'Lonetrek',
+    10000018,   #'The Spire',
+    10000020,   #'Tash-Murkon',
+    10000021,   #'Outer Passage',
+    10000022,   #'Stain',
+    10000023,   #'Pure Blind',
+    10000025,   #'Immensea',
+    10000027,   #'Etherium Reach',
+    10000028,   #'Molden Heath',
+    10000029,   #'Geminate',
+    10000030,   #'Heimatar',
+    10000031,   #'Impass',
+    10000032,   #'Sinq Liaison',
+    10000033,   #'The Citadel',
+    10000034,   #'The Kalevala Expanse',
+    10000035,   #'Deklein',
+    10000036,   #'Devoid',
+    10000037,   #'Everyshore',
+    10000038,   #'The Bleak Lands',
+    10000039,   #'Esoteria',
+    10000040,   #'Oasa',
+    10000041,   #'Syndicate',
+    10000042,   #'Metropolis',
+    10000043,   #'Domain',
+    10000044,   #'Solitude',
+    10000045,   #'Tenal',
+    10000046,   #'Fade',
+    10000047,   #'Providence',
+    10000048,   #'Placid',
+    10000049,   #'Khanid',
+    10000050,   #'Querious',
+    10000051,   #'Cloud Ring',
+    10000052,   #'Kador',
+    10000053,   #'Cobalt Edge',
+    10000054,   #'Aridia',
+    10000055,   #'Branch',
+    10000056,   #'Feythabolis',
+    10000057,   #'Outer Ring',
+    10000058,   #'Fountain',
+    10000059,   #'Paragon Soul',
+    10000060,   #'Delve',
+    10000061,   #'Tenerifis',
+    10000062,   #'Omist',
+    10000063,   #'Period Basis',
+    10000064,   #'Essence',
+    10000065,   #'Kor-Azor',
+    10000066,   #'Perrigen Falls',
+    10000067,   #'Genesis',
+    10000068,   #'Verge Vendor',
+    10000069,   #'Black Rise',
+    #11000031,   #'Thera'
+]
 
 class SwitchCCPSource(Enum):
     """enum for switching between crest/esi"""
@@ -29,12 +101,19 @@ class SwitchCCPSource(Enum):
 
 def load_globals(config=CONFIG):
     """loads global vars from config object"""
-    global USER_AGENT, USER_AGENT_SHORT, DEFAULT_RANGE, MAX_RANGE
+    global USER_AGENT, USER_AGENT_SHORT, DEFAULT_RANGE, MAX_RANGE, WARM_START, DEFAULT_MODEL
+    global PRECISION, UNCERTAINTY_SAMPLES
 
     USER_AGENT = config.get('GLOBAL', 'useragent')
     USER_AGENT_SHORT = config.get('GLOBAL', 'useragent_short')
 
     DEFAULT_RANGE = int(config.get('CREST', 'prophet_range'))
     MAX_RANGE = int(config.get('CREST', 'prophet_max'))
+    WARM_START = str(config.get_option(
+        'FORECAST', 'warm_start', args_default=WARM_START)).lower() in ('true', '1', 'yes', 'on')
+    DEFAULT_MODEL = config.get_option('FORECAST', 'default_model', args_default=DEFAULT_MODEL)
+    PRECISION = config.get_option('FORECAST', 'precision', args_default=PRECISION)
+    UNCERTAINTY_SAMPLES = int(config.get_option(
+        'FORECAST', 'uncertainty_samples', args_default=UNCERTAINTY_SAMPLES))
 
 SPLIT_INFO = {}
@@ -2,18 +2,23 @@
 
 import sys
 from os import path
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
 from enum import Enum
+from functools import partial
 import logging
 
 import ujson as json
-from flask import Flask, Response, jsonify
-from flask_restful import reqparse, Api, Resource, request
+from flask import Flask, Response, jsonify, current_app
+from flask_restful import reqparse, inputs, Api, Resource, request
 
 import publicAPI.forecast_utils as forecast_utils
 import publicAPI.crest_utils as crest_utils
 import publicAPI.api_utils as api_utils
+import publicAPI.cache_utils as cache_utils
 import publicAPI.exceptions as exceptions
+import publicAPI.format_utils as format_utils
+import publicAPI.job_utils as job_utils
 import publicAPI.config as api_config
 import publicAPI.split_utils as split_utils
 
@@ -35,6 +40,17 @@ class AcceptedDataFormat(Enum):
     """enum for handling format support"""
     CSV = 'csv'
     JSON = 'json'
+    NPY = 'npy'
+    MSGPACK = 'msgpack'
+
+## binary formats: return_type: (Content-Type, encoder) ##
+BINARY_FORMATS = {
+    AcceptedDataFormat.NPY.value: ('application/x-npy', format_utils.to_npy_bytes),
+    AcceptedDataFormat.MSGPACK.value: ('application/msgpack', format_utils.to_msgpack_bytes),
+}
+OHLC_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+OHLC_DATE_FORMAT = '%Y-%m-%d'  # ESI-style text dates in OHLC json
+PROPHET_COLUMNS = ['date', 'avgPrice', 'yhat', 'yhat_low', 'yhat_high', 'prediction']
 
 def return_supported_types():
     """parse AccpetedDataFormat.__dict__ for accepted types"""
@@ -43,17 +59,214 @@ def return_supported_types():
         if '_' not in key:
             supported_types.append(key.lower())
 
+    if format_utils.msgpack is None:
+        supported_types.remove(AcceptedDataFormat.MSGPACK.value)
     return supported_types
 
 ## Flask Endpoints ##
 @API.representation('text/csv')
 def output_csv(data, status, headers=None):
-    """helper for sending out CSV instead of JSON"""
-    resp = APP_HACK.make_response(data)
+    """helper for sending out CSV instead of JSON (str or chunk iterator)"""
+    resp = APP_HACK.response_class(data, status=status)
 
     resp.headers['Content-Type'] = 'text/csv'
+    resp.headers.extend(headers or {})
     return resp
 
+def output_json(data, status, headers=None):
+    """helper for sending pre-encoded JSON (skips flask-restful re-encode)"""
+    resp = APP_HACK.response_class(data, status=status)
+
+    resp.headers['Content-Type'] = 'application/json'
+    resp.headers.extend(headers or {})
+    return resp
+
+def output_binary(data, status, content_type, headers=None):
+    """helper for sending binary formats (`BINARY_FORMATS`)"""
+    resp = APP_HACK.response_class(data, status=status)
+
+    resp.headers['Content-Type'] = content_type
+    resp.headers.extend(headers or {})
+    return resp
+
+def json_settings():
+    """`json.dumps` settings flask-restful would use (RESTFUL_JSON/debug indent)"""
+    settings = dict(current_app.config.get('RESTFUL_JSON', {}))
+    if current_app.debug:
+        settings.setdefault('indent', 4)
+    return settings
+
+RESPONSE_CACHE_DB = path.join(cache_utils.CACHE_PATH, cache_utils.CACHE_DB)
+def response_cache_key(endpoint_name, args, return_type, *extra):
+    """build response-cache identity for a request
+
+    Args:
+        endpoint_name (str): ohlc/prophet
+        args (:obj:`dict`): parsed request args (regionID/typeID)
+        return_type (str): requested format
+        *extra: other values the body depends on (range, history window)
+
+    Returns:
+        str: cache key
+
+    """
+    return ':'.join(map(str, [
+        endpoint_name, args.get('regionID'), args.get('typeID'), return_type, *extra
+    ]))
+
+def ohlc_variant(args):
+    """`interval` and `start`/`end`/`last_n` window requested on OHLC, for cache keys
+
+    Args:
+        args (:obj:`dict`): parsed request args
+
+    Returns:
+        list: variant values as text (empty for plain daily history)
+
+    """
+    variant = [
+        args.get('interval') or '1d', args.get('start'), args.get('end'), args.get('last_n')
+    ]
+    if variant == ['1d', None, None, None]:
+        return []
+
+    return [
+        '' if value is None else
+        value.strftime('%Y-%m-%d') if isinstance(value, datetime) else str(value)
+        for value in variant
+    ]
+
+def response_expiry(endpoint_name):
+    """when a rendered response goes stale
+
+    Notes:
+        OHLC follows the daily ESI history refresh
+        forecasts are cached per UTC day
+
+    Args:
+        endpoint_name (str): ohlc/prophet
+
+    Returns:
+        float: timestamp
+
+    """
+    if endpoint_name == 'ohlc':
+        return crest_utils.next_esi_refresh(api_config.CONFIG.get_option(
+            'CACHING', 'esi_refresh_utc', args_default='11:05'))
+
+    tomorrow = datetime.utcnow().date() + timedelta(days=1)
+    return datetime(tomorrow.year, tomorrow.month, tomorrow.day).timestamp()
+
+def conditional_response(resp, etag, last_modified, expires):
+    """stamp validators on a response and answer conditional requests (304)"""
+    resp.set_etag(etag)
+    resp.last_modified = datetime.utcfromtimestamp(last_modified)
+    resp.expires = datetime.utcfromtimestamp(expires)
+    return resp.make_conditional(request)
+
+def accepted_encodings():
+    """`Content-Encoding`s the client takes, best first (server order breaks ties)
+
+    Returns:
+        list: encodings from `format_utils.content_encodings()`
+
+    """
+    encodings = format_utils.content_encodings()
+    qualities = {
+        encoding: request.accept_encodings[encoding] for encoding in encodings
+    }
+    return sorted(
+        [encoding for encoding in encodings if qualities[encoding] > 0],
+        key=lambda encoding: -qualities[encoding]
+    )
+
+def cached_response(
+        cache_key,
+        logger=logging.getLogger('publicAPI')
+):
+    """serve a pre-rendered response straight from the response cache
+
+    Notes:
+        precompressed variants are picked by `Accept-Encoding`, each with
+        its own strong ETag
+
+    Args:
+        cache_key (str): see `response_cache_key`
+        logger (:obj:`logging.logger`, optional): logging handle
+
+    Returns:
+        Flask response (200 or 304), None if not cached
+
+    """
+    try:
+        cached = cache_utils.read_response(
+            cache_key,
+            encodings=accepted_encodings(),
+            db_path=RESPONSE_CACHE_DB
+        )
+    except Exception:   #pragma: no cover
+        logger.warning('unable to read response cache', exc_info=True)
+        return None
+    if cached is None:
+        return None
+
+    logger.info('returning cached response: %s (%s)', cache_key, cached['encoding'])
+    resp = APP_HACK.response_class(bytes(cached['body']), status=200)
+    resp.headers['Content-Type'] = cached['content_type']
+    resp.vary.add('Accept-Encoding')
+    etag = cached['etag']
+    if cached['encoding']:
+        resp.headers['Content-Encoding'] = cached['encoding']
+        etag = '{0}-{1}'.format(etag, cached['encoding'])
+    return conditional_response(
+        resp, etag, cached['last_modified'], cached['expires']
+    )
+
+def cache_stream(
+        cache_key,
+        chunks,
+        content_type,
+        expires,
+        logger=logging.getLogger('publicAPI')
+):
+    """pass response chunks through, storing the finished body for next time
+
+    Notes:
+        the body is streamed before its hash is known, so validators are
+        only sent on later (cached) hits.  Compressed variants are built
+        once here, at fill time
+
+    Args:
+        cache_key (str): see `response_cache_key`
+        chunks (:obj:`iterator`): encoded body chunks (str or bytes)
+        content_type (str): `Content-Type` header
+        expires (float): timestamp body goes stale
+        logger (:obj:`logging.logger`, optional): logging handle
+
+    Yields:
+        str/bytes: body chunks
+
+    """
+    body = []
+    for chunk in chunks:
+        body.append(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+        yield chunk
+
+    body = b''.join(body)
+    try:
+        cache_utils.write_response(
+            cache_key,
+            body,
+            content_type,
+            etag=hashlib.sha1(body).hexdigest(),
+            last_modified=datetime.utcnow().timestamp(),
+            expires=expires,
+            variants=format_utils.compress_variants(body),
+            db_path=RESPONSE_CACHE_DB
+        )
+    except Exception:   #pragma: no cover
+        logger.warning('unable to write response cache', exc_info=True)
+
 class OHLC_endpoint(Resource):
     """Handle calls on OHLC endpoint"""
     def __init__(self):
@@ -86,6 +299,36 @@ class OHLC_endpoint(Resource):
             help='API key for tracking requests',
             location=['args', 'headers']
         )
+        self.reqparse.add_argument(
+            'start',
+            type=inputs.date,
+            required=False,
+            help='first date to report (%Y-%m-%d)',
+            location=['args', 'headers']
+        )
+        self.reqparse.add_argument(
+            'end',
+            type=inputs.date,
+            required=False,
+            help='last date to report (%Y-%m-%d)',
+            location=['args', 'headers']
+        )
+        self.reqparse.add_argument(
+            'last_n',
+            type=inputs.positive,
+            required=False,
+            help='report only the last N bars',
+            location=['args', 'headers']
+        )
+        self.reqparse.add_argument(
+            'interval',
+            type=str,
+            required=False,
+            default='1d',
+            choices=crest_utils.OHLC_INTERVALS,
+            help='bar size: {0}'.format('|'.join(crest_utils.OHLC_INTERVALS)),
+            location=['args', 'headers']
+        )
         self.logger = logging.getLogger('publicAPI')
     def get(self, return_type):
         """GET data from CREST and send out OHLC info"""
@@ -95,6 +338,13 @@ class OHLC_endpoint(Resource):
 
         if return_type not in return_supported_types():
             return 'INVALID RETURN FORMAT', 405
+
+        ## Serve pre-rendered response (ids were validated when it was built) ##
+        cache_key = response_cache_key('ohlc', args, return_type, *ohlc_variant(args))
+        message = cached_response(cache_key, self.logger)
+        if message is not None:
+            return message
+
         ## Validate inputs ##
         try:
             crest_utils.validate_id(
@@ -126,23 +376,36 @@ class OHLC_endpoint(Resource):
 
         ## Fetch CREST ##
         try:
-            #LOGGER.info(api_config.SPLIT_INFO)
-            if args.get('typeID') in api_config.SPLIT_INFO:
-                self.logger.info('FORK: using split utility')
-                data = split_utils.fetch_split_history(
-                    args.get('regionID'),
-                    args.get('typeID'),
-                    config=api_config.CONFIG,
-                    logger=self.logger,
-                )
+            interval = args.get('interval') or '1d'
+            bars_key = ('ohlc', args.get('regionID'), args.get('typeID'), interval)
+            data = crest_utils.HISTORY_CACHE.get(bars_key)
+            if data is None:
+                #LOGGER.info(api_config.SPLIT_INFO)
+                if args.get('typeID') in api_config.SPLIT_INFO:
+                    self.logger.info('FORK: using split utility')
+                    data = split_utils.fetch_split_history(
+                        args.get('regionID'),
+                        args.get('typeID'),
+                        config=api_config.CONFIG,
+                        logger=self.logger,
+                    )
+                else:
+                    data = crest_utils.fetch_market_history(
+                        args.get('regionID'),
+                        args.get('typeID'),
+                        config=api_config.CONFIG,
+                        logger=LOGGER
+                    )
+                data = crest_utils.resample_ohlc(data, interval)
+                crest_utils.HISTORY_CACHE.put(bars_key, data, response_expiry('ohlc'))
             else:
-                data = crest_utils.fetch_market_history(
-                    args.get('regionID'),
-                    args.get('typeID'),
-                    config=api_config.CONFIG,
-                    logger=LOGGER
-                )
-            data = crest_utils.data_to_ohlc(data)
+                self.logger.info('--found %s bars cache', interval)
+            data = crest_utils.slice_history(
+                data,
+                start=args.get('start'),
+                end=args.get('end'),
+                last_n=args.get('last_n'),
+            )
         except exceptions.ValidatorException as err: #pragma: no cover
             self.logger.error(
                 'ERROR: unable to parse CREST data\n\targs=%s',
@@ -161,27 +424,50 @@ class OHLC_endpoint(Resource):
         ## Format output ##
         if return_type == AcceptedDataFormat.JSON.value:
             self.logger.info('rolling json response')
-            data_str = data.to_json(
-                path_or_buf=None,
-                orient='records'
+            message = output_json(
+                cache_stream(
+                    cache_key,
+                    format_utils.iter_json(
+                        data,
+                        settings=json_settings(),
+                        date_format=OHLC_DATE_FORMAT,
+                    ),
+                    'application/json',
+                    response_expiry('ohlc'),
+                    self.logger
+                ),
+                200
             )
-            message = json.loads(data_str)
         elif return_type == AcceptedDataFormat.CSV.value:
             self.logger.info('rolling csv response')
-            data_str = data.to_csv(
-                path_or_buf=None,
-                header=True,
-                index=False,
-                columns=[
-                    'date',
-                    'open',
-                    'high',
-                    'low',
-                    'close',
-                    'volume'
-                ]
+            data_str = format_utils.iter_csv(
+                data,
+                columns=OHLC_COLUMNS
+            )
+            message = output_csv(
+                cache_stream(
+                    cache_key,
+                    data_str,
+                    'text/csv',
+                    response_expiry('ohlc'),
+                    self.logger
+                ),
+                200
+            )
+        elif return_type in BINARY_FORMATS:
+            self.logger.info('rolling %s response', return_type)
+            content_type, encoder = BINARY_FORMATS[return_type]
+            message = output_binary(
+                cache_stream(
+                    cache_key,
+                    [encoder(data, columns=OHLC_COLUMNS)],
+                    content_type,
+                    response_expiry('ohlc'),
+                    self.logger
+                ),
+                200,
+                content_type
             )
-            message = output_csv(data_str, 200)
         else:   #pragma: no cover
             #TODO: CUT?
             self.logger.error(
@@ -235,6 +521,29 @@ class ProphetEndpoint(Resource):
                 format(api_config.DEFAULT_RANGE, api_config.MAX_RANGE),
             location=['args', 'headers']
         )
+        self.reqparse.add_argument(
+            'wait',
+            type=float,
+            required=False,
+            help='seconds to wait on a new forecast before `202 Accepted`',
+            location=['args', 'headers']
+        )
+        self.reqparse.add_argument(
+            'model',
+            type=str,
+            required=False,
+            choices=forecast_utils.FORECAST_MODELS,
+            help='forecast backend: {0}'.format('|'.join(forecast_utils.FORECAST_MODELS)),
+            location=['args', 'headers']
+        )
+        self.reqparse.add_argument(
+            'precision',
+            type=str,
+            required=False,
+            choices=forecast_utils.PRECISION_MODES,
+            help='prophet band precision: {0}'.format('|'.join(forecast_utils.PRECISION_MODES)),
+            location=['args', 'headers']
+        )
         self.logger = logging.getLogger('publicAPI')
     def get(self, return_type):
         args = self.reqparse.parse_args()
@@ -246,6 +555,9 @@ class ProphetEndpoint(Resource):
         forecast_range = api_config.DEFAULT_RANGE
         if 'range' in args:
             forecast_range = args.get('range')
+        model = args.get('model') or api_config.DEFAULT_MODEL
+        precision = args.get('precision') or api_config.PRECISION
+        model_key = forecast_utils.cache_model_key(model, precision)
         ## Validate inputs ##
         try:
             api_utils.check_key(
@@ -285,10 +597,25 @@ class ProphetEndpoint(Resource):
             )
             return 'UNHANDLED EXCEPTION', 500
 
+        ## Count demand for nightly precompute (batched, see `AccessCounter`) ##
+        cache_utils.ACCESS_COUNTS.hit(
+            'prophet',
+            args.get('regionID'),
+            args.get('typeID'),
+            db_path=RESPONSE_CACHE_DB
+        )
+
+        ## Serve pre-rendered response ##
+        cache_key = response_cache_key('prophet', args, return_type, forecast_range, model_key)
+        message = cached_response(cache_key, self.logger)
+        if message is not None:
+            return message
+
         ## check cache ##
         cache_data = forecast_utils.check_prediction_cache(
             args.get('regionID'),
-            args.get('typeID')
+            args.get('typeID'),
+            model=model_key,
         )
         self.logger.debug(cache_data)
         if cache_data is not None:
@@ -298,38 +625,90 @@ class ProphetEndpoint(Resource):
                 forecast_range,
                 return_type,
                 self.logger,
+                cache_key=cache_key,
             )
 
             return message
 
-        ## No cache, get data ##
+        ## No cache, attach to (or start) a forecast job ##
+        job_key = (args.get('regionID'), args.get('typeID'), model_key)
+        job = job_utils.FORECAST_JOBS.find(job_key)
         try:
-            if args.get('typeID') in api_config.SPLIT_INFO:
-                LOGGER.info('FORK: using split utility')
-                data = split_utils.fetch_split_history(
-                    args.get('regionID'),
-                    args.get('typeID'),
-                    data_range=api_config.MAX_RANGE,
-                    config=api_config.CONFIG,
-                    logger=self.logger,
-                )
-                data.sort_values(
-                    by='date',
-                    ascending=True,
-                    inplace=True
-                )
-            else:
-                data = forecast_utils.fetch_extended_history(
-                    args.get('regionID'),
-                    args.get('typeID'),
-                    data_range=api_config.MAX_RANGE,
-                    config=api_config.CONFIG,
-                    logger=self.logger,
-                )
-            data = forecast_utils.build_forecast(
-                data,
-                api_config.MAX_RANGE
-            )
+            if job is None:
+                if args.get('typeID') in api_config.SPLIT_INFO:
+                    LOGGER.info('FORK: using split utility')
+                    data = split_utils.fetch_split_history(
+                        args.get('regionID'),
+                        args.get('typeID'),
+                        data_range=api_config.MAX_RANGE,
+                        config=api_config.CONFIG,
+                        logger=self.logger,
+                    )
+                else:
+                    data = forecast_utils.fetch_extended_history(
+                        args.get('regionID'),
+                        args.get('typeID'),
+                        data_range=api_config.MAX_RANGE,
+                        config=api_config.CONFIG,
+                        logger=self.logger,
+                    )
+                if model == 'prophet':
+                    warm_start = None
+                    if api_config.WARM_START:
+                        warm_start = forecast_utils.load_warm_start(
+                            args.get('regionID'),
+                            args.get('typeID'),
+                            data,
+                        )
+                    job = job_utils.FORECAST_JOBS.submit(
+                        job_key,
+                        forecast_utils.fit_forecast,
+                        data,
+                        api_config.MAX_RANGE,
+                        0,
+                        warm_start,
+                        model,
+                        forecast_utils.precision_samples(precision),
+                        args.get('regionID'),
+                        args.get('typeID'),
+                        callback=partial(
+                            forecast_utils.write_forecast_cache,
+                            args.get('regionID'),
+                            args.get('typeID'),
+                            model=model_key,
+                            logger=self.logger,
+                        ),
+                        logger=self.logger,
+                    )
+                else:
+                    ## lightweight backends take milliseconds: skip the pool ##
+                    result = forecast_utils.fit_forecast(
+                        data, api_config.MAX_RANGE, model=model
+                    )
+                    forecast_utils.write_forecast_cache(
+                        args.get('regionID'),
+                        args.get('typeID'),
+                        result,
+                        model=model_key,
+                        logger=self.logger,
+                    )
+                    data = result[0]
+            if job is not None:
+                result = job_utils.FORECAST_JOBS.wait(job, args.get('wait'))
+                if result is None:
+                    ## finished in another worker, which cached the forecast ##
+                    data = forecast_utils.check_prediction_cache(
+                        args.get('regionID'),
+                        args.get('typeID'),
+                        model=model_key,
+                    )
+                    if data is None:
+                        raise exceptions.JobFailed(job.job_id, 'forecast missing from cache')
+                else:
+                    data, _ = result
+        except exceptions.JobPending:
+            self.logger.info('forecast job %s still running', job.job_id)
+            return job_accepted(job)
         except exceptions.ValidatorException as err:
             #FIX ME: testing?
             self.logger.warning(
@@ -346,19 +725,13 @@ class ProphetEndpoint(Resource):
             )
             return 'UNHANDLED EXCEPTION', 500
 
-        ## Update cache ##
-        forecast_utils.write_prediction_cache(
-            args.get('regionID'),
-            args.get('typeID'),
-            data,
-            logger=self.logger,
-        )
         try:
             message = forecast_reporter(
                 data,
                 forecast_range,
                 return_type,
                 self.logger,
+                cache_key=cache_key,
             )
         except Exception as err_msg:    #pragma: no cover
             LOGGER.error(
@@ -371,11 +744,38 @@ class ProphetEndpoint(Resource):
             return 'UNABLE TO GENERATE REPORT', 500
         return message
 
+def job_accepted(job):
+    """`202 Accepted` pointing at a running job's status resource
+
+    Args:
+        job (:obj:`job_utils.Job`): running job
+
+    Returns:
+        Flask-ready return object
+
+    """
+    location = API.url_for(ForecastJobEndpoint, job_id=job.job_id)
+    report = job.to_dict()
+    report['location'] = location
+    return report, 202, {'Location': location, 'Retry-After': '5'}
+
+class ForecastJobEndpoint(Resource):
+    """Report on queued/running forecast jobs"""
+    def __init__(self):
+        self.logger = logging.getLogger('publicAPI')
+    def get(self, job_id):
+        """GET job status; re-request the forecast once `done`"""
+        job = job_utils.FORECAST_JOBS.get(job_id)
+        if job is None:
+            return 'JOB NOT FOUND', 404
+        return job.to_dict(), 200
+
 def forecast_reporter(
         data,
         forecast_range,
         return_type,
-        logger=logging.getLogger('publicAPI')
+        logger=logging.getLogger('publicAPI'),
+        cache_key=None,
 ):
     """prepares forecast response for Flask
 
@@ -384,6 +784,7 @@ def forecast_reporter(
         forecast_range (int): range requested for return
         return_type (:enum:`AcceptedDataFormat`): format of return
         logger (:obj:`logging.logger`, optional): logging handle
+        cache_key (str, optional): store rendered body in response cache
 
     Returns:
         Flask-ready return object
@@ -396,27 +797,32 @@ def forecast_reporter(
     print(report_data)
     if return_type == AcceptedDataFormat.JSON.value:
         logger.info('rolling json response')
-        data_str = report_data.to_json(
-            path_or_buf=None,
-            orient='records'
-        )
-        message = json.loads(data_str)
+        chunks = format_utils.iter_json(report_data, settings=json_settings())
+        if cache_key:
+            chunks = cache_stream(
+                cache_key, chunks, 'application/json', response_expiry('prophet'), logger
+            )
+        message = output_json(chunks, 200)
     elif return_type == AcceptedDataFormat.CSV.value:
         logger.info('rolling csv response')
-        data_str = report_data.to_csv(
-            path_or_buf=None,
-            header=True,
-            index=False,
-            columns=[
-                'date',
-                'avgPrice',
-                'yhat',
-                'yhat_low',
-                'yhat_high',
-                'prediction'
-            ]
+        data_str = format_utils.iter_csv(
+            report_data,
+            columns=PROPHET_COLUMNS
         )
+        if cache_key:
+            data_str = cache_stream(
+                cache_key, data_str, 'text/csv', response_expiry('prophet'), logger
+            )
         message = output_csv(data_str, 200)
+    elif return_type in BINARY_FORMATS:
+        logger.info('rolling %s response', return_type)
+        content_type, encoder = BINARY_FORMATS[return_type]
+        chunks = [encoder(report_data, columns=PROPHET_COLUMNS)]
+        if cache_key:
+            chunks = cache_stream(
+                cache_key, chunks, content_type, response_expiry('prophet'), logger
+            )
+        message = output_binary(chunks, 200, content_type)
     else:   #pragma: no cover
         raise exceptions.UnsupportedFormat(
             status=500,
@@ -435,3 +841,8 @@ API.add_resource(
     ProphetEndpoint,
     '/CREST/prophet.<return_type>'
 )
+
+API.add_resource(
+    ForecastJobEndpoint,
+    '/CREST/prophet/jobs/<job_id>'
+)
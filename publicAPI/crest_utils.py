@@ -1,21 +1,26 @@
 """crest_utils.py collection of tools for handling crest endpoint APIs"""
 
-from os import path, makedirs
-from datetime import datetime
+from os import path, makedirs, getpid
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 import configparser
 import logging
+import queue
+import threading
 import warnings
 
 import ujson as json
-from retrying import retry
 import requests
-from tinydb import TinyDB, Query
+import numpy as np
 import pandas as pd
 from pandas.io.json import json_normalize
 
 requests.models.json = json
 
+import publicAPI.cache_utils as cache_utils
 import publicAPI.exceptions as exceptions
+import publicAPI.http_utils as http_utils
 import publicAPI.config as api_config
 import prosper.common.prosper_logging as p_logging
 
@@ -25,59 +30,169 @@ HERE = path.abspath(path.dirname(__file__))
 CACHE_PATH = path.join(HERE, 'cache')
 makedirs(CACHE_PATH, exist_ok=True)
 
-def setup_cache_file(
-        cache_filename#,
-        #cache_path=CACHE_PATH,
-):
-    """build tinyDB handle to cache file
+class ValidationIndex(object):
+    """process-level index of validated ids, backed by the sqlite cache
 
-    Args:
-        cache_filename (str): path to desired cache file
-        cache_path (str, optional): path to cache folder
-
-    Returns:
-        TinyDB.TinyDB: cache db
+    Only each endpoint's id:cache_datetime map is read into memory, so
+    lookups are checked against `sde_cache_limit` without touching disk and
+    the payload is read from the cache db for the one id being validated.
+    New entries are queued for a background thread to write through; their
+    payloads are held in memory until written.
 
     """
-    if not path.isdir(CACHE_PATH):
-        makedirs(CACHE_PATH)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = {}    # {endpoint_name: {index_key: cache_datetime}}
+        self._pending = {}  # {(endpoint_name, index_key): payload} not yet on disk
+        self._write_queue = queue.Queue()
+        self._writer = None
+        self._writer_pid = None
+
+    def load(self, endpoint_name):
+        """read an endpoint's cached id timestamps into memory (once)
+
+        Args:
+            endpoint_name (str): name of endpoint
+
+        Returns:
+            dict: index_key:cache_datetime
+
+        """
+        with self._lock:
+            if endpoint_name not in self._index:
+                self._index[endpoint_name] = cache_utils.read_id_index(
+                    endpoint_name,
+                    db_path=path.join(CACHE_PATH, cache_utils.CACHE_DB)
+                )
+
+            return self._index[endpoint_name]
+
+    def get(
+            self,
+            endpoint_name,
+            index_key,
+            cache_limit
+    ):
+        """look up a validated id
 
-    db_filename = path.join(CACHE_PATH, cache_filename + '.json')
-    return TinyDB(db_filename)
+        Args:
+            endpoint_name (str): name of endpoint
+            index_key (int): id to look up
+            cache_limit (int): max age of cache entry (seconds)
 
-def write_cache_entry(
-        tinydb_handle,
-        index_key,
-        data_payload
-):
-    """write data to tinydb
+        Returns:
+            dict: cached payload, None if missing or expired
+
+        """
+        cache_datetime = self.load(endpoint_name).get(index_key)
+        if cache_datetime is None:
+            return None
+
+        if cache_datetime < datetime.utcnow().timestamp() - cache_limit:
+            return None
+
+        with self._lock:
+            payload = self._pending.get((endpoint_name, index_key))
+        if payload is not None:
+            return payload
+
+        return cache_utils.read_id_payload(
+            endpoint_name,
+            index_key,
+            db_path=path.join(CACHE_PATH, cache_utils.CACHE_DB)
+        )
+
+    def put(
+            self,
+            endpoint_name,
+            index_key,
+            payload
+    ):
+        """add a validated id to memory and queue it for the cache db
+
+        Args:
+            endpoint_name (str): name of endpoint
+            index_key (int): id to store
+            payload (:obj:`dict`): data to store
+
+        Returns:
+            None
+
+        """
+        entries = self.load(endpoint_name)
+        with self._lock:
+            entries[index_key] = datetime.utcnow().timestamp()
+            self._pending[(endpoint_name, index_key)] = payload
+        self._write_queue.put((endpoint_name, index_key, payload))
+        self._start_writer()
+
+    def flush(self):
+        """block until all queued writes are on disk"""
+        self._write_queue.join()
+
+    def clear(self):
+        """drop in-memory index (reload from cache db on next lookup)"""
+        with self._lock:
+            self._index = {}
+
+    def _start_writer(self):
+        """start background writer (restart in forked children)"""
+        with self._lock:
+            if self._writer and self._writer.is_alive() and self._writer_pid == getpid():
+                return
+            self._writer = threading.Thread(
+                target=self._write_loop,
+                name='ValidationIndexWriter',
+                daemon=True
+            )
+            self._writer_pid = getpid()
+            self._writer.start()
+
+    def _write_loop(self):
+        """drain write queue into cache db"""
+        while True:
+            endpoint_name, index_key, payload = self._write_queue.get()
+            try:
+                cache_utils.write_id_cache(
+                    endpoint_name,
+                    [(index_key, payload)],
+                    db_path=path.join(CACHE_PATH, cache_utils.CACHE_DB)
+                )
+            except Exception:  # pragma: no cover
+                LOGGER.error(
+                    'ERROR: unable to write to cache' +
+                    '\n\tendpoint_name: {0}'.format(endpoint_name) +
+                    '\n\tindex_key: {0}'.format(index_key),
+                    exc_info=True
+                )
+            finally:
+                with self._lock:
+                    if self._pending.get((endpoint_name, index_key)) is payload:
+                        del self._pending[(endpoint_name, index_key)]
+                self._write_queue.task_done()
+
+VALIDATION_INDEX = ValidationIndex()
+INVALID_PREFIX = 'invalid_'
+
+def is_invalid_id_error(err_msg):
+    """check if a fetch failure means the id itself is bad
+
+    Notes:
+        only 4xx responses are definitive, timeouts/5xx/rate limits may recover
 
     Args:
-        tinydb_handle (:obj:`tinydb.TinyDB`): database to write to
-        index_key (any, int): index key value
-        data_payload (:obj:`dict`): object to save to cache
+        err_msg (:obj:`Exception`): exception raised by fetch
 
     Returns:
-        None
+        bool: remember id as invalid
 
     """
-    if tinydb_handle.search(Query().index_key == index_key):
-        tinydb_handle.update(
-            {
-                'cache_datetime': datetime.utcnow().timestamp(),
-                'payload': data_payload
-            },
-            Query().index_key == index_key
-        )
-    else:
-        tinydb_handle.insert(
-            {
-                'cache_datetime': datetime.utcnow().timestamp(),
-                'payload': data_payload,
-                'index_key': index_key
+    response = getattr(err_msg, 'response', None)
+    if not isinstance(err_msg, requests.exceptions.HTTPError) or response is None:
+        return False
 
-            }
-        )
+    return 400 <= response.status_code < 500 \
+        and response.status_code not in http_utils.RETRY_STATUS
 
 def endpoint_to_kwarg(
         endpoint_name,
@@ -106,6 +221,7 @@ def endpoint_to_kwarg(
 
     return kwarg_pair
 
+@http_utils.coalesce('endpoint_name', 'type_id', 'cache_buster')
 def validate_id(
         endpoint_name,
         type_id,
@@ -127,32 +243,47 @@ def validate_id(
 
     """
     ## Check local cache for value ##
-    try:
-        db_handle = setup_cache_file(endpoint_name)
-    except Exception as err_msg:  # pragma: no cover
-        logger.error(
-            'ERROR: unable to connect to local tinyDB cache' +
-            '\n\tendpoint_name: {0}'.format(endpoint_name) +
-            '\n\tcache_path: {0}'.format(CACHE_PATH),
-            exc_info=True
-        )
-
     if not cache_buster:
         logger.info('--searching cache for id: %s', type_id)
         logger.debug('endpoint_name=%s', endpoint_name)
         logger.debug('type_id=%s', type_id)
 
-        cache_time = datetime.utcnow().timestamp() - int(config.get('CACHING', 'sde_cache_limit'))
-        cache_val = db_handle.search(
-            (Query().cache_datetime >= cache_time) &
-            (Query().index_key == type_id)
-        )
-
+        cache_val = None
+        invalid_val = None
+        try:
+            cache_val = VALIDATION_INDEX.get(
+                endpoint_name,
+                type_id,
+                int(config.get('CACHING', 'sde_cache_limit'))
+            )
+            if cache_val is None:
+                invalid_val = VALIDATION_INDEX.get(
+                    INVALID_PREFIX + endpoint_name,
+                    type_id,
+                    int(config.get_option('CACHING', 'invalid_cache_limit', args_default=3600))
+                )
+        except Exception as err_msg:  # pragma: no cover
+            logger.error(
+                'ERROR: unable to connect to local cache' +
+                '\n\tendpoint_name: {0}'.format(endpoint_name) +
+                '\n\tcache_path: {0}'.format(CACHE_PATH),
+                exc_info=True
+            )
 
-        if cache_val:
+        if cache_val is not None:
             logger.info('--found type_id cache for id: {0}'.format(type_id))
             logger.debug(cache_val)
-            return cache_val[0]['payload']    #skip CREST
+            return cache_val    #skip CREST
+
+        if invalid_val is not None:
+            logger.info('--found invalid cache for id: {0}'.format(type_id))
+            raise exceptions.IDValidationError(
+                status=404,
+                message='Unable to validate {0}:{1}'.format(
+                    endpoint_name,
+                    type_id
+                )
+            )
 
     ## Request info from CREST ##
     logger.info('--fetching CREST ID information')
@@ -167,7 +298,8 @@ def validate_id(
         type_info = fetch_esi_endpoint(
             endpoint_name,
             **kwarg_pair,
-            config=config
+            config=config,
+            cache_buster=cache_buster
         )
     except Exception as err_msg:
         logger.warning(
@@ -176,6 +308,13 @@ def validate_id(
             '\n\ttype_id: {0}'.format(type_id),
             exc_info=True
         )
+        if is_invalid_id_error(err_msg):
+            logger.info('--caching invalid id')
+            VALIDATION_INDEX.put(
+                INVALID_PREFIX + endpoint_name,
+                type_id,
+                {'status_code': err_msg.response.status_code}
+            )
         raise exceptions.IDValidationError(
             status=404,
             message='Unable to validate {0}:{1}'.format(
@@ -186,21 +325,11 @@ def validate_id(
 
     ## Update cache ##
     logger.info('--updating cache')
-    try:
-        write_cache_entry(
-            db_handle,
-            type_id,
-            type_info
-        )
-    except Exception as err_msg:  # pragma: no cover
-        logger.error(
-            'ERROR: unable to write to cache' +
-            '\n\ttype_id: {0}'.format(type_id) +
-            '\n\ttype_info: {0}'.format(type_info),
-            exc_info=True
-        )
-
-    db_handle.close()
+    VALIDATION_INDEX.put(
+        endpoint_name,
+        type_id,
+        type_info
+    )
 
     return type_info
 
@@ -238,18 +367,12 @@ def fetch_crest_endpoint(
         'User-Agent': config.get('GLOBAL', 'useragent')
     }
 
-    @retry(wait_fixed=2000, stop_max_delay=10000)
-    def fetch_crest_endpoint_get():
-        # no try-except, catch in caller
-        # done to make logging path easier
-        req = requests.get(
-            crest_url,
-            headers=headers
-        )
-        req.raise_for_status()
-        return req
-
-    req = fetch_crest_endpoint_get()
+    # no try-except, catch in caller
+    # done to make logging path easier
+    req = http_utils.RETRY_POLICY.get(
+        crest_url,
+        headers=headers
+    )
     req.raise_for_status()
     data = req.json()
 
@@ -260,17 +383,21 @@ def fetch_esi_endpoint(
         endpoint_name,
         esi_base=ESI_BASE,
         config=api_config.CONFIG,
+        cache_buster=False,
         **kwargs
 ):
     """Fetch payload from EVE Online's ESI service
 
     Notes:
         Only works on unauth'd endpoints
+        Responses are reused until `Expires`, then revalidated with
+        `If-None-Match`/`If-Modified-Since` (304 reuses stored body)
 
     Args:
         endpoint_name (str): name of endpoint (in config)
         esi_base (str): URI for ESI
         config (`configparser.ConfigParser`): override for config obj
+        cache_buster (bool, optional): ignore `Expires`, always ask ESI
         **kwargs (dict): key/values to overwrite in query
 
     Returns:
@@ -288,45 +415,239 @@ def fetch_esi_endpoint(
     except KeyError as err_msg:
         raise exceptions.CrestAddressError(repr(err_msg))
 
+    db_path = path.join(CACHE_PATH, cache_utils.CACHE_DB)
+    cached = cache_utils.read_http_cache(esi_url, db_path=db_path)
+    if cached and not cache_buster and cached['expires'] > datetime.utcnow().timestamp():
+        LOGGER.debug('--reusing ESI response until Expires: %s', esi_url)
+        return json.loads(cached['body'])
+
     headers = {
         'User-Agent': config.get('GLOBAL', 'useragent')
     }
+    if cached and cached['etag']:
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached['last_modified']:
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    # no try-except, catch in caller
+    # done to make logging path easier
+    req = http_utils.RETRY_POLICY.get(
+        esi_url,
+        headers=headers
+    )
+    req.raise_for_status()
 
-    @retry(wait_fixed=2000, stop_max_delay=10000)
-    def fetch_esi_endpoint_get():
-        # no try-except, catch in caller
-        # done to make logging path easier
-        req = requests.get(
-            esi_url,
-            headers=headers
-        )
-        req.raise_for_status()
-        return req
+    expires = http_utils.parse_expires(req.headers)
+    if req.status_code == 304 and cached:
+        LOGGER.debug('--ESI response not modified: %s', esi_url)
+        cache_utils.touch_http_cache(esi_url, expires, db_path=db_path)
+        return json.loads(cached['body'])
 
-    req = fetch_esi_endpoint_get()
-    req.raise_for_status()
     data = req.json()
+    cache_utils.write_http_cache(
+        esi_url,
+        req.text,
+        expires,
+        etag=req.headers.get('ETag'),
+        last_modified=req.headers.get('Last-Modified'),
+        db_path=db_path
+    )
 
     return data
 
+def next_esi_refresh(
+        refresh_time='11:05',
+        now=None
+):
+    """find when ESI next rolls over daily market history
+
+    Args:
+        refresh_time (str, optional): %H:%M UTC of daily refresh (after downtime)
+        now (:obj:`datetime.datetime`, optional): utc override for testing
+
+    Returns:
+        float: timestamp of next refresh
+
+    """
+    if now is None:
+        now = datetime.utcnow()
+    refresh = datetime.strptime(refresh_time, '%H:%M')
+    next_refresh = now.replace(
+        hour=refresh.hour,
+        minute=refresh.minute,
+        second=0,
+        microsecond=0
+    )
+    if next_refresh <= now:
+        next_refresh += timedelta(days=1)
+
+    return next_refresh.timestamp()
+
+class HistoryCache(object):
+    """process-level read-through cache of parsed market history frames
+
+    Notes:
+        hands out copies: callers are free to mutate what they get.
+        Holds at most `max_entries` frames, least recently used go first
+
+    Args:
+        max_entries (int, optional): frames to keep
+
+    """
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()    # {key: (expires, pandas.DataFrame)}
+
+    def configure(self, config):
+        """load settings from [CACHING] section
+
+        Args:
+            config (:obj:`prosper.common.ProsperConfig`): configuration object
+
+        """
+        self.max_entries = int(config.get_option(
+            'CACHING', 'history_cache_size', args_default=self.max_entries))
+
+    def get(self, key):
+        """fetch cached frame
+
+        Args:
+            key (tuple): cache key
+
+        Returns:
+            pandas.DataFrame: copy of cached frame, None if missing/expired
+
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires <= datetime.utcnow().timestamp():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+
+        return data.copy()
+
+    def put(self, key, data, expires):
+        """cache frame until `expires`
+
+        Args:
+            key (tuple): cache key
+            data (:obj:`pandas.DataFrame`): frame to store
+            expires (float): timestamp entry goes stale
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._cache[key] = (expires, data)
+            self._cache.move_to_end(key)
+            while len(self._cache) > max(self.max_entries, 0):
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        """drop all cached frames"""
+        with self._lock:
+            self._cache = OrderedDict()
+
+HISTORY_CACHE = HistoryCache()
+
+HISTORY_COLUMNS = ['date', 'avgPrice', 'highPrice', 'lowPrice', 'volume', 'orders']
+HISTORY_DTYPES = {
+    'avgPrice': np.float64,
+    'highPrice': np.float64,
+    'lowPrice': np.float64,
+    'volume': np.int64,
+    'orders': np.int64,
+}
+def normalize_history(
+        data,
+        logger=logging.getLogger('publicAPI'),
+):
+    """recast a market history frame into the canonical schema
+
+    Notes:
+        `date` is parsed once to datetime64 (midnight UTC), prices float64,
+        volume/orders int64.  Rows are de-duplicated on date and sorted
+        oldest-first.  Extra columns (EMD's typeID/regionID) ride along
+
+    Args:
+        data (:obj:`pandas.DataFrame`): raw history (ESI/EMD/split cache)
+        logger (:obj:`logging.logger`): logging handle
+
+    Returns:
+        pandas.DataFrame: history in `HISTORY_COLUMNS` order + extras
+
+    Raises:
+        exceptions.CRESTParseError: missing columns or unreadable values
+
+    """
+    if data.empty:
+        data = data.reindex(columns=list(dict.fromkeys(HISTORY_COLUMNS + list(data.columns))))
+    missing_columns = [column for column in HISTORY_COLUMNS if column not in data.columns]
+    if missing_columns:
+        logger.error('ERROR: history missing columns %s', missing_columns)
+        raise exceptions.CRESTParseError(
+            status=500,
+            message='Market history missing {0}'.format(','.join(missing_columns))
+        )
+
+    columns = HISTORY_COLUMNS + [
+        column for column in data.columns if column not in HISTORY_COLUMNS
+    ]
+    data = data[columns].copy()
+    try:
+        if not np.issubdtype(data['date'].dtype, np.datetime64):
+            data['date'] = pd.to_datetime(data['date'])
+        data['date'] = data['date'].dt.normalize()
+        data = data.loc[data['date'].notnull()]
+        data = data.astype(HISTORY_DTYPES)
+    except (ValueError, TypeError):
+        logger.error('ERROR: unable to recast history', exc_info=True)
+        raise exceptions.CRESTParseError(
+            status=500,
+            message='Unable to parse market history'
+        )
+
+    data = data.drop_duplicates(subset='date', keep='last')
+    data = data.sort_values(by='date', kind='mergesort')
+    return data.reset_index(drop=True)
+
+@http_utils.coalesce('region_id', 'type_id', 'cache_buster')
 def fetch_market_history(
         region_id,
         type_id,
         config=api_config.CONFIG,
-        logger=logging.getLogger('publicAPI')
+        logger=logging.getLogger('publicAPI'),
+        cache_buster=False,
 ):
     """Get market history data from EVE Online ESI endpoint
 
+    Notes:
+        parsed frames are kept in `HISTORY_CACHE` until the next ESI refresh
+
     Args:
         region_id (int): (validated) regionID value for ESI lookup
         type_id (int): (validated) typeID value for CREST lookup
         config (:obj:`prosper.common.ProsperConfig`): configuration object
         logger (:obj:`logging.logger`): logging handle
+        cache_buster (bool, optional): skip cache, fetch from internet
 
     Returns:
-        pandas.DataFrame: pandas collection of data
+        pandas.DataFrame: pandas collection of data (see `normalize_history`)
             ['date', 'avgPrice', 'highPrice', 'lowPrice', 'volume', 'orders']
     """
+    cache_key = ('market_history', int(region_id), int(type_id))
+    if not cache_buster:
+        cache_data = HISTORY_CACHE.get(cache_key)
+        if cache_data is not None:
+            logger.info('--found market history cache')
+            return cache_data
+
     logger.info('--fetching market data from ESI')
     logger.debug('region_id: %s', region_id)
     logger.debug('type_id: %s', type_id)
@@ -335,7 +656,8 @@ def fetch_market_history(
             'market_history',
             region_id=region_id,
             type_id=type_id,
-            config=config
+            config=config,
+            cache_buster=cache_buster
         )
         logger.debug(raw_data[:5])
     except Exception as err_msg:    #pragma: no cover
@@ -379,8 +701,75 @@ def fetch_market_history(
         },
         inplace=True
     )
+    return_data = normalize_history(return_data, logger=logger)
+
+    HISTORY_CACHE.put(
+        cache_key,
+        return_data,
+        next_esi_refresh(config.get_option('CACHING', 'esi_refresh_utc', args_default='11:05'))
+    )
+    return return_data.copy()
+
+def fetch_market_history_many(
+        pairs,
+        config=api_config.CONFIG,
+        logger=logging.getLogger('publicAPI'),
+        max_concurrency=None,
+        rate_limiter=http_utils.RATE_LIMITER,
+        cache_buster=False,
+):
+    """Get market history for many (region_id, type_id) pairs at once
+
+    Notes:
+        fetches run on a bounded thread pool, every upstream call takes a
+        token from `rate_limiter` first.  Cached/coalesced pairs skip ESI
+
+    Args:
+        pairs (:obj:`list`): (region_id, type_id) pairs to fetch
+        config (:obj:`prosper.common.ProsperConfig`): configuration object
+        logger (:obj:`logging.logger`): logging handle
+        max_concurrency (int, optional): worker threads ([HTTP] max_concurrency)
+        rate_limiter (:obj:`http_utils.RateLimiter`): shared request limiter
+        cache_buster (bool, optional): skip cache, fetch from internet
+
+    Returns:
+        (:obj:`dict`, :obj:`dict`): {pair: pandas.DataFrame}, {pair: Exception}
+
+    """
+    pairs = list(dict.fromkeys((int(region), int(type_id)) for region, type_id in pairs))
+    if max_concurrency is None:
+        max_concurrency = int(config.get_option(
+            'HTTP', 'max_concurrency', args_default=8))
+    max_concurrency = max(1, min(max_concurrency, len(pairs) or 1))
+
+    def fetch_pair(pair):
+        """rate-limited fetch for one pair"""
+        region_id, type_id = pair
+        if cache_buster or HISTORY_CACHE.get(
+                ('market_history', region_id, type_id)
+        ) is None:
+            rate_limiter.acquire()
+        return fetch_market_history(
+            region_id,
+            type_id,
+            config=config,
+            logger=logger,
+            cache_buster=cache_buster
+        )
 
-    return return_data
+    logger.info('--fetching %d pairs (%d workers)', len(pairs), max_concurrency)
+    results = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {pair: executor.submit(fetch_pair, pair) for pair in pairs}
+        for pair, future in futures.items():
+            try:
+                results[pair] = future.result()
+            except Exception as err_msg:
+                logger.warning('--unable to fetch %s: %r', pair, err_msg)
+                errors[pair] = err_msg
+
+    return results, errors
 
 def data_to_ohlc(
         data
@@ -405,3 +794,102 @@ def data_to_ohlc(
     })
 
     return ohlc
+
+OHLC_INTERVALS = ['1d', '1w', '1M']
+def period_starts(
+        dates,
+        interval,
+):
+    """label each date with the start of its bar
+
+    Args:
+        dates (:obj:`numpy.ndarray`): datetime64 dates
+        interval (str): `OHLC_INTERVALS` (1w bars start Monday, 1M on the 1st)
+
+    Returns:
+        numpy.ndarray: datetime64[ns] bar start per date
+
+    """
+    if interval == '1w':
+        days = dates.astype('datetime64[D]')
+        ## numpy weeks are Thursday-anchored: roll back to Monday by weekday ##
+        weekday = (days.astype(np.int64) + 3) % 7
+        return (days - weekday.astype('timedelta64[D]')).astype('datetime64[ns]')
+    if interval == '1M':
+        return dates.astype('datetime64[M]').astype('datetime64[ns]')
+    return dates.astype('datetime64[D]').astype('datetime64[ns]')
+
+def resample_ohlc(
+        data,
+        interval='1d',
+):
+    """aggregate daily history into OHLC bars
+
+    Notes:
+        `1d` keeps the legacy `data_to_ohlc` relabeling.  Longer bars are
+        reduced per period: open=first avgPrice, high=max highPrice,
+        low=min lowPrice, close=last avgPrice, volume=sum.  Expects sorted
+        dates (see `normalize_history`); bars are labeled by period start
+
+    Args:
+        data (:obj:`pandas.DataFrame`): history to aggregate
+        interval (str, optional): `OHLC_INTERVALS`
+
+    Returns:
+        pandas.DataFrame: OHLC format
+            ['date', 'open', 'high', 'low', 'close', 'volume']
+
+    """
+    if interval not in OHLC_INTERVALS:
+        raise exceptions.UnsupportedFormat(
+            status=400,
+            message='Unsupported interval {0}'.format(interval)
+        )
+    if interval == '1d':
+        return data_to_ohlc(data)
+
+    labels = period_starts(data['date'].values, interval)
+    if not len(labels):
+        return data_to_ohlc(data).iloc[0:0]
+
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    ends = np.r_[starts[1:], len(labels)] - 1
+    avg_price = data['avgPrice'].values
+    return pd.DataFrame({
+        'date'  : labels[starts],
+        'open'  : avg_price[starts],
+        'high'  : np.fmax.reduceat(data['highPrice'].values, starts),
+        'low'   : np.fmin.reduceat(data['lowPrice'].values, starts),
+        'close' : avg_price[ends],
+        'volume': np.add.reduceat(data['volume'].values, starts),
+    })
+
+def slice_history(
+        data,
+        start=None,
+        end=None,
+        last_n=None,
+):
+    """cut a date-sorted frame down to a requested window
+
+    Notes:
+        binary search on `date` (see `normalize_history`): cost scales with
+        the window, not the full history
+
+    Args:
+        data (:obj:`pandas.DataFrame`): frame with sorted datetime64 `date`
+        start (:obj:`datetime.datetime`, optional): first date to keep (inclusive)
+        end (:obj:`datetime.datetime`, optional): last date to keep (inclusive)
+        last_n (int, optional): keep only the newest `last_n` rows of the window
+
+    Returns:
+        pandas.DataFrame: view of rows in window
+
+    """
+    dates = data['date'].values
+    first = 0 if start is None else dates.searchsorted(np.datetime64(start), side='left')
+    last = len(dates) if end is None else dates.searchsorted(np.datetime64(end), side='right')
+    if last_n is not None:
+        first = max(first, last - last_n)
+
+    return data.iloc[first:max(first, last)]
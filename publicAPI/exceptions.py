@@ -46,6 +46,9 @@ class CrestAddressError(CrestException):
 class UnsupportedSource(CrestException):
     """only support CREST/ESI for data sources"""
     pass
+class CircuitOpen(CrestException):
+    """upstream host marked down, failing fast"""
+    pass
 
 ## forecast_utils ##
 class ForecastException(Exception):
@@ -60,6 +63,17 @@ class UnableToFetchData(EMDDataException):
 class NoDataReturned(EMDDataException):
     """missing data in EMD data"""
     pass
+class JobPending(ForecastException):
+    """forecast job still running: poll by job_id"""
+    def __init__(self, job_id=''):
+        self.job_id = job_id
+        ForecastException.__init__(self, job_id)
+class JobFailed(ForecastException):
+    """forecast job run by another worker failed"""
+    def __init__(self, job_id='', error=''):
+        self.job_id = job_id
+        self.error = error
+        ForecastException.__init__(self, job_id, error)
 
 ## split_utils ##
 class SplitException(Exception):
@@ -1,20 +1,27 @@
 """forecast_utils.py: collection of tools for forecasting future performance"""
 from os import path, makedirs
 from datetime import datetime, timedelta
+from operator import itemgetter
 import logging
 
 import ujson as json
+import numpy as np
 import pandas as pd
 from pandas.io.json import json_normalize
-from fbprophet import Prophet
 import requests
-from tinydb import TinyDB, Query
+try:    #pragma: no cover
+    from fbprophet import Prophet
+except ImportError:
+    Prophet = None
 
 requests.models.json = json
 
+import publicAPI.cache_utils as cache_utils
 import publicAPI.crest_utils as crest_utils
 import publicAPI.config as api_config
 import publicAPI.exceptions as exceptions
+import publicAPI.format_utils as format_utils
+import publicAPI.http_utils as http_utils
 import prosper.common.prosper_logging as p_logging
 
 HERE = path.abspath(path.dirname(__file__))
@@ -25,15 +32,21 @@ def check_prediction_cache(
         region_id,
         type_id,
         cache_path=CACHE_PATH,
-        db_filename='prophet.json'
+        db_filename=cache_utils.CACHE_DB,
+        model='prophet',
 ):
-    """check tinyDB for cached predictions
+    """check cache db for cached predictions
+
+    Notes:
+        predictions are stored as typed .npy records (`write_prediction_caches`)
+        and decoded in place.  Older JSON payloads are still read
 
     Args:
         region_id (int): EVE Online region ID
         type_id (int): EVE Online type ID
         cache_path (str): path to caches
-        db_filename (str): name of tinydb
+        db_filename (str): name of cache db
+        model (str, optional): forecast backend
 
     Returns:
         pandas.DataFrame: cached prediction
@@ -41,71 +54,186 @@ def check_prediction_cache(
     """
     utc_today = datetime.utcnow().strftime('%Y-%m-%d')
 
-    prediction_db = TinyDB(path.join(cache_path, db_filename))
-
-    raw_data = prediction_db.search(
-        (Query().cache_date == utc_today) &
-        (Query().region_id == region_id) &
-        (Query().type_id == type_id)
+    raw_data = cache_utils.read_prediction(
+        region_id,
+        type_id,
+        utc_today,
+        model=model,
+        db_path=path.join(cache_path, db_filename)
     )
 
-    prediction_db.close()
-
-    if raw_data:
-        panda_data = pd.read_json(raw_data[0]['prediction'])
-        return panda_data
-    else:
+    if not raw_data:
         return None
+    if isinstance(raw_data, bytes):
+        return format_utils.from_npy_bytes(raw_data)
+    return pd.read_json(raw_data)
 
 def write_prediction_cache(
         region_id,
         type_id,
         prediction_data,
         cache_path=CACHE_PATH,
-        db_filename='prophet.json',
+        db_filename=cache_utils.CACHE_DB,
+        model='prophet',
         logger=logging.getLogger('publicAPI')
 ):
-    """update tinydb latest prediction
+    """update cache db with latest prediction
 
     Args:
         region_id (int): EVE Online region ID
         type_id (int): EVE Online type ID
         prediction_data (:obj:`pandas.DataFrame`): data to write to cache
         cache_path (str, optional): path to caches
-        db_filename (str, optional): name of tinydb
+        db_filename (str, optional): name of cache db
+        model (str, optional): forecast backend
 
     Returns:
         None
 
     """
     logger.info('--caching result')
-    utc_today = datetime.utcnow().strftime('%Y-%m-%d')
+    write_prediction_caches(
+        {(region_id, type_id): prediction_data},
+        cache_path=cache_path,
+        db_filename=db_filename,
+        model=model,
+        logger=logger
+    )
+
+def load_warm_start(
+        region_id,
+        type_id,
+        data,
+        cache_path=CACHE_PATH,
+        db_filename=cache_utils.CACHE_DB
+):
+    """look up a usable warm start for fitting `data`
 
-    prediction_db = TinyDB(path.join(cache_path, db_filename))
+    Args:
+        region_id (int): EVE Online region ID
+        type_id (int): EVE Online type ID
+        data (:obj:`pandas.DataFrame`): history about to be fit
+        cache_path (str, optional): path to caches
+        db_filename (str, optional): name of cache db
+
+    Returns:
+        dict: Stan `init` for `fit_forecast`, None for a cold fit
 
-    ## clear previous cache ##
-    prediction_db.remove(
-        (Query().cache_date <= utc_today) &
-        (Query().region_id == region_id) &
-        (Query().type_id == type_id)
+    """
+    raw_params = cache_utils.read_forecast_params(
+        region_id,
+        type_id,
+        db_path=path.join(cache_path, db_filename)
     )
+    if not raw_params:
+        return None
+    return warm_start_params(json.loads(raw_params), data)
 
-    ## Prepare new entry for cache ##
-    cleaned_data = prediction_data.to_json(
-        date_format='iso',
-        orient='records'
-        )
-    data = {
-        'cache_date': utc_today,
-        'region_id': region_id,
-        'type_id': type_id,
-        'lastWrite': datetime.utcnow().timestamp(),
-        'prediction':cleaned_data
-    }
-    logger.debug(data)
-    prediction_db.insert(data)
+def write_forecast_cache(
+        region_id,
+        type_id,
+        result,
+        cache_path=CACHE_PATH,
+        db_filename=cache_utils.CACHE_DB,
+        model='prophet',
+        logger=logging.getLogger('publicAPI')
+):
+    """store a `fit_forecast` result: prediction + parameters for tomorrow
+
+    Args:
+        region_id (int): EVE Online region ID
+        type_id (int): EVE Online type ID
+        result (tuple): (pandas.DataFrame, dict) from `fit_forecast`
+        cache_path (str, optional): path to caches
+        db_filename (str, optional): name of cache db
+        model (str, optional): forecast backend
+        logger (:obj:`logging.logger`): logging handle
+
+    Returns:
+        None
+
+    """
+    logger.info('--caching result')
+    write_forecast_caches(
+        {(region_id, type_id): result},
+        cache_path=cache_path,
+        db_filename=db_filename,
+        model=model,
+        logger=logger
+    )
+
+def write_forecast_caches(
+        results,
+        cache_path=CACHE_PATH,
+        db_filename=cache_utils.CACHE_DB,
+        model='prophet',
+        logger=logging.getLogger('publicAPI')
+):
+    """store many `fit_forecast` results of one model
+
+    Args:
+        results (:obj:`dict`): {(region_id, type_id): (pandas.DataFrame, dict)}
+        cache_path (str, optional): path to caches
+        db_filename (str, optional): name of cache db
+        model (str, optional): forecast backend
+        logger (:obj:`logging.logger`): logging handle
 
-    prediction_db.close()
+    Returns:
+        int: forecasts written
+
+    """
+    written = write_prediction_caches(
+        {pair: report for pair, (report, _) in results.items()},
+        cache_path=cache_path,
+        db_filename=db_filename,
+        model=model,
+        logger=logger
+    )
+    cache_utils.write_forecast_params(
+        [
+            (region_id, type_id, json.dumps(params))
+            for (region_id, type_id), (_, params) in results.items()
+            if params is not None
+        ],
+        db_path=path.join(cache_path, db_filename)
+    )
+    return written
+
+def write_prediction_caches(
+        predictions,
+        cache_path=CACHE_PATH,
+        db_filename=cache_utils.CACHE_DB,
+        model='prophet',
+        logger=logging.getLogger('publicAPI')
+):
+    """update cache db with many predictions of one model in one transaction
+
+    Args:
+        predictions (:obj:`dict`): {(region_id, type_id): pandas.DataFrame}
+        cache_path (str, optional): path to caches
+        db_filename (str, optional): name of cache db
+        model (str, optional): forecast backend
+        logger (:obj:`logging.logger`): logging handle
+
+    Returns:
+        int: predictions written
+
+    """
+    utc_today = datetime.utcnow().strftime('%Y-%m-%d')
+
+    ## Prepare new entries for cache: typed records, see `check_prediction_cache` ##
+    entries = [
+        (region_id, type_id, format_utils.to_npy_bytes(prediction_data))
+        for (region_id, type_id), prediction_data in predictions.items()
+    ]
+
+    ## replaces previous cache ##
+    return cache_utils.write_predictions(
+        entries,
+        utc_today,
+        model=model,
+        db_path=path.join(cache_path, db_filename)
+    )
 
 DEFAULT_RANGE = api_config.DEFAULT_HISTORY_RANGE
 CREST_RANGE = api_config.EXPECTED_CREST_RANGE
@@ -139,6 +267,7 @@ def check_requested_range(
             )
         return max_range
 
+@http_utils.coalesce('region_id', 'type_id', 'mode', 'min_data', 'crest_range', 'data_range')
 def fetch_extended_history(
         region_id,
         type_id,
@@ -159,7 +288,7 @@ def fetch_extended_history(
         logger (:obj:`logging.logger`): logging handle
 
     Returns:
-        pandas.DataFrame: collection of data from database
+        pandas.DataFrame: collection of data from database (see `crest_utils.normalize_history`)
             ['date', 'avgPrice', 'highPrice', 'lowPrice', 'volume', 'orders']
     """
     logger.info('--fetching history data')
@@ -171,7 +300,10 @@ def fetch_extended_history(
             config=config
         )
         logger.debug(raw_data['result'][:5])
-        data = parse_emd_data(raw_data['result'])
+        data = crest_utils.normalize_history(
+            parse_emd_data(raw_data['result']),
+            logger=logger
+        )
     except Exception as err_msg:    #pragma: no cover
         logger.warning(
             'ERROR: trouble getting data from EMD' +
@@ -226,7 +358,7 @@ def trim_prediction(
     """trim predicted dataframe into shape for results
 
     Args:
-        data (:obj:`pandas.DataFrame`): data reported
+        data (:obj:`pandas.DataFrame`): data reported (datetime64 `date`)
         history_days (int): number of days BACK to report
         prediction_days (int): number of days FORWARD to report
 
@@ -234,14 +366,11 @@ def trim_prediction(
         pandas.DataFrame: same shape as original dataframe, but with days removed
 
     """
-    back_date = datetime.utcnow() - timedelta(days=history_days)
-    forward_date = datetime.utcnow() + timedelta(days=prediction_days)
-
-    back_date_str = back_date.strftime('%Y-%m-%d')
-    forward_date_str = forward_date.strftime('%Y-%m-%d')
+    utc_today = pd.Timestamp(datetime.utcnow().date())
+    back_date = utc_today - timedelta(days=history_days)
+    forward_date = utc_today + timedelta(days=prediction_days)
 
-    trim_data = data.loc[data.date >= back_date_str]
-    trim_data = trim_data.loc[trim_data.date <= forward_date_str]
+    trim_data = data.loc[(data.date >= back_date) & (data.date <= forward_date)]
 
     return trim_data
 
@@ -256,8 +385,8 @@ def fetch_market_history_emd(
     """use EMD endpoint to fetch data instead of MySQL
 
     Args:
-        region_id (int): EVE Online regionID: https://crest-tq.eveonline.com/regions/
-        type_id (int): EVE Online typeID: https://crest-tq.eveonline.com/types/
+        region_id (int or list): EVE Online regionID(s): https://crest-tq.eveonline.com/regions/
+        type_id (int or list): EVE Online typeID(s): https://crest-tq.eveonline.com/types/
         data_range (int): number of days to fetch
         endpoint_addr (str, optional): EMD endpoint to query against
         config (:obj:`configparser.ConfigParser`, optional): overrides for config
@@ -265,8 +394,13 @@ def fetch_market_history_emd(
     Returns:
         dict: JSONable collection of data from endpoint
             ['typeID', 'regionID', 'date', 'lowPrice', 'highPrice', 'avgPrice', 'volume', 'orders']
+            (multi-pair results can be split with `split_emd_data`)
 
     """
+    if isinstance(region_id, (list, tuple)):
+        region_id = ','.join(map(str, region_id))
+    if isinstance(type_id, (list, tuple)):
+        type_id = ','.join(map(str, type_id))
     payload = {
         'region_ids': region_id,
         'type_ids': type_id,
@@ -277,7 +411,7 @@ def fetch_market_history_emd(
         'User-Agent': config.get('GLOBAL', 'useragent')
     }
 
-    req = requests.get(
+    req = http_utils.SESSIONS.get(
         endpoint_addr,
         headers=headers,
         params=payload
@@ -290,9 +424,23 @@ def fetch_market_history_emd(
 
     return data
 
+EMD_DTYPES = {
+    'typeID': np.int64,
+    'regionID': np.int64,
+    'lowPrice': np.float64,
+    'highPrice': np.float64,
+    'avgPrice': np.float64,
+    'volume': np.int64,
+    'orders': np.int64,
+}
 def parse_emd_data(data_result):
     """condition data to collapse 'row' keys
 
+    Notes:
+        fields are pulled column-by-column straight into typed arrays
+        (`EMD_DTYPES`).  Null/unparsable numbers become NaN, leaving that
+        column float64.  `date` stays %Y-%m-%d text like ESI data
+
     Args:
         data_result (:obj:`list`): data['result'] collection of row data
 
@@ -300,32 +448,454 @@ def parse_emd_data(data_result):
         pandas.DataFrame: processed row data in table form
 
     """
-    clean_data = []
-    for row in data_result:
-        clean_data.append(row['row'])
-
-    table_data = pd.DataFrame(clean_data)
+    rows = [entry['row'] for entry in data_result]
+    if not rows:
+        return pd.DataFrame()
+
+    columns = list(rows[0].keys())
+    table = {}
+    for column in columns:
+        values = list(map(itemgetter(column), rows))
+        if column in EMD_DTYPES:
+            values = pd.to_numeric(values, errors='coerce').astype(np.float64)
+            if not np.isnan(values).any():
+                values = values.astype(EMD_DTYPES[column])
+        table[column] = values
+
+    table_data = pd.DataFrame(table, columns=columns)
 
     return table_data
 
-def build_forecast(
+def split_emd_data(data_result):
+    """parse a multi-pair EMD payload into one table per pair
+
+    Args:
+        data_result (:obj:`list`): data['result'] collection of row data
+
+    Returns:
+        dict: {(region_id, type_id): pandas.DataFrame} (see `crest_utils.normalize_history`)
+
+    """
+    table_data = parse_emd_data(data_result)
+    if table_data.empty:
+        return {}
+
+    return {
+        (int(region_id), int(type_id)): crest_utils.normalize_history(pair_data)
+        for (region_id, type_id), pair_data in table_data.groupby(
+            ['regionID', 'typeID'], sort=False
+        )
+    }
+
+WARM_START_KEYS = ['k', 'm', 'sigma_obs', 'delta', 'beta']
+def model_params(model):
+    """pull a fitted model's MAP parameters into a Stan `init` dict
+
+    Notes:
+        https://facebook.github.io/prophet/docs/additional_topics.html#updating-fitted-models
+
+    Args:
+        model (:obj:`fbprophet.Prophet`): fitted model
+
+    Returns:
+        dict: {k, m, sigma_obs: float, delta, beta: list}
+
+    """
+    params = {}
+    for key in WARM_START_KEYS:
+        values = np.asarray(model.params[key], dtype=np.float64).reshape(-1)
+        if key in ('delta', 'beta'):
+            params[key] = values.tolist()
+        else:
+            params[key] = float(values[0])
+    return params
+
+def warm_start_params(stored, data):
+    """decide if yesterday's fit can seed today's
+
+    Notes:
+        warm starts only while history grows forward: the last fitted day
+        must still be present with the same price, and no older rows may
+        appear (split stitches/backfills rescale or extend history).
+
+    Args:
+        stored (:obj:`dict`): `fit_forecast` params report (None if never fit)
+        data (:obj:`pandas.DataFrame`): history about to be fit
+
+    Returns:
+        dict: Stan `init` for `fit_forecast`, None for a cold fit
+
+    """
+    if not stored or not stored.get('init'):
+        return None
+
+    dates = pd.to_datetime(data['date'])
+    if dates.min() < pd.Timestamp(stored['start']):
+        return None
+    end_rows = data.loc[dates == pd.Timestamp(stored['end']), 'avgPrice']
+    if end_rows.empty or not np.isclose(end_rows.iloc[-1], stored['end_y'], rtol=1e-9):
+        return None
+
+    return stored['init']
+
+def future_dates(dates, forecast_range):
+    """history dates plus `forecast_range` following days
+
+    Notes:
+        same frame as `Prophet.make_future_dataframe(periods=forecast_range)`
+
+    Args:
+        dates (:obj:`pandas.Series`): datetime64 history dates (oldest first)
+        forecast_range (int): days to add
+
+    Returns:
+        pandas.DatetimeIndex: history + future dates
+
+    """
+    dates = pd.DatetimeIndex(dates)
+    return dates.append(pd.date_range(
+        dates[-1] + timedelta(days=1), periods=forecast_range, freq='D'
+    ))
+
+SEASON_LENGTH = 7   # weekday seasonality
+INTERVAL_Z = 1.2815515655446004 # 80% band, Prophet's default `interval_width`
+PRECISION_MODES = ['full', 'fast', 'map']
+def precision_samples(precision):
+    """Prophet `uncertainty_samples` for a precision mode
+
+    Notes:
+        full: Prophet's default sampling.
+        fast: [FORECAST] uncertainty_samples trajectories.
+        map: no sampling, bands from `analytic_intervals`
+
+    Args:
+        precision (str): PRECISION_MODES
+
+    Returns:
+        int: sample count (None for Prophet's default)
+
+    """
+    if precision not in PRECISION_MODES:
+        raise ValueError('unsupported precision: {0}'.format(precision))
+    return {
+        'full': None,
+        'fast': api_config.UNCERTAINTY_SAMPLES,
+        'map': 0,
+    }[precision]
+
+def cache_model_key(model, precision='full'):
+    """forecast_cache/job identity for a model at a precision
+
+    Args:
+        model (str): FORECAST_MODELS
+        precision (str, optional): PRECISION_MODES (only changes prophet output)
+
+    Returns:
+        str: `model`, or `model:precision` for non-default prophet precision
+
+    """
+    if model != 'prophet' or precision == 'full':
+        return model
+    return '{0}:{1}'.format(model, precision)
+
+def analytic_intervals(model, forecast):
+    """closed-form `yhat_lower`/`yhat_upper` for a MAP-only Prophet fit
+
+    Notes:
+        Prophet's sampled bands are observation noise plus future trend
+        changes.  Under its generative model the noise is N(0, sigma_obs)
+        and future changepoints arrive at the historical rate (S per unit of
+        scaled time) with Laplace(mean |delta|) slope changes, so at scaled
+        time t > 1 the trend variance is 2 * S * lambda**2 * (t - 1)**3 / 3.
+        Linear growth, additive seasonality
+
+    Args:
+        model (:obj:`fbprophet.Prophet`): fitted model
+        forecast (:obj:`pandas.DataFrame`): `model.predict` output
+
+    Returns:
+        (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`): yhat_lower, yhat_upper
+
+    """
+    scaled_t = ((forecast['ds'] - model.start) / model.t_scale).values
+    sigma_obs = np.asarray(model.params['sigma_obs'], dtype=np.float64).reshape(-1)[0]
+    deltas = np.asarray(model.params['delta'], dtype=np.float64).reshape(-1)
+    change_scale = np.mean(np.abs(deltas)) + 1e-8   # as `Prophet.sample_predictive_trend`
+    variance = sigma_obs ** 2 + \
+        2 * len(model.changepoints_t) * change_scale ** 2 * \
+        np.clip(scaled_t - 1, 0, None) ** 3 / 3
+
+    spread = INTERVAL_Z * model.y_scale * np.sqrt(variance)
+    yhat = forecast['yhat'].values
+    return yhat - spread, yhat + spread
+
+WARM_START_ERRORS = (RuntimeError, ValueError)  # pystan init/optimizing failures
+def prophet_forecast(
+        history,
+        forecast_range,
+        warm_start=None,
+        uncertainty_samples=None,
+        region_id=None,
+        type_id=None,
+        logger=logging.getLogger('publicAPI')
+):
+    """forecast backend: fbprophet
+
+    Notes:
+        `warm_start` seeds the Stan optimizer with an earlier fit's parameters.
+        If Stan rejects it (feature/changepoint counts moved), warn and refit cold.
+        `uncertainty_samples=0` skips band sampling (fbprophet>=0.5) and
+        uses `analytic_intervals` instead
+
+    Args:
+        history (:obj:`pandas.DataFrame`): ['ds', 'y']
+        forecast_range (int): days to forecast
+        warm_start (:obj:`dict`, optional): Stan `init` (see `warm_start_params`)
+        uncertainty_samples (int, optional): band trajectories (see `precision_samples`)
+        region_id (int, optional): EVE Online regionID (for logging)
+        type_id (int, optional): EVE Online typeID (for logging)
+        logger (:obj:`logging.logger`): logging handle
+
+    Returns:
+        (:obj:`pandas.DataFrame`, dict): ['ds', 'yhat', 'yhat_lower', 'yhat_upper']
+            over history + future, {init, warm}
+
+    """
+    if Prophet is None:
+        raise ImportError('fbprophet required for model=prophet')
+
+    # https://facebookincubator.github.io/prophet/docs/quick_start.html#python-api
+    settings = {}
+    if uncertainty_samples is not None:
+        settings['uncertainty_samples'] = uncertainty_samples
+    model = None
+    if warm_start:
+        try:
+            model = Prophet(**settings)
+            model.fit(history, init=warm_start)
+        except WARM_START_ERRORS as err_msg:
+            logger.warning(
+                'WARNING: warm start rejected, refitting cold' +
+                '\n\tregion_id={0}'.format(region_id) +
+                '\n\ttype_id={0}'.format(type_id) +
+                '\n\terr_msg={0!r}'.format(err_msg)
+            )
+            model = None
+    warm = model is not None
+    if model is None:
+        model = Prophet(**settings)
+        model.fit(history)
+    future = model.make_future_dataframe(periods=forecast_range)
+
+    forecast = model.predict(future)
+    if uncertainty_samples == 0:
+        forecast['yhat_lower'], forecast['yhat_upper'] = analytic_intervals(model, forecast)
+    return forecast, {'init': model_params(model), 'warm': warm}
+
+HOLT_WINTERS_ALPHAS = [0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9]
+HOLT_WINTERS_BETAS = [0.0, 0.01, 0.05, 0.1, 0.2]
+HOLT_WINTERS_GAMMAS = [0.0, 0.05, 0.1, 0.3]
+def holtwinters_forecast(
+        history,
+        forecast_range,
+        warm_start=None,
+        uncertainty_samples=None,
+        region_id=None,
+        type_id=None,
+        logger=logging.getLogger('publicAPI')
+):
+    """forecast backend: additive Holt-Winters (level + trend + weekday season)
+
+    Notes:
+        every (alpha, beta, gamma) on the HOLT_WINTERS_* grid is smoothed at
+        once, one numpy step per row, and the lowest one-step-ahead SSE wins.
+        Seasons are keyed by weekday and trend is per day, so gaps in history
+        are stepped over.  Bands use the ETS(A,A,A) h-step variance
+
+    Args:
+        history (:obj:`pandas.DataFrame`): ['ds', 'y']
+        forecast_range (int): days to forecast
+        warm_start (None): unused
+        uncertainty_samples (None): unused (bands are analytic)
+        region_id (int, optional): EVE Online regionID (unused)
+        type_id (int, optional): EVE Online typeID (unused)
+        logger (:obj:`logging.logger`): logging handle (unused)
+
+    Returns:
+        (:obj:`pandas.DataFrame`, None): ['ds', 'yhat', 'yhat_lower', 'yhat_upper']
+            over history + future
+
+    """
+    dates = future_dates(history['ds'], forecast_range)
+    weekdays = dates.dayofweek.values
+    days = ((dates - dates[0]) // timedelta(days=1)).values
+    y = history['y'].values.astype(np.float64)
+    row_count = len(y)
+    gaps = np.diff(days[:row_count], prepend=days[0] - 1).astype(np.float64)
+
+    ## Starting state from the first two weeks ##
+    seasonal = row_count >= 2 * SEASON_LENGTH
+    alpha, beta, gamma = [grid.ravel() for grid in np.meshgrid(
+        HOLT_WINTERS_ALPHAS,
+        HOLT_WINTERS_BETAS,
+        HOLT_WINTERS_GAMMAS if seasonal else [0.0],
+        indexing='ij'
+    )]
+    seasons = np.zeros((len(alpha), SEASON_LENGTH))
+    trend = 0.0
+    level = y[0]
+    if seasonal:
+        first_week = y[:SEASON_LENGTH].mean()
+        trend = (y[SEASON_LENGTH:2 * SEASON_LENGTH].mean() - first_week) / SEASON_LENGTH
+        level = first_week - trend * (SEASON_LENGTH + 1) / 2
+        head = slice(0, 2 * SEASON_LENGTH)
+        detrended = y[head] - (level + trend * (days[head] + 1))
+        counts = np.bincount(weekdays[head], minlength=SEASON_LENGTH)
+        totals = np.bincount(weekdays[head], weights=detrended, minlength=SEASON_LENGTH)
+        seasons[:] = np.divide(totals, counts, out=np.zeros(SEASON_LENGTH), where=counts > 0)
+        seasons -= seasons.mean()
+    level = np.full(len(alpha), level)
+    trend = np.full(len(alpha), trend)
+
+    ## Smooth every candidate together ##
+    fitted = np.empty((len(alpha), row_count))
+    for row in range(row_count):
+        season = seasons[:, weekdays[row]]
+        fitted[:, row] = level + gaps[row] * trend + season
+        new_level = alpha * (y[row] - season) + (1 - alpha) * (level + gaps[row] * trend)
+        trend = beta * (new_level - level) / gaps[row] + (1 - beta) * trend
+        seasons[:, weekdays[row]] = gamma * (y[row] - new_level) + (1 - gamma) * season
+        level = new_level
+
+    burn_in = SEASON_LENGTH if row_count > SEASON_LENGTH else 0
+    errors = (y - fitted)[:, burn_in:]
+    best = np.argmin((errors ** 2).sum(axis=1))
+    sigma = np.sqrt((errors[best] ** 2).mean()) if errors.shape[1] else 0.0
+
+    ## Project forward ##
+    steps = np.arange(1, forecast_range + 1)
+    future = level[best] + steps * trend[best] + seasons[best, weekdays[row_count:]]
+    weights = alpha[best] * (1 + steps[:-1] * beta[best]) + \
+        gamma[best] * (1 - alpha[best]) * (steps[:-1] % SEASON_LENGTH == 0)
+    spread = sigma * np.sqrt(np.concatenate([
+        np.ones(row_count),
+        1 + np.concatenate([[0.0], np.cumsum(weights ** 2)]),
+    ]))
+
+    yhat = np.concatenate([fitted[best], future])
+    return pd.DataFrame({
+        'ds': dates,
+        'yhat': yhat,
+        'yhat_lower': yhat - INTERVAL_Z * spread,
+        'yhat_upper': yhat + INTERVAL_Z * spread,
+    }), None
+
+def linear_forecast(
+        history,
+        forecast_range,
+        warm_start=None,
+        uncertainty_samples=None,
+        region_id=None,
+        type_id=None,
+        logger=logging.getLogger('publicAPI')
+):
+    """forecast backend: least-squares linear trend + weekday offsets
+
+    Notes:
+        bands are the OLS prediction interval: sigma * sqrt(1 + leverage)
+
+    Args:
+        history (:obj:`pandas.DataFrame`): ['ds', 'y']
+        forecast_range (int): days to forecast
+        warm_start (None): unused
+        uncertainty_samples (None): unused (bands are analytic)
+        region_id (int, optional): EVE Online regionID (unused)
+        type_id (int, optional): EVE Online typeID (unused)
+        logger (:obj:`logging.logger`): logging handle (unused)
+
+    Returns:
+        (:obj:`pandas.DataFrame`, None): ['ds', 'yhat', 'yhat_lower', 'yhat_upper']
+            over history + future
+
+    """
+    dates = future_dates(history['ds'], forecast_range)
+    y = history['y'].values.astype(np.float64)
+    row_count = len(y)
+
+    ## Design: intercept, trend (years), weekday dummies ##
+    columns = [np.ones(len(dates)), ((dates - dates[0]) / timedelta(days=365)).values]
+    if row_count >= 2 * SEASON_LENGTH:
+        columns.extend(
+            (dates.dayofweek.values == weekday).astype(np.float64)
+            for weekday in range(1, SEASON_LENGTH)
+        )
+    design = np.column_stack(columns)
+
+    coefs, _, rank, _ = np.linalg.lstsq(design[:row_count], y, rcond=None)
+    yhat = design @ coefs
+    residuals = y - yhat[:row_count]
+    sigma = np.sqrt(residuals @ residuals / max(row_count - rank, 1))
+    leverage = np.einsum(
+        'ij,jk,ik->i',
+        design,
+        np.linalg.pinv(design[:row_count].T @ design[:row_count]),
+        design
+    )
+    spread = INTERVAL_Z * sigma * np.sqrt(1 + leverage)
+
+    return pd.DataFrame({
+        'ds': dates,
+        'yhat': yhat,
+        'yhat_lower': yhat - spread,
+        'yhat_upper': yhat + spread,
+    }), None
+
+FORECASTERS = {
+    'prophet': prophet_forecast,
+    'holtwinters': holtwinters_forecast,
+    'linear': linear_forecast,
+}
+FORECAST_MODELS = list(FORECASTERS.keys())
+def fit_forecast(
         data,
         forecast_range,
-        truncate_range=0
+        truncate_range=0,
+        warm_start=None,
+        model='prophet',
+        uncertainty_samples=None,
+        region_id=None,
+        type_id=None,
+        logger=logging.getLogger('publicAPI')
 ):
-    """build a forecast for publishing
+    """build a forecast for publishing, reporting the fitted parameters
+
+    Notes:
+        `model` picks a FORECASTERS backend:
+        fn(history, forecast_range, warm_start, uncertainty_samples,
+           region_id=, type_id=, logger=)
+        -> (['ds', 'yhat', 'yhat_lower', 'yhat_upper'] over history + future, params)
 
     Args:
         data (:obj:`pandas.data_frame`): data to build prediction
         forecast_range (int): how much time into the future to forecast
         truncate_range (int, optional): truncate output to CREST_RANGE
+        warm_start (:obj:`dict`, optional): Stan `init` (see `warm_start_params`)
+        model (str, optional): forecast backend (FORECAST_MODELS)
+        uncertainty_samples (int, optional): band trajectories (see `precision_samples`)
+        region_id (int, optional): EVE Online regionID (for logging)
+        type_id (int, optional): EVE Online typeID (for logging)
+        logger (:obj:`logging.logger`): logging handle
 
     Returns:
-        pandas.DataFrame: collection of data + forecast info
-            ['date', 'avgPrice', 'yhat', 'yhat_low', 'yhat_high', 'prediction']
+        (:obj:`pandas.DataFrame`, :obj:`dict`): `build_forecast` report,
+            {init, start, end, end_y, warm} for the next day's `warm_start_params`
+            (None for backends without parameters)
 
     """
-    data['date'] = pd.to_datetime(data['date'])
+    if model not in FORECASTERS:
+        raise ValueError('unsupported forecast model: {0}'.format(model))
+    if not np.issubdtype(data['date'].dtype, np.datetime64):
+        data['date'] = pd.to_datetime(data['date'])
     filter_date = data['date'].max()
 
     ## Build DataFrame ##
@@ -334,21 +904,21 @@ def build_forecast(
     predict_df['y'] = data['avgPrice']
 
     ## Run prediction ##
-    # https://facebookincubator.github.io/prophet/docs/quick_start.html#python-api
-    model = Prophet()
-    model.fit(predict_df)
-    future = model.make_future_dataframe(periods=forecast_range)
-    tst = model.predict(future)
-
+    forecast, params = FORECASTERS[model](
+        predict_df, forecast_range, warm_start, uncertainty_samples,
+        region_id=region_id,
+        type_id=type_id,
+        logger=logger,
+    )
     predict_df = pd.merge(
-        predict_df, model.predict(future),
+        predict_df, forecast,
         on='ds',
         how='right'
     )
 
     ## Build report for endpoint ##
     report = pd.DataFrame()
-    report['date'] = pd.to_datetime(predict_df['ds'], format='%Y-%m-%d')
+    report['date'] = predict_df['ds']
     report['avgPrice'] = predict_df['y']
     report['yhat'] = predict_df['yhat']
     report['yhat_low'] = predict_df['yhat_lower']
@@ -360,5 +930,38 @@ def build_forecast(
         cut_date = filter_date - timedelta(days=truncate_range)
         report = report.loc[report.date > cut_date]
 
-    return report
+    if params is not None:
+        params.update(
+            start=data['date'].min().strftime('%Y-%m-%d'),
+            end=filter_date.strftime('%Y-%m-%d'),
+            end_y=float(data.loc[data['date'] == filter_date, 'avgPrice'].iloc[-1]),
+        )
+    return report, params
+
+def build_forecast(
+        data,
+        forecast_range,
+        truncate_range=0,
+        model='prophet',
+        precision='full',
+):
+    """build a forecast for publishing
 
+    Args:
+        data (:obj:`pandas.data_frame`): data to build prediction
+        forecast_range (int): how much time into the future to forecast
+        truncate_range (int, optional): truncate output to CREST_RANGE
+        model (str, optional): forecast backend (FORECAST_MODELS)
+        precision (str, optional): band precision (PRECISION_MODES)
+
+    Returns:
+        pandas.DataFrame: collection of data + forecast info
+            ['date', 'avgPrice', 'yhat', 'yhat_low', 'yhat_high', 'prediction']
+
+    """
+    report, _ = fit_forecast(
+        data, forecast_range, truncate_range,
+        model=model,
+        uncertainty_samples=precision_samples(precision),
+    )
+    return report
@@ -0,0 +1,390 @@
+"""format_utils.py: encode DataFrames straight to (streamed) response bodies"""
+import gzip
+import io
+import json as std_json
+import re
+
+import numpy as np
+import ujson
+import pandas as pd
+
+try:    #pragma: no cover
+    import brotli
+except ImportError:
+    brotli = None
+try:    #pragma: no cover
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_PRECISION = 10 # matches `pandas.DataFrame.to_json` default double_precision
+NEEDS_ESCAPE = re.compile(r'[^\x20\x21\x23-\x5b\x5d-\x7e]')  # chars `json.dumps` would escape
+NEEDS_QUOTE = re.compile(r'[,"\r\n]')  # chars `csv.QUOTE_MINIMAL` would quote
+STREAM_CHUNK_ROWS = 500
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+PANDAS_DUMPS = getattr(pd.io.json, 'ujson_dumps', None) or pd.io.json.dumps
+
+def _json_column(column, date_format=None):
+    """render one column as JSON literals
+
+    Notes:
+        mirrors `to_json(orient='records')` -> `json.loads` -> `json.dumps`:
+        floats round to `JSON_PRECISION`, NaN/NaT -> null, datetimes -> epoch ms
+
+    Args:
+        column (:obj:`pandas.Series`): column to render
+        date_format (str, optional): strftime for datetimes instead of epoch ms
+
+    Returns:
+        list: JSON literal per row
+
+    """
+    values = column.values
+    mask = pd.isnull(values)
+    if np.issubdtype(values.dtype, np.datetime64) and date_format:
+        literals = ('"' + pd.DatetimeIndex(values).strftime(date_format) + '"').tolist()
+    elif np.issubdtype(values.dtype, np.datetime64):
+        literals = values.astype('datetime64[ms]').astype(np.int64).astype(str).tolist()
+    elif values.dtype == np.bool_:
+        literals = np.where(values, 'true', 'false').tolist()
+    elif np.issubdtype(values.dtype, np.integer):
+        literals = values.astype(str).tolist()
+    elif np.issubdtype(values.dtype, np.floating):
+        ## pandas' own double rounding, then Python's repr of the parsed value ##
+        literals = list(map(float.__repr__, ujson.loads(PANDAS_DUMPS(
+            np.where(mask, 0.0, values),
+            double_precision=JSON_PRECISION
+        ))))
+    else:
+        values = values.tolist()
+        plain = all(isinstance(value, str) for value in values)
+        if plain and not NEEDS_ESCAPE.search(''.join(values)):
+            literals = ['"' + value + '"' for value in values]
+        else:
+            literals = [
+                std_json.dumps(value.item() if isinstance(value, np.generic) else value)
+                for value in values
+            ]
+
+    if mask.any():
+        literals = [
+            'null' if missing else literal
+            for literal, missing in zip(literals, mask.tolist())
+        ]
+    return literals
+
+def _csv_date_format(column):
+    """pick the `to_csv` datetime format for a whole column
+
+    Args:
+        column (:obj:`pandas.Series`): datetime column
+
+    Returns:
+        str: strftime format (date only when every stamp is midnight)
+
+    """
+    stamps = pd.DatetimeIndex(column.values)
+    valid = stamps[stamps.notnull()]
+    if (valid.normalize() == valid).all():
+        return '%Y-%m-%d'
+    return '%Y-%m-%d %H:%M:%S'
+
+def _csv_column(column, date_format=None):
+    """render one column as CSV cells, matching `to_csv` defaults
+
+    Args:
+        column (:obj:`pandas.Series`): column to render
+        date_format (str, optional): datetime format (see `_csv_date_format`)
+
+    Returns:
+        list: cell text per row (quoted where `csv.QUOTE_MINIMAL` would)
+
+    """
+    values = column.values
+    mask = pd.isnull(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        cells = pd.DatetimeIndex(values).strftime(
+            date_format or _csv_date_format(column)
+        ).tolist()
+    elif np.issubdtype(values.dtype, np.floating):
+        cells = list(map(float.__repr__, np.where(mask, 0.0, values).tolist()))
+    else:
+        cells = list(map(str, values.tolist()))
+        if NEEDS_QUOTE.search(''.join(cells)):
+            cells = [
+                '"' + cell.replace('"', '""') + '"' if NEEDS_QUOTE.search(cell) else cell
+                for cell in cells
+            ]
+
+    if mask.any():
+        cells = ['' if missing else cell for cell, missing in zip(cells, mask.tolist())]
+    return cells
+
+def iter_json(
+        data,
+        columns=None,
+        settings=None,
+        chunk_rows=STREAM_CHUNK_ROWS,
+        date_format=None,
+):
+    """encode a DataFrame as a JSON list of records, `chunk_rows` at a time
+
+    Notes:
+        joined output is byte-identical to flask-restful's
+        `output_json(json.loads(data.to_json(orient='records')))`.
+        With `date_format`, datetime columns are written as text the way
+        `to_json` writes pre-formatted string columns
+
+    Args:
+        data (:obj:`pandas.DataFrame`): data to encode
+        columns (:obj:`list`, optional): columns to report (default: all)
+        settings (:obj:`dict`, optional): `json.dumps` kwargs (RESTFUL_JSON)
+        chunk_rows (int, optional): rows encoded per chunk
+        date_format (str, optional): strftime for datetime columns (default: epoch ms)
+
+    Yields:
+        str: pieces of JSON body, newline terminated
+
+    """
+    columns = list(data.columns) if columns is None else columns
+    if settings:
+        ## pretty-printing requested (debug mode): take the slow road ##
+        data = data[columns]
+        if date_format:
+            data = data.apply(
+                lambda column: column.dt.strftime(date_format)
+                if np.issubdtype(column.dtype, np.datetime64) else column
+            )
+        records = ujson.loads(data.to_json(path_or_buf=None, orient='records'))
+        yield std_json.dumps(records, **settings) + '\n'
+        return
+
+    row_template = '{' + ', '.join(
+        std_json.dumps(str(column)).replace('%', '%%') + ': %s' for column in columns
+    ) + '}'
+    separator = '['
+    for start in range(0, len(data), chunk_rows):
+        chunk = data.iloc[start:start + chunk_rows]
+        literals = [_json_column(chunk[column], date_format) for column in columns]
+        yield separator + ', '.join([row_template % row for row in zip(*literals)])
+        separator = ', '
+    yield '[]\n' if separator == '[' else ']\n'
+
+def iter_csv(
+        data,
+        columns=None,
+        chunk_rows=STREAM_CHUNK_ROWS,
+):
+    """encode a DataFrame as CSV, `chunk_rows` at a time
+
+    Notes:
+        joined output is byte-identical to
+        `data.to_csv(header=True, index=False, columns=columns)`
+
+    Args:
+        data (:obj:`pandas.DataFrame`): data to encode
+        columns (:obj:`list`, optional): columns to report (default: all)
+        chunk_rows (int, optional): rows encoded per chunk
+
+    Yields:
+        str: pieces of CSV body
+
+    """
+    columns = list(data.columns) if columns is None else columns
+    date_formats = {
+        column: _csv_date_format(data[column]) for column in columns
+        if np.issubdtype(data[column].dtype, np.datetime64)
+    }
+    yield ','.join([
+        '"' + str(column).replace('"', '""') + '"' if NEEDS_QUOTE.search(str(column)) else str(column)
+        for column in columns
+    ]) + '\n'
+
+    row_template = ','.join(['%s'] * len(columns)) + '\n'
+    for start in range(0, len(data), chunk_rows):
+        chunk = data.iloc[start:start + chunk_rows]
+        cells = [
+            _csv_column(chunk[column], date_formats.get(column))
+            for column in columns
+        ]
+        yield ''.join([row_template % row for row in zip(*cells)])
+
+def to_json_str(
+        data,
+        columns=None,
+        settings=None,
+        date_format=None,
+):
+    """encode a DataFrame as a JSON list of records
+
+    Args:
+        data (:obj:`pandas.DataFrame`): data to encode
+        columns (:obj:`list`, optional): columns to report (default: all)
+        settings (:obj:`dict`, optional): `json.dumps` kwargs (RESTFUL_JSON)
+        date_format (str, optional): strftime for datetime columns (default: epoch ms)
+
+    Returns:
+        str: JSON body, newline terminated (see `iter_json`)
+
+    """
+    return ''.join(iter_json(
+        data, columns, settings,
+        chunk_rows=max(len(data), 1),
+        date_format=date_format,
+    ))
+
+def to_csv_str(
+        data,
+        columns=None,
+):
+    """encode a DataFrame as CSV
+
+    Args:
+        data (:obj:`pandas.DataFrame`): data to encode
+        columns (:obj:`list`, optional): columns to report (default: all)
+
+    Returns:
+        str: CSV body (see `iter_csv`)
+
+    """
+    return ''.join(iter_csv(data, columns, chunk_rows=max(len(data), 1)))
+
+def to_records_array(
+        data,
+        columns=None,
+):
+    """recast a DataFrame as a typed numpy structured array
+
+    Notes:
+        `date` -> datetime64[D], bool -> ?, ints -> <i8, everything else <f8
+
+    Args:
+        data (:obj:`pandas.DataFrame`): data to encode
+        columns (:obj:`list`, optional): columns to report (default: all)
+
+    Returns:
+        numpy.ndarray: one record per row
+
+    """
+    columns = list(data.columns) if columns is None else columns
+    arrays = []
+    for column in columns:
+        values = data[column]
+        if column == 'date' or np.issubdtype(values.dtype, np.datetime64):
+            arrays.append(pd.to_datetime(values).values.astype('datetime64[D]'))
+        elif values.dtype == np.bool_:
+            arrays.append(values.values)
+        elif np.issubdtype(values.dtype, np.integer):
+            arrays.append(values.values.astype('<i8'))
+        else:
+            arrays.append(values.values.astype('<f8'))
+
+    records = np.empty(len(data), dtype=[
+        (str(column), array.dtype) for column, array in zip(columns, arrays)
+    ])
+    for column, array in zip(columns, arrays):
+        records[str(column)] = array
+    return records
+
+def to_npy_bytes(
+        data,
+        columns=None,
+):
+    """encode a DataFrame as a NumPy `.npy` structured array
+
+    Notes:
+        read back with `numpy.load(io.BytesIO(body))`
+
+    Args:
+        data (:obj:`pandas.DataFrame`): data to encode
+        columns (:obj:`list`, optional): columns to report (default: all)
+
+    Returns:
+        bytes: .npy file contents
+
+    """
+    buffer = io.BytesIO()
+    np.save(buffer, to_records_array(data, columns), allow_pickle=False)
+    return buffer.getvalue()
+
+def from_npy_bytes(body):
+    """decode a `to_npy_bytes` payload back into a DataFrame
+
+    Notes:
+        records are viewed in place over `body` (no parse, no copy) and
+        split into typed columns; datetime64[D] comes back as datetime64[ns]
+
+    Args:
+        body (bytes): .npy file contents
+
+    Returns:
+        pandas.DataFrame: decoded table
+
+    """
+    header = io.BytesIO(body)
+    version = np.lib.format.read_magic(header)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+    if dtype.names is None or fortran_order or len(shape) != 1:
+        raise ValueError('expected a 1-d structured array')
+    records = np.frombuffer(body, dtype=dtype, count=shape[0], offset=header.tell())
+
+    return pd.DataFrame({name: records[name] for name in dtype.names}, columns=list(dtype.names))
+
+def to_msgpack_bytes(
+        data,
+        columns=None,
+):
+    """encode a DataFrame as a msgpack map of columns
+
+    Notes:
+        {column: [values]}; dates as %Y-%m-%d strings, NaN stays float NaN
+
+    Args:
+        data (:obj:`pandas.DataFrame`): data to encode
+        columns (:obj:`list`, optional): columns to report (default: all)
+
+    Returns:
+        bytes: msgpack payload
+
+    """
+    if msgpack is None:
+        raise ImportError('msgpack required for msgpack output')
+
+    records = to_records_array(data, columns)
+    payload = {}
+    for column in records.dtype.names:
+        if np.issubdtype(records.dtype[column], np.datetime64):
+            payload[column] = np.datetime_as_string(records[column]).tolist()
+        else:
+            payload[column] = records[column].tolist()
+    return msgpack.packb(payload, use_bin_type=True)
+
+def content_encodings():
+    """`Content-Encoding`s we can precompress, server preference first
+
+    Returns:
+        list: encoding tokens (`br` only when brotli is installed)
+
+    """
+    if brotli is None:
+        return ['gzip']
+    return ['br', 'gzip']
+
+def compress_variants(body):
+    """precompress a rendered body for every supported `Content-Encoding`
+
+    Args:
+        body (bytes): plain response body
+
+    Returns:
+        dict: {encoding: compressed body}
+
+    """
+    variants = {'gzip': gzip.compress(body, compresslevel=GZIP_LEVEL)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return variants
@@ -0,0 +1,533 @@
+"""http_utils.py: shared connection handling for upstream (ESI/CREST/EMD) fetches"""
+from os import getpid
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import functools
+import random
+import inspect
+import logging
+import threading
+import time
+
+import ujson as json
+import requests
+from requests.adapters import HTTPAdapter
+
+import publicAPI.exceptions as exceptions
+
+requests.models.json = json
+
+LOGGER = logging.getLogger('publicAPI')
+
+def str_to_bool(value):
+    """parse config truthiness"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('true', '1', 'yes', 'on')
+
+def parse_expires(headers):
+    """read `Expires` header as a timestamp
+
+    Args:
+        headers (:obj:`dict`): response headers
+
+    Returns:
+        float: timestamp response goes stale (0 if missing/unparsable)
+
+    """
+    try:
+        expires = parsedate_to_datetime(headers['Expires'])
+    except (KeyError, TypeError, ValueError, IndexError):
+        return 0.0
+
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=timezone.utc)
+    return expires.timestamp()
+
+class SessionPool(object):
+    """keep-alive `requests.Session` per upstream host
+
+    Notes:
+        urllib3 pools are thread-safe, so threads in a worker share a session
+        sessions are dropped after fork() so workers never share sockets
+
+    """
+    def __init__(
+            self,
+            pool_maxsize=10,
+            pool_block=False,
+            timeout=30,
+    ):
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._request_counts = {}
+        self._pid = getpid()
+
+    def configure(self, config):
+        """load pool settings from config ([HTTP] section)
+
+        Args:
+            config (:obj:`prosper.common.ProsperConfig`): configuration object
+
+        Returns:
+            None
+
+        """
+        self.pool_maxsize = int(config.get_option(
+            'HTTP', 'pool_maxsize', args_default=self.pool_maxsize))
+        self.pool_block = str_to_bool(config.get_option(
+            'HTTP', 'pool_block', args_default=self.pool_block))
+        self.timeout = float(config.get_option(
+            'HTTP', 'timeout', args_default=self.timeout))
+        self.close()
+
+    def _check_fork(self):
+        """forget parent's sessions in a forked child (call with lock held)"""
+        if self._pid != getpid():
+            self._sessions = {}
+            self._request_counts = {}
+            self._pid = getpid()
+
+    def get_session(self, url):
+        """find/build session for url's host
+
+        Args:
+            url (str): address to fetch
+
+        Returns:
+            requests.Session: keep-alive session for host
+
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            self._check_fork()
+            session = self._sessions.get(host)
+            if session is None:
+                LOGGER.debug('--opening session pool: %s', host)
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=self.pool_block,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+                self._request_counts[host] = 0
+            self._request_counts[host] += 1
+
+        return session
+
+    def get(self, url, **kwargs):
+        """`requests.get` over pooled connection
+
+        Args:
+            url (str): address to fetch
+            **kwargs: passed to `requests.Session.get`
+
+        Returns:
+            requests.Response
+
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.get_session(url).get(url, **kwargs)
+
+    def stats(self):
+        """report pool usage per host
+
+        Returns:
+            dict: host:{requests, connections} (connections = sockets opened)
+
+        """
+        report = {}
+        with self._lock:
+            self._check_fork()
+            for host, session in self._sessions.items():
+                connections = 0
+                for adapter in set(session.adapters.values()):
+                    for key in adapter.poolmanager.pools.keys():
+                        connections += adapter.poolmanager.pools[key].num_connections
+                report[host] = {
+                    'requests': self._request_counts[host],
+                    'connections': connections,
+                }
+
+        return report
+
+    def close(self):
+        """close all sessions"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+            self._request_counts = {}
+            self._pid = getpid()
+
+SESSIONS = SessionPool()
+
+class SingleFlight(object):
+    """collapse concurrent identical calls into one
+
+    Notes:
+        first caller for a key runs the call, others block for its result
+        (or exception).  Waiters get `.copy()` of results that support it
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}    # {key: {'done': threading.Event, 'result', 'error'}}
+
+    def do(self, key, func, *args, **kwargs):
+        """run `func` once per in-flight `key`
+
+        Args:
+            key (tuple): hashable call identity
+            func (callable): work to do
+            *args, **kwargs: passed to `func`
+
+        Returns:
+            any: result of `func`
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+
+        if not leader:
+            LOGGER.debug('--waiting on in-flight call: %s', key)
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            result = call['result']
+            return result.copy() if hasattr(result, 'copy') else result
+
+        try:
+            call['result'] = func(*args, **kwargs)
+        except Exception as err_msg:
+            call['error'] = err_msg
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+        return call['result']
+
+    def in_flight(self):
+        """count of calls currently running"""
+        with self._lock:
+            return len(self._calls)
+
+FLIGHTS = SingleFlight()
+
+class RateLimiter(object):
+    """token bucket shared by every thread in a worker
+
+    Notes:
+        `rate` <= 0 disables limiting
+
+    """
+    def __init__(
+            self,
+            rate=0,
+            burst=1,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+
+    def configure(self, config):
+        """load limiter settings from config ([HTTP] section)
+
+        Args:
+            config (:obj:`prosper.common.ProsperConfig`): configuration object
+
+        Returns:
+            None
+
+        """
+        self.rate = float(config.get_option(
+            'HTTP', 'rate_limit', args_default=self.rate))
+        self.burst = int(config.get_option(
+            'HTTP', 'rate_burst', args_default=self.burst))
+        with self._lock:
+            self._tokens = float(self.burst)
+            self._last = time.monotonic()
+
+    def acquire(self):
+        """block until a request may be sent
+
+        Returns:
+            float: seconds spent waiting
+
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    float(self.burst),
+                    self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+RATE_LIMITER = RateLimiter()
+
+def coalesce(*key_args):
+    """decorator: share one in-flight call between identical concurrent callers
+
+    Args:
+        *key_args (str): names of arguments that identify a call
+
+    Returns:
+        callable: decorator
+
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (func.__module__, func.__name__) + tuple(
+                bound.arguments[key_arg] for key_arg in key_args
+            )
+            return FLIGHTS.do(key, func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+RETRY_STATUS = (420, 429, 500, 502, 503, 504)
+class RetryPolicy(object):
+    """per-host retries with backoff, circuit breaking and ESI error budget
+
+    Notes:
+        retries connection errors and `RETRY_STATUS` with full-jitter
+        exponential backoff, bounded by `max_delay` total sleep.
+        `failure_threshold` consecutive failures opens the host's circuit:
+        calls fail fast with `exceptions.CircuitOpen` for `reset_timeout`s,
+        then one trial call is let through (half-open).
+        `X-Esi-Error-Limit-Remain`/`-Reset` are tracked across hosts: calls
+        slow down as remain drops under `error_limit_floor` and fail fast
+        when the budget is spent
+
+    """
+    def __init__(
+            self,
+            max_attempts=3,
+            backoff_base=0.5,
+            backoff_max=4.0,
+            max_delay=5.0,
+            failure_threshold=5,
+            reset_timeout=30.0,
+            error_limit_floor=20,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.error_limit_floor = error_limit_floor
+        self._lock = threading.Lock()
+        self._hosts = {}    # {host: {'failures': int, 'opened_at': float, 'trial': bool}}
+        self._error_remain = None
+        self._error_reset_at = 0.0
+
+    def configure(self, config):
+        """load retry settings from config ([HTTP] section)
+
+        Args:
+            config (:obj:`prosper.common.ProsperConfig`): configuration object
+
+        Returns:
+            None
+
+        """
+        self.max_attempts = int(config.get_option(
+            'HTTP', 'retry_attempts', args_default=self.max_attempts))
+        self.backoff_base = float(config.get_option(
+            'HTTP', 'retry_backoff', args_default=self.backoff_base))
+        self.backoff_max = float(config.get_option(
+            'HTTP', 'retry_backoff_max', args_default=self.backoff_max))
+        self.max_delay = float(config.get_option(
+            'HTTP', 'retry_max_delay', args_default=self.max_delay))
+        self.failure_threshold = int(config.get_option(
+            'HTTP', 'circuit_failures', args_default=self.failure_threshold))
+        self.reset_timeout = float(config.get_option(
+            'HTTP', 'circuit_reset', args_default=self.reset_timeout))
+        self.error_limit_floor = int(config.get_option(
+            'HTTP', 'error_limit_floor', args_default=self.error_limit_floor))
+        self.reset()
+
+    def reset(self):
+        """forget host/error-budget state"""
+        with self._lock:
+            self._hosts = {}
+            self._error_remain = None
+            self._error_reset_at = 0.0
+
+    def state(self, url):
+        """report circuit state for url's host
+
+        Args:
+            url (str): address (or bare host)
+
+        Returns:
+            str: closed/open/half-open
+
+        """
+        host = urlsplit(url).netloc or url
+        with self._lock:
+            host_state = self._hosts.get(host)
+            if not host_state or host_state['opened_at'] is None:
+                return 'closed'
+            if time.monotonic() - host_state['opened_at'] < self.reset_timeout:
+                return 'open'
+            return 'half-open'
+
+    def _before_call(self, host):
+        """fail fast on open circuit/spent budget, else wait out throttle
+
+        Returns:
+            float: seconds to sleep before calling
+
+        """
+        now = time.monotonic()
+        with self._lock:
+            host_state = self._hosts.setdefault(
+                host, {'failures': 0, 'opened_at': None, 'trial': False}
+            )
+            if host_state['opened_at'] is not None:
+                if now - host_state['opened_at'] < self.reset_timeout or host_state['trial']:
+                    raise exceptions.CircuitOpen(
+                        '{0} circuit open after {1} failures'.format(
+                            host, host_state['failures']))
+
+            throttle = 0.0
+            if self._error_remain is not None and self._error_remain < self.error_limit_floor:
+                reset_in = max(self._error_reset_at - now, 0.0)
+                if self._error_remain <= 0:
+                    if reset_in > 0:
+                        raise exceptions.CircuitOpen(
+                            'ESI error limit spent, resets in {0:.0f}s'.format(reset_in))
+                else:
+                    drained = 1 - self._error_remain / self.error_limit_floor
+                    throttle = min(reset_in, self.backoff_max) * drained
+
+            ## half-open: this call is the probe (`_record` clears the flag) ##
+            if host_state['opened_at'] is not None:
+                host_state['trial'] = True
+            return throttle
+
+    def _record(self, host, success, headers=None):
+        """update circuit and error budget from a call's outcome"""
+        with self._lock:
+            host_state = self._hosts[host]
+            host_state['trial'] = False
+            if success:
+                host_state['failures'] = 0
+                host_state['opened_at'] = None
+            else:
+                host_state['failures'] += 1
+                if host_state['failures'] >= self.failure_threshold:
+                    if host_state['opened_at'] is None:
+                        LOGGER.warning('--opening circuit: %s', host)
+                    host_state['opened_at'] = time.monotonic()
+
+            if headers and 'X-Esi-Error-Limit-Remain' in headers:
+                try:
+                    self._error_remain = int(headers['X-Esi-Error-Limit-Remain'])
+                    self._error_reset_at = time.monotonic() + int(
+                        headers.get('X-Esi-Error-Limit-Reset', 60))
+                except ValueError:
+                    pass
+
+    def backoff(self, attempt, response=None):
+        """full-jitter delay before retry `attempt` (honours `Retry-After`)
+
+        Args:
+            attempt (int): retries already made
+            response (:obj:`requests.Response`, optional): failed response
+
+        Returns:
+            float: seconds to sleep
+
+        """
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        if response is not None:
+            try:
+                return min(float(response.headers['Retry-After']), self.backoff_max)
+            except (KeyError, ValueError):
+                pass
+        return random.uniform(0, ceiling)
+
+    def get(self, url, session_pool=SESSIONS, **kwargs):
+        """GET with retry policy applied
+
+        Args:
+            url (str): address to fetch
+            session_pool (:obj:`SessionPool`): pool to fetch through
+            **kwargs: passed to `SessionPool.get`
+
+        Returns:
+            requests.Response: final response (caller checks status)
+
+        Raises:
+            exceptions.CircuitOpen: host down or error budget spent
+            requests.exceptions.RequestException: connection failures
+
+        """
+        host = urlsplit(url).netloc
+        slept = 0.0
+        attempt = 0
+        while True:
+            throttle = self._before_call(host)
+            if throttle:
+                LOGGER.info('--ESI error budget low, throttling %.2fs', throttle)
+                time.sleep(throttle)
+            try:
+                response = session_pool.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err_msg:
+                self._record(host, False)
+                error, response = err_msg, None
+            except Exception:
+                self._record(host, False)   # not retryable, but still a failed probe
+                raise
+            else:
+                retryable = response.status_code in RETRY_STATUS
+                self._record(host, not retryable, response.headers)
+                if not retryable:
+                    return response
+                error = None
+
+            attempt += 1
+            delay = self.backoff(attempt - 1, response)
+            if attempt >= self.max_attempts \
+                    or slept + delay > self.max_delay \
+                    or self.state(host) == 'open':
+                if error is not None:
+                    raise error
+                return response
+            LOGGER.debug('--retry %d for %s in %.2fs', attempt, url, delay)
+            time.sleep(delay)
+            slept += delay
+
+RETRY_POLICY = RetryPolicy()
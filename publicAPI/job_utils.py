@@ -0,0 +1,378 @@
+"""job_utils.py: process-pool job registry for slow (forecast) work"""
+from os import path, getpid
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import threading
+import time
+import uuid
+
+import publicAPI.cache_utils as cache_utils
+import publicAPI.exceptions as exceptions
+
+JOB_DB = path.join(cache_utils.CACHE_PATH, cache_utils.CACHE_DB)
+class Job(object):
+    """handle on one queued/running/finished job
+
+    Notes:
+        jobs running in another worker process have no `future`: their
+        status is read from the shared `forecast_jobs` table
+
+    Args:
+        key (tuple): identity of the work ((region_id, type_id, model))
+        future (:obj:`concurrent.futures.Future`, optional): pool handle
+        job_id (str, optional): id of an existing job
+        submitted (float, optional): timestamp job was queued
+        db_path (str, optional): path to shared job table
+
+    """
+    def __init__(
+            self,
+            key,
+            future=None,
+            job_id=None,
+            submitted=None,
+            db_path=JOB_DB,
+    ):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.key = tuple(key)
+        self.future = future
+        self.submitted = submitted or time.time()
+        self.finished = None
+        self.error = None
+        self.db_path = db_path
+
+    @classmethod
+    def from_record(cls, record, db_path=JOB_DB):
+        """handle on a job from the shared table (see `cache_utils.read_job`)"""
+        job = cls(
+            record['key'],
+            job_id=record['job_id'],
+            submitted=record['submitted'],
+            db_path=db_path,
+        )
+        job.finished = record['finished']
+        job.error = record['error']
+        return job
+
+    def status(self):
+        """queued/running/done/failed"""
+        if self.future is None:
+            record = cache_utils.read_job(self.job_id, db_path=self.db_path)
+            if record is None:
+                self.error = self.error or 'job lost'
+                return 'failed'
+            self.finished = record['finished']
+            self.error = record['error']
+            return record['status']
+        if not self.future.done():
+            return 'running' if self.future.running() else 'queued'
+        if self.future.cancelled() or self.future.exception() is not None:
+            return 'failed'
+        return 'done'
+
+    def to_dict(self):
+        """report job for status endpoint
+
+        Returns:
+            dict: {job_id, status, key, submitted, finished, error}
+
+        """
+        status = self.status()
+        error = self.error
+        if self.future is not None and status == 'failed' and not self.future.cancelled():
+            error = repr(self.future.exception())
+        return {
+            'job_id': self.job_id,
+            'status': status,
+            'key': list(self.key),
+            'submitted': self.submitted,
+            'finished': self.finished,
+            'error': error,
+        }
+
+class JobQueue(object):
+    """bounded process pool + registry of jobs by id and by key
+
+    Notes:
+        submitting a key that already has a job in flight attaches to that
+        job instead of starting another.  Jobs are also registered in the
+        shared cache db, so a poll or a duplicate request landing on another
+        web worker finds them (`get`/`find`/`submit`); a job that worker
+        didn't start is reported from the table.  In-flight jobs older than
+        `job_timeout` are treated as lost.  Finished jobs are kept `job_ttl`
+        seconds so clients can poll them.  The pool is built lazily and
+        rebuilt after a fork (see `http_utils.SessionPool`) or after a
+        worker dies (OOM kill), which fails every job it was running
+
+    Args:
+        max_workers (int, optional): worker processes
+        job_ttl (float, optional): seconds finished jobs stay pollable
+        wait_timeout (float, optional): default seconds a request waits
+        max_wait (float, optional): ceiling on requested waits
+        job_timeout (float, optional): seconds before an in-flight job is lost
+        poll_interval (float, optional): seconds between checks on other workers' jobs
+        db_path (str, optional): path to shared job table
+
+    """
+    def __init__(
+            self,
+            max_workers=2,
+            job_ttl=600.0,
+            wait_timeout=30.0,
+            max_wait=60.0,
+            job_timeout=900.0,
+            poll_interval=0.5,
+            db_path=JOB_DB,
+    ):
+        self.max_workers = max_workers
+        self.job_ttl = job_ttl
+        self.wait_timeout = wait_timeout
+        self.max_wait = max_wait
+        self.job_timeout = job_timeout
+        self.poll_interval = poll_interval
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._jobs = {}     # {job_id: Job}
+        self._active = {}   # {key: Job} in flight
+
+    def configure(self, config):
+        """load settings from [FORECAST] section
+
+        Args:
+            config (:obj:`prosper.common.ProsperConfig`): configuration object
+
+        """
+        self.max_workers = int(config.get_option(
+            'FORECAST', 'job_workers', args_default=self.max_workers))
+        self.job_ttl = float(config.get_option(
+            'FORECAST', 'job_ttl', args_default=self.job_ttl))
+        self.wait_timeout = float(config.get_option(
+            'FORECAST', 'job_wait', args_default=self.wait_timeout))
+        self.max_wait = float(config.get_option(
+            'FORECAST', 'job_wait_max', args_default=self.max_wait))
+        self.job_timeout = float(config.get_option(
+            'FORECAST', 'job_timeout', args_default=self.job_timeout))
+        self.shutdown()
+
+    def _get_executor(self):
+        """fetch (or build) the process pool for this pid (call with lock held)"""
+        if self._executor is not None and self._pid == getpid() \
+                and getattr(self._executor, '_broken', False):
+            self._drop_executor()
+        if self._executor is None or self._pid != getpid():
+            self._executor = ProcessPoolExecutor(max_workers=max(1, self.max_workers))
+            self._pid = getpid()
+            self._active = {}
+        return self._executor
+
+    def _drop_executor(self):
+        """discard a broken pool and its in-flight jobs (call with lock held)
+
+        Notes:
+            the pool has already failed their futures with `BrokenProcessPool`
+
+        """
+        executor, self._executor = self._executor, None
+        self._active = {}
+        executor.shutdown(wait=False)
+
+    def _purge(self):
+        """drop finished jobs past `job_ttl` (call with lock held)"""
+        cutoff = time.time() - self.job_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                del self._jobs[job_id]
+        cache_utils.prune_jobs(cutoff, db_path=self.db_path)
+
+    def _finish(self, job, callback, logger):
+        """bookkeeping when a job's future resolves
+
+        Notes:
+            `callback` (cache write) runs before the job is marked finished
+            in the shared table and leaves `_active`, so a request in between
+            attaches to the finished job instead of missing both job and
+            cache and starting a duplicate
+
+        """
+        try:
+            if callback is not None and job.status() == 'done':
+                callback(job.future.result())
+        except Exception:   #pragma: no cover
+            logger.warning('job %s callback failed', job.job_id, exc_info=True)
+        finally:
+            job.finished = time.time()
+            report = job.to_dict()
+            try:
+                cache_utils.finish_job(
+                    job.job_id,
+                    report['status'],
+                    job.finished,
+                    error=report['error'],
+                    db_path=self.db_path
+                )
+            except Exception:   #pragma: no cover
+                logger.warning('unable to record job %s', job.job_id, exc_info=True)
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+
+    def submit(
+            self,
+            key,
+            func,
+            *args,
+            callback=None,
+            logger=logging.getLogger('publicAPI')
+    ):
+        """run `func(*args)` in the pool, or attach to the job already running `key`
+
+        Args:
+            key (tuple): identity of the work (JSON-able)
+            func (callable): picklable, module-level function
+            *args: picklable arguments
+            callback (callable, optional): called in-process with the result
+            logger (:obj:`logging.logger`): logging handle
+
+        Returns:
+            Job: new or existing job (no `future` if another worker runs it)
+
+        """
+        with self._lock:
+            self._purge()
+            job = self._active.get(key)
+            if job is not None and job.status() == 'failed':
+                ## failed, `_finish` not run yet: don't hand out its error ##
+                report = job.to_dict()
+                cache_utils.finish_job(
+                    job.job_id, 'failed', time.time(),
+                    error=report['error'],
+                    db_path=self.db_path
+                )
+                del self._active[key]
+                job = None
+            if job is not None:
+                logger.info('--attaching to job %s for %s', job.job_id, key)
+                return job
+
+            job = Job(key, db_path=self.db_path)
+            record = cache_utils.claim_job(
+                job.job_id,
+                key,
+                job.submitted,
+                job.submitted - self.job_timeout,
+                db_path=self.db_path
+            )
+            if record is not None:
+                logger.info(
+                    '--attaching to job %s for %s in another worker',
+                    record['job_id'], key
+                )
+                return Job.from_record(record, db_path=self.db_path)
+
+            try:
+                try:
+                    job.future = self._get_executor().submit(func, *args)
+                except BrokenProcessPool:
+                    logger.warning('--job pool broken (worker died), rebuilding')
+                    self._drop_executor()
+                    job.future = self._get_executor().submit(func, *args)
+            except Exception as err_msg:
+                cache_utils.finish_job(
+                    job.job_id, 'failed', time.time(),
+                    error=repr(err_msg),
+                    db_path=self.db_path
+                )
+                raise
+            self._jobs[job.job_id] = job
+            self._active[key] = job
+        logger.info('--queued job %s for %s', job.job_id, key)
+        job.future.add_done_callback(lambda _: self._finish(job, callback, logger))
+        return job
+
+    def get(self, job_id):
+        """look up a job by id, in this worker or the shared table
+
+        Returns:
+            Job: None if unknown/expired
+
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+
+        record = cache_utils.read_job(job_id, db_path=self.db_path)
+        if record is None:
+            return None
+        return Job.from_record(record, db_path=self.db_path)
+
+    def find(self, key):
+        """look up the in-flight job for `key`, in this worker or the shared table
+
+        Returns:
+            Job: None if nothing is running
+
+        """
+        with self._lock:
+            job = self._active.get(key)
+        if job is not None:
+            return job
+
+        record = cache_utils.read_active_job(
+            key,
+            time.time() - self.job_timeout,
+            db_path=self.db_path
+        )
+        if record is None:
+            return None
+        return Job.from_record(record, db_path=self.db_path)
+
+    def wait(self, job, timeout=None):
+        """block (bounded) for a job's result
+
+        Args:
+            job (:obj:`Job`): job to wait on
+            timeout (float, optional): seconds; default `wait_timeout`, capped at `max_wait`
+
+        Returns:
+            object: job result, None for a job another worker finished
+                (its callback has stored the output)
+
+        Raises:
+            exceptions.JobPending: job still running after `timeout`
+            exceptions.JobFailed: another worker's job failed
+            Exception: whatever the job raised
+
+        """
+        timeout = self.wait_timeout if timeout is None else timeout
+        timeout = max(0.0, min(float(timeout), self.max_wait))
+        if job.future is not None:
+            try:
+                return job.future.result(timeout=timeout)
+            except FutureTimeout:
+                raise exceptions.JobPending(job.job_id)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            status = job.status()
+            if status == 'done':
+                return None
+            if status == 'failed':
+                raise exceptions.JobFailed(job.job_id, job.error)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise exceptions.JobPending(job.job_id)
+            time.sleep(min(self.poll_interval, remaining))
+
+    def shutdown(self):
+        """stop the pool, forget in-flight jobs"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._active = {}
+        if executor is not None and self._pid == getpid():
+            executor.shutdown(wait=False)
+
+FORECAST_JOBS = JobQueue()
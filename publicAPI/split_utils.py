@@ -7,12 +7,13 @@ import logging
 import ujson as json
 import pandas as pd
 import numpy as np
-from tinydb import TinyDB, Query
 
+import publicAPI.cache_utils as cache_utils
 import publicAPI.config as api_config
 import publicAPI.crest_utils as crest_utils
 import publicAPI.forecast_utils as forecast_utils
 import publicAPI.exceptions as exceptions
+import publicAPI.http_utils as http_utils
 
 HERE = path.abspath(path.dirname(__file__))
 class SplitInfo(object):
@@ -194,36 +195,21 @@ def fetch_split_cache_data(
         type_id (int): EVE Online type id
         keep_colums (list): sort columns to keep in DataFrame
     Returns:
-        pandas.DataFrame: pandas collection of data
+        pandas.DataFrame: pandas collection of data (see `crest_utils.normalize_history`)
             ['date', 'avgPrice', 'highPrice', 'lowPrice', 'volume', 'orders']
 
     """
-    print(api_config.SPLIT_CACHE_FILE)
-    db_handle = TinyDB(api_config.SPLIT_CACHE_FILE)
-
-    if split_date:
-        split_data = db_handle.search(
-            (Query().region_id == int(region_id)) &
-            (Query().type_id == int(type_id)) &
-            (Query().date <= split_date)
-        )
-    else:
-        split_data = db_handle.search(
-            (Query().region_id == int(region_id)) &
-            (Query().type_id == int(type_id))
-        )
-    if not split_data:
-        raise exceptions.NoSplitDataFound()
-
-    split_data = pd.DataFrame(split_data)
-    split_data = split_data[keep_columns]
-    split_data.sort_values(
-        by='date',
-        ascending=False,
-        inplace=True
+    split_data = cache_utils.read_split_history(
+        region_id,
+        type_id,
+        api_config.SPLIT_CACHE_FILE,
+        split_date=split_date,
+        keep_columns=keep_columns
     )
+    if split_data.empty:
+        raise exceptions.NoSplitDataFound()
 
-    return split_data
+    return crest_utils.normalize_history(split_data)
 
 def combine_split_history(
         current_data,
@@ -238,25 +224,18 @@ def combine_split_history(
         keep_columns (:obj:`list`, optional): expected headers/columns for dataframe
 
     Returns:
-        pandas.DataFrame: combined data
+        pandas.DataFrame: combined data, oldest first
 
     """
-    current_data['date'] = pd.to_datetime(current_data['date']).dt.strftime('%Y-%m-%d')
     max_cache_date = split_data['date'].max()
 
-    current_data = current_data[current_data.date > max_cache_date]
-    current_data = current_data[keep_columns]
-    current_data = current_data.append(
-        split_data,
+    current_data = current_data.loc[current_data.date > max_cache_date, keep_columns]
+    combined_data = pd.concat(
+        [split_data[keep_columns], current_data],
         ignore_index=True
     )
-    current_data.sort_values(
-        by='date',
-        ascending=False,
-        inplace=True
-    )
 
-    return current_data
+    return combined_data
 
 PRICE_KEYS = ['avgPrice', 'highPrice', 'lowPrice']
 VOLUME_KEYS = ['volume', 'orders']
@@ -275,21 +254,16 @@ def execute_split(
         volume_keys (:obj:`list`, optional): volume columns
 
     Returns:
-        pandas.DataFrame: updated dataframe
+        pandas.DataFrame: updated dataframe (divided volume_keys come back float64)
 
     """
-    # vv FIXME vv: serial access to recast dataframe #
-    split_cols = list(price_keys)
-    split_cols.extend(volume_keys)
-    for key in split_cols:
-        split_dataframe[key] = pd.to_numeric(split_dataframe[key])
-    # ^^ FIXME ^^ #
-
-    split_dataframe[price_keys] = split_dataframe[price_keys] * split_obj
-    split_dataframe[volume_keys] = split_dataframe[volume_keys] / split_obj
+    ## call through directly: `frame * split_obj` goes elementwise to object dtype ##
+    split_dataframe[price_keys] = split_obj.multiply(split_dataframe[price_keys])
+    split_dataframe[volume_keys] = split_obj.divide(split_dataframe[volume_keys])
 
     return split_dataframe
 
+@http_utils.coalesce('region_id', 'type_id', 'fetch_source', 'data_range')
 def fetch_split_history(
         region_id,
         type_id,
@@ -335,7 +309,10 @@ def fetch_split_history(
             data_range=data_range,
             config=config,
         )
-        current_data = forecast_utils.parse_emd_data(current_data['result'])
+        current_data = crest_utils.normalize_history(
+            forecast_utils.parse_emd_data(current_data['result']),
+            logger=logger
+        )
     else:
         logger.info('--CCP fetch')
         current_data = crest_utils.fetch_market_history(
@@ -346,7 +323,7 @@ def fetch_split_history(
         )
 
     ## Early exit: split too old or hasn't happened yet ##
-    min_date = datetime_helper(current_data['date'].min())
+    min_date = current_data['date'].min()
     if min_date > split_obj.split_date or not bool(split_obj):
         #split is too old OR split hasn't happened yet
         logger.info('No split work -- Returning current pull')
@@ -0,0 +1,238 @@
+"""benchmark_forecast.py: cold vs warm-started prophet fits over a replayed history"""
+from os import path
+import logging
+import time
+
+from plumbum import cli
+import numpy as np
+import pandas as pd
+
+import prosper.common.prosper_logging as p_logging
+import publicAPI.config as api_config
+import publicAPI.crest_utils as crest_utils
+import publicAPI.forecast_utils as forecast_utils
+HERE = path.abspath(path.dirname(__file__))
+ROOT = path.dirname(HERE)
+
+SAMPLE_DATA = path.join(ROOT, 'tests', 'sample_emd_data.csv')
+PROGNAME = 'benchmark_forecast'
+
+REPORT_COLUMNS = [
+    'day', 'rows', 'cold_seconds', 'warm_seconds', 'warm', 'max_drift', 'mean_drift'
+]
+PRECISION_COLUMNS = ['precision', 'samples', 'seconds', 'band_error', 'yhat_error']
+
+def replay_history(
+        data,
+        days,
+        forecast_range,
+        logger=logging.getLogger(PROGNAME)
+):
+    """refit the last `days` days of `data` one row at a time, cold and warm
+
+    Notes:
+        each day's warm fit is seeded from the previous day's warm fit,
+        the way `ProphetEndpoint` chains them through the cache.
+        Drift is |yhat_warm - yhat_cold| / |yhat_cold| over the forecast rows
+
+    Args:
+        data (:obj:`pandas.DataFrame`): market history (oldest first)
+        days (int): days to replay
+        forecast_range (int): days to forecast
+        logger (:obj:`logging.logger`): logging handle
+
+    Returns:
+        pandas.DataFrame: per-day report (`REPORT_COLUMNS`)
+
+    """
+    rows = []
+    stored = None
+    for day in range(days, 0, -1):
+        history = data.iloc[:len(data.index) - day + 1].copy()
+
+        start_time = time.perf_counter()
+        cold_report, _ = forecast_utils.fit_forecast(history.copy(), forecast_range)
+        cold_seconds = time.perf_counter() - start_time
+
+        warm_start = forecast_utils.warm_start_params(stored, history)
+        start_time = time.perf_counter()
+        warm_report, stored = forecast_utils.fit_forecast(
+            history.copy(), forecast_range, warm_start=warm_start
+        )
+        warm_seconds = time.perf_counter() - start_time
+
+        future = cold_report['prediction'].values
+        cold_yhat = cold_report['yhat'].values[future]
+        drift = np.abs(warm_report['yhat'].values[future] - cold_yhat) / np.abs(cold_yhat)
+        rows.append({
+            'day': history['date'].max().strftime('%Y-%m-%d'),
+            'rows': len(history.index),
+            'cold_seconds': cold_seconds,
+            'warm_seconds': warm_seconds,
+            'warm': stored['warm'],
+            'max_drift': drift.max(),
+            'mean_drift': drift.mean(),
+        })
+        logger.info(
+            '%s: cold %.2fs warm %.2fs drift %.4f%%',
+            rows[-1]['day'], cold_seconds, warm_seconds, 100 * rows[-1]['max_drift']
+        )
+
+    return pd.DataFrame(rows, columns=REPORT_COLUMNS)
+
+def compare_precision(
+        data,
+        forecast_range,
+        repeats=3,
+        logger=logging.getLogger(PROGNAME)
+):
+    """time `fit_forecast` at each precision mode against `full`
+
+    Notes:
+        band_error is mean |width - full width| / full width and yhat_error
+        max |yhat - full yhat| / |full yhat|, both over the forecast rows.
+        `full` is sampled too, so it is compared against its own first run
+
+    Args:
+        data (:obj:`pandas.DataFrame`): market history (oldest first)
+        forecast_range (int): days to forecast
+        repeats (int, optional): fits per mode (seconds are the mean)
+        logger (:obj:`logging.logger`): logging handle
+
+    Returns:
+        pandas.DataFrame: per-mode report (`PRECISION_COLUMNS`)
+
+    """
+    rows = []
+    baseline = None
+    for precision in forecast_utils.PRECISION_MODES:
+        samples = forecast_utils.precision_samples(precision)
+        timings = []
+        reports = []
+        for _ in range(max(1, repeats)):
+            start_time = time.perf_counter()
+            report, _ = forecast_utils.fit_forecast(
+                data.copy(), forecast_range, uncertainty_samples=samples
+            )
+            timings.append(time.perf_counter() - start_time)
+            reports.append(report.loc[report['prediction']])
+        if baseline is None:
+            baseline = reports.pop(0)
+            if not reports:
+                reports = [baseline]
+        report = reports[-1]
+
+        base_width = (baseline['yhat_high'] - baseline['yhat_low']).values
+        width = (report['yhat_high'] - report['yhat_low']).values
+        rows.append({
+            'precision': precision,
+            'samples': 'default' if samples is None else samples,
+            'seconds': np.mean(timings),
+            'band_error': np.mean(np.abs(width - base_width) / base_width),
+            'yhat_error': np.max(
+                np.abs(report['yhat'].values - baseline['yhat'].values) /
+                np.abs(baseline['yhat'].values)
+            ),
+        })
+        logger.info(
+            '%s: %.2fs band error %.2f%%',
+            precision, rows[-1]['seconds'], 100 * rows[-1]['band_error']
+        )
+
+    return pd.DataFrame(rows, columns=PRECISION_COLUMNS)
+
+class BenchmarkForecast(cli.Application):
+    """Compares cold and warm-started prophet fits on a replayed history"""
+    __log_builder = p_logging.ProsperLogger(
+        PROGNAME,
+        HERE
+    )
+    @cli.switch(
+        ['v', '--verbose'],
+        help='Enable verbose messaging'
+    )
+    def enable_verbose(self):
+        """toggle verbose logger"""
+        self.__log_builder.configure_debug_logger()
+
+    data_path = SAMPLE_DATA
+    @cli.switch(
+        ['i', '--input'],
+        str,
+        help='market history .csv (date, avgPrice, ...)')
+    def override_data_path(self, data_path):
+        """override input history"""
+        self.data_path = data_path
+
+    days = 10
+    @cli.switch(
+        ['n', '--days'],
+        int,
+        help='days to replay')
+    def override_days(self, days):
+        """override replay length"""
+        self.days = days
+
+    forecast_range = 60
+    @cli.switch(
+        ['r', '--range'],
+        int,
+        help='days to forecast')
+    def override_forecast_range(self, forecast_range):
+        """override forecast range"""
+        self.forecast_range = forecast_range
+
+    precision = cli.Flag(
+        ['p', '--precision'],
+        help='also time each precision mode (full/fast/map)'
+    )
+    @cli.switch(
+        ['s', '--samples'],
+        int,
+        help='uncertainty samples for `fast` precision')
+    def override_samples(self, samples):
+        """override fast-mode sample count"""
+        api_config.UNCERTAINTY_SAMPLES = samples
+
+    report_path = ''
+    @cli.switch(
+        ['--report'],
+        str,
+        help='write per-day report to .csv')
+    def override_report_path(self, report_path):
+        """override report path"""
+        self.report_path = report_path
+
+    def main(self):
+        """application runtime"""
+        logger = self.__log_builder.logger
+
+        data = pd.read_csv(self.data_path)
+        if 'regionid' in data.columns:
+            data = data.loc[data['regionid'] == data['regionid'].iloc[0]]
+        data = crest_utils.normalize_history(data[crest_utils.HISTORY_COLUMNS], logger=logger)
+        logger.info('replaying %d of %d days', self.days, len(data.index))
+
+        report = replay_history(data, self.days, self.forecast_range, logger=logger)
+        warm_days = report.loc[report['warm']]
+        logger.info(
+            'cold fit: %.2fs mean, warm fit: %.2fs mean (%d/%d days warm, %.1f%% faster)',
+            report['cold_seconds'].mean(),
+            warm_days['warm_seconds'].mean(),
+            len(warm_days.index), len(report.index),
+            100 * (1 - warm_days['warm_seconds'].sum() / warm_days['cold_seconds'].sum())
+        )
+        logger.info(
+            'forecast drift: %.4f%% mean, %.4f%% worst',
+            100 * report['mean_drift'].mean(), 100 * report['max_drift'].max()
+        )
+        if self.report_path:
+            report.to_csv(self.report_path, index=False)
+            logger.info('wrote report to %s', self.report_path)
+
+        if self.precision:
+            precision_report = compare_precision(data, self.forecast_range, logger=logger)
+            logger.info('precision modes:\n%s', precision_report.to_string(index=False))
+
+if __name__ == '__main__':
+    BenchmarkForecast.run()
@@ -5,13 +5,13 @@ from enum import Enum
 import logging
 import warnings
 
-from tinydb import TinyDB, Query
 from plumbum import cli
 import pandas as pd
 import ujson as json
 
 import prosper.common.prosper_logging as p_logging
 import prosper.common.prosper_config as p_config
+import publicAPI.cache_utils as cache_utils
 import publicAPI.crest_utils as crest_utils
 import publicAPI.forecast_utils as forecast_utils
 import publicAPI.config as api_utils
@@ -23,73 +23,7 @@ CONFIG = p_config.ProsperConfig(path.join(HERE, 'app.cfg'))
 makedirs(CACHE_PATH, exist_ok=True)
 PROGNAME = 'splitcache_helper'
 
-REGION_LIST = [
-    10000001,   #'Derelik',
-    10000002,   #'The Forge',
-    10000003,   #'Vale of the Silent',
-    10000005,   #'Detorid',
-    10000006,   #'Wicked Creek',
-    10000007,   #'Cache',
-    10000008,   #'Scalding Pass',
-    10000009,   #'Insmother',
-    10000010,   #'Tribute',
-    10000011,   #'Great Wildlands',
-    10000012,   #'Curse',
-    10000013,   #'Malpais',
-    10000014,   #'Catch',
-    10000015,   #'Venal',
-    10000016,   #'Lonetrek',
-    10000018,   #'The Spire',
-    10000020,   #'Tash-Murkon',
-    10000021,   #'Outer Passage',
-    10000022,   #'Stain',
-    10000023,   #'Pure Blind',
-    10000025,   #'Immensea',
-    10000027,   #'Etherium Reach',
-    10000028,   #'Molden Heath',
-    10000029,   #'Geminate',
-    10000030,   #'Heimatar',
-    10000031,   #'Impass',
-    10000032,   #'Sinq Liaison',
-    10000033,   #'The Citadel',
-    10000034,   #'The Kalevala Expanse',
-    10000035,   #'Deklein',
-    10000036,   #'Devoid',
-    10000037,   #'Everyshore',
-    10000038,   #'The Bleak Lands',
-    10000039,   #'Esoteria',
-    10000040,   #'Oasa',
-    10000041,   #'Syndicate',
-    10000042,   #'Metropolis',
-    10000043,   #'Domain',
-    10000044,   #'Solitude',
-    10000045,   #'Tenal',
-    10000046,   #'Fade',
-    10000047,   #'Providence',
-    10000048,   #'Placid',
-    10000049,   #'Khanid',
-    10000050,   #'Querious',
-    10000051,   #'Cloud Ring',
-    10000052,   #'Kador',
-    10000053,   #'Cobalt Edge',
-    10000054,   #'Aridia',
-    10000055,   #'Branch',
-    10000056,   #'Feythabolis',
-    10000057,   #'Outer Ring',
-    10000058,   #'Fountain',
-    10000059,   #'Paragon Soul',
-    10000060,   #'Delve',
-    10000061,   #'Tenerifis',
-    10000062,   #'Omist',
-    10000063,   #'Period Basis',
-    10000064,   #'Essence',
-    10000065,   #'Kor-Azor',
-    10000066,   #'Perrigen Falls',
-    10000067,   #'Genesis',
-    10000068,   #'Verge Vendor',
-    10000069,   #'Black Rise',
-    #11000031,   #'Thera'
-]
+REGION_LIST = api_utils.REGION_LIST
 
 class DataSources(Enum):
     SQL = 'sql'
@@ -213,7 +147,7 @@ def write_to_cache_file(
         region_id=0,
         logger=logging.getLogger(PROGNAME)
 ):
-    """save data to tinyDB
+    """save data to split cache db
 
     Args:
         data (:obj:`pandas.DataFrame`): data to write out
@@ -226,28 +160,17 @@ def write_to_cache_file(
         None
 
     """
-    ## get DB ##
     logger.info('Writing data to cache')
-    tdb = TinyDB(cache_path)
-
-    date_min = data['date'].min()
-    logger.debug(date_min)
-    ## clean out existing entries ##
     if (type_id and region_id):
         logger.info('--Removing old cache entries')
-        tdb.remove(
-            (Query().region_id == region_id) &
-            (Query().type_id == type_id) &
-            (Query().date >= date_min)
-        )
 
-    caching_data_str = data.to_json(
-        date_format='iso',
-        orient='records'
-    )
-    cache_data = json.loads(caching_data_str)
     logger.info('--Writing to cache file')
-    tdb.insert_multiple(cache_data)
+    cache_utils.write_split_history(
+        data,
+        cache_path,
+        type_id=type_id,
+        region_id=region_id
+    )
 
 class SplitCache(cli.Application):
     """Seeds a splitcache file for research purposes"""
@@ -290,7 +213,7 @@ class SplitCache(cli.Application):
         """override data_source from user"""
         self.data_source = DataSources(data_source.lower())
 
-    cache_path = path.join(CACHE_PATH, 'splitcache.json')
+    cache_path = path.join(CACHE_PATH, 'splitcache.db')
     @cli.switch(
         ['c', '--db'],
         str,
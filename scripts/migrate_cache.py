@@ -0,0 +1,52 @@
+"""migrate_cache.py: one-shot move of legacy tinydb caches into sqlite"""
+from os import path, makedirs
+import logging
+
+from plumbum import cli
+
+import prosper.common.prosper_logging as p_logging
+import publicAPI.cache_utils as cache_utils
+HERE = path.abspath(path.dirname(__file__))
+ROOT = path.dirname(HERE)
+
+CACHE_PATH = path.join(ROOT, 'publicAPI', 'cache')
+makedirs(CACHE_PATH, exist_ok=True)
+PROGNAME = 'migrate_cache'
+
+class MigrateCache(cli.Application):
+    """Copies tinydb cache files (cache/*.json) into sqlite cache dbs"""
+    __log_builder = p_logging.ProsperLogger(
+        PROGNAME,
+        HERE
+    )
+    @cli.switch(
+        ['v', '--verbose'],
+        help='Enable verbose messaging'
+    )
+    def enable_verbose(self):
+        """toggle verbose logger"""
+        self.__log_builder.configure_debug_logger()
+
+    cache_path = CACHE_PATH
+    @cli.switch(
+        ['c', '--cache'],
+        str,
+        help='path to alternate cache folder')
+    def override_cache_path(self, cache_path):
+        """override cache path"""
+        self.cache_path = cache_path
+
+    def main(self):
+        """application runtime"""
+        logger = self.__log_builder.logger
+
+        logger.info('hello world')
+        report = cache_utils.migrate_tinydb_caches(
+            cache_path=self.cache_path,
+            logger=logger
+        )
+        for filename, count in report.items():
+            logger.info('migrated %s: %d rows', filename, count)
+
+if __name__ == '__main__':
+    MigrateCache.run()
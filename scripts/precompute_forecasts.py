@@ -0,0 +1,327 @@
+"""precompute_forecasts.py: nightly batch fill of the prophet prediction cache"""
+from os import path, makedirs, cpu_count
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import logging
+import time
+
+from plumbum import cli
+import pandas as pd
+
+import prosper.common.prosper_logging as p_logging
+import prosper.common.prosper_config as p_config
+import publicAPI.cache_utils as cache_utils
+import publicAPI.config as api_config
+import publicAPI.forecast_utils as forecast_utils
+import publicAPI.http_utils as http_utils
+import publicAPI.split_utils as split_utils
+HERE = path.abspath(path.dirname(__file__))
+ROOT = path.dirname(HERE)
+
+CACHE_PATH = path.join(ROOT, 'publicAPI', 'cache')
+CONFIG = p_config.ProsperConfig(path.join(HERE, 'app.cfg'))
+makedirs(CACHE_PATH, exist_ok=True)
+PROGNAME = 'forecast_precompute'
+
+REPORT_COLUMNS = [
+    'region_id', 'type_id', 'status', 'warm', 'fetch_seconds', 'fit_seconds', 'rows', 'error'
+]
+
+def build_pairs(
+        region_list,
+        type_list,
+        top_n=0,
+        since_date=None,
+        db_path=path.join(CACHE_PATH, cache_utils.CACHE_DB),
+        logger=logging.getLogger(PROGNAME)
+):
+    """collect (region_id, type_id) pairs to forecast
+
+    Args:
+        region_list (:obj:`list`): region_ids to cross with `type_list`
+        type_list (:obj:`list`): type_ids to cross with `region_list`
+        top_n (int, optional): add the `top_n` most requested pairs
+        since_date (str, optional): %Y-%m-%d first day of access counts
+        db_path (str, optional): cache db holding access counts
+        logger (:obj:`logging.logger`): logging handle
+
+    Returns:
+        list: unique pairs, explicit lists first then by demand
+
+    """
+    pairs = [(int(region_id), int(type_id)) for region_id in region_list for type_id in type_list]
+    if top_n:
+        top_pairs = cache_utils.read_top_accessed('prophet', top_n, since_date, db_path=db_path)
+        logger.info('--%d hot pairs since %s', len(top_pairs), since_date)
+        pairs.extend((region_id, type_id) for region_id, type_id, _ in top_pairs)
+
+    return list(dict.fromkeys(pairs))
+
+def fetch_history(
+        region_id,
+        type_id,
+        logger=logging.getLogger(PROGNAME)
+):
+    """fetch forecast input the way `ProphetEndpoint` does
+
+    Args:
+        region_id (int): EVE Online region_id
+        type_id (int): EVE Online type_id
+        logger (:obj:`logging.logger`): logging handle
+
+    Returns:
+        pandas.DataFrame: market history
+
+    """
+    if type_id in api_config.SPLIT_INFO:
+        return split_utils.fetch_split_history(
+            region_id,
+            type_id,
+            data_range=api_config.MAX_RANGE,
+            config=CONFIG,
+            logger=logger,
+        )
+    return forecast_utils.fetch_extended_history(
+        region_id,
+        type_id,
+        data_range=api_config.MAX_RANGE,
+        config=CONFIG,
+        logger=logger,
+    )
+
+def timed_forecast(
+        data,
+        forecast_range,
+        warm_start=None,
+        uncertainty_samples=None,
+        pair=(None, None),
+):
+    """`fit_forecast` plus its runtime (runs in worker processes)
+
+    Returns:
+        ((:obj:`pandas.DataFrame`, dict), float): `fit_forecast` result, seconds spent fitting
+
+    """
+    start_time = time.perf_counter()
+    result = forecast_utils.fit_forecast(
+        data, forecast_range,
+        warm_start=warm_start,
+        uncertainty_samples=uncertainty_samples,
+        region_id=pair[0],
+        type_id=pair[1],
+    )
+    return result, time.perf_counter() - start_time
+
+def precompute(
+        pairs,
+        workers=None,
+        max_concurrency=8,
+        batch_size=50,
+        warm_start=True,
+        precision='full',
+        debug=False,
+        logger=logging.getLogger(PROGNAME)
+):
+    """fetch histories on threads, fit on processes, bulk-write results
+
+    Args:
+        pairs (:obj:`list`): (region_id, type_id) pairs to forecast
+        workers (int, optional): fitting processes (default: all cores)
+        max_concurrency (int, optional): history fetch threads
+        batch_size (int, optional): forecasts per cache transaction
+        warm_start (bool, optional): seed fits from yesterday's parameters
+        precision (str, optional): band precision (forecast_utils.PRECISION_MODES)
+        debug (bool, optional): skip cache writes
+        logger (:obj:`logging.logger`): logging handle
+
+    Returns:
+        pandas.DataFrame: per-pair report (`REPORT_COLUMNS`)
+
+    """
+    report = {pair: {'region_id': pair[0], 'type_id': pair[1]} for pair in pairs}
+    pending = {}
+    model_key = forecast_utils.cache_model_key('prophet', precision)
+    samples = forecast_utils.precision_samples(precision)
+    def flush():
+        """write finished forecasts in one transaction"""
+        if pending and not debug:
+            forecast_utils.write_forecast_caches(pending, model=model_key, logger=logger)
+        pending.clear()
+
+    def fetch_pair(pair):
+        """timed history fetch"""
+        start_time = time.perf_counter()
+        data = fetch_history(pair[0], pair[1], logger=logger)
+        return data, time.perf_counter() - start_time
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=workers or cpu_count()) as fit_pool:
+        fetches = {fetch_pool.submit(fetch_pair, pair): pair for pair in pairs}
+        fits = {}
+        for future in as_completed(fetches):
+            pair = fetches[future]
+            try:
+                data, report[pair]['fetch_seconds'] = future.result()
+            except Exception as err_msg:
+                logger.warning('--unable to fetch %s: %r', pair, err_msg)
+                report[pair].update(status='fetch_failed', error=repr(err_msg))
+                continue
+            init = None
+            if warm_start:
+                init = forecast_utils.load_warm_start(pair[0], pair[1], data)
+            fits[fit_pool.submit(
+                timed_forecast, data, api_config.MAX_RANGE, init, samples, pair
+            )] = pair
+
+        for future in as_completed(fits):
+            pair = fits[future]
+            done += 1
+            try:
+                result, report[pair]['fit_seconds'] = future.result()
+            except Exception as err_msg:
+                logger.warning('--unable to forecast %s: %r', pair, err_msg)
+                report[pair].update(status='fit_failed', error=repr(err_msg))
+                continue
+            report[pair].update(status='ok', warm=result[1]['warm'], rows=len(result[0].index))
+            pending[pair] = result
+            logger.info('--%d/%d forecasts done (%s)', done, len(fits), pair)
+            if len(pending) >= batch_size:
+                flush()
+    flush()
+
+    return pd.DataFrame(list(report.values()), columns=REPORT_COLUMNS)
+
+class PrecomputeForecasts(cli.Application):
+    """Fills today's prophet prediction cache ahead of requests"""
+    __log_builder = p_logging.ProsperLogger(
+        PROGNAME,
+        HERE
+    )
+    debug = cli.Flag(
+        ['d', '--debug'],
+        help='debug mode: do not write to live database'
+    )
+    force = cli.Flag(
+        ['f', '--force'],
+        help='refit pairs already cached today'
+    )
+    @cli.switch(
+        ['v', '--verbose'],
+        help='Enable verbose messaging'
+    )
+    def enable_verbose(self):
+        """toggle verbose logger"""
+        self.__log_builder.configure_debug_logger()
+
+    region_list = [
+        int(region_id) for region_id in CONFIG.get_option(
+            'FORECAST', 'precompute_regions', args_default='10000002').split(',')
+    ]
+    @cli.switch(
+        ['--regions'],
+        str,
+        help='list of regions to forecast (`all` for every region)')
+    def override_region_list(self, region_str):
+        """override region list from user"""
+        if region_str == 'all':
+            self.region_list = api_config.REGION_LIST
+        else:
+            self.region_list = list(map(int, region_str.split(',')))
+
+    type_list = []
+    @cli.switch(
+        ['t', '--types'],
+        str,
+        help='list of typeIDs to forecast in every region')
+    def override_type_list(self, type_str):
+        """override type list from user"""
+        self.type_list = list(map(int, type_str.split(',')))
+
+    top_n = int(CONFIG.get_option('FORECAST', 'precompute_top', args_default=0))
+    @cli.switch(
+        ['n', '--top'],
+        int,
+        help='also forecast the N most requested pairs')
+    def override_top_n(self, top_n):
+        """override top-N from user"""
+        self.top_n = top_n
+
+    workers = None
+    @cli.switch(
+        ['w', '--workers'],
+        int,
+        help='fitting processes (default: all cores)')
+    def override_workers(self, workers):
+        """override worker count"""
+        self.workers = workers
+
+    report_path = ''
+    @cli.switch(
+        ['r', '--report'],
+        str,
+        help='write per-pair timing report to .csv')
+    def override_report_path(self, report_path):
+        """override report path"""
+        self.report_path = report_path
+
+    def main(self):
+        """application runtime"""
+        logger = self.__log_builder.logger
+
+        logger.info('hello world')
+        api_config.CONFIG = CONFIG
+        api_config.load_globals(CONFIG)
+        api_config.SPLIT_INFO = split_utils.read_split_info(logger=logger)
+        http_utils.SESSIONS.configure(CONFIG)
+        http_utils.RATE_LIMITER.configure(CONFIG)
+        http_utils.RETRY_POLICY.configure(CONFIG)
+
+        access_window = int(CONFIG.get_option('FORECAST', 'access_window', args_default=7))
+        since_date = (datetime.utcnow() - timedelta(days=access_window)).strftime('%Y-%m-%d')
+        cache_utils.prune_access_counts(since_date)
+        http_cache_keep = int(CONFIG.get_option('CACHING', 'http_cache_keep', args_default=604800))
+        pruned = cache_utils.prune_http_cache(datetime.utcnow().timestamp() - http_cache_keep)
+        logger.info('--pruned %d stale ESI responses', pruned)
+        pairs = build_pairs(
+            self.region_list,
+            self.type_list,
+            top_n=self.top_n,
+            since_date=since_date,
+            logger=logger
+        )
+        if not self.force:
+            pairs = [
+                pair for pair in pairs
+                if forecast_utils.check_prediction_cache(
+                    *pair,
+                    model=forecast_utils.cache_model_key('prophet', api_config.PRECISION)
+                ) is None
+            ]
+        logger.info('forecasting %d pairs', len(pairs))
+
+        start_time = time.perf_counter()
+        report = precompute(
+            pairs,
+            workers=self.workers,
+            max_concurrency=int(CONFIG.get_option('HTTP', 'max_concurrency', args_default=8)),
+            warm_start=api_config.WARM_START,
+            precision=api_config.PRECISION,
+            debug=self.debug,
+            logger=logger
+        )
+        logger.info(
+            'done in %.1fs: %s',
+            time.perf_counter() - start_time,
+            report['status'].value_counts().to_dict()
+        )
+        logger.info(
+            'slowest fits:\n%s',
+            report.sort_values('fit_seconds', ascending=False).head(5).to_string(index=False)
+        )
+        if self.report_path:
+            report.to_csv(self.report_path, index=False)
+            logger.info('wrote report to %s', self.report_path)
+
+if __name__ == '__main__':
+    PrecomputeForecasts.run()
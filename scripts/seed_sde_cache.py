@@ -0,0 +1,200 @@
+"""seed_sde_cache.py: bulk-load region/type validation caches from a Static Data Export"""
+from os import path, makedirs
+from datetime import datetime, timedelta
+import logging
+import sqlite3
+
+from plumbum import cli
+import pandas as pd
+
+import prosper.common.prosper_logging as p_logging
+import publicAPI.cache_utils as cache_utils
+HERE = path.abspath(path.dirname(__file__))
+ROOT = path.dirname(HERE)
+
+CACHE_PATH = path.join(ROOT, 'publicAPI', 'cache')
+makedirs(CACHE_PATH, exist_ok=True)
+PROGNAME = 'sde_seeder'
+
+try:    #pragma: no cover
+    import yaml
+except ImportError:
+    yaml = None
+
+## SDE table name: (endpoint_name, {sde column: ESI key}) ##
+SDE_TABLES = {
+    'mapRegions': ('map_regions', {
+        'regionID': 'region_id',
+        'regionName': 'name',
+        'description': 'description',
+    }),
+    'invTypes': ('inventory_types', {
+        'typeID': 'type_id',
+        'typeName': 'name',
+        'description': 'description',
+        'groupID': 'group_id',
+        'marketGroupID': 'market_group_id',
+        'volume': 'volume',
+        'mass': 'mass',
+        'capacity': 'capacity',
+        'portionSize': 'portion_size',
+        'published': 'published',
+    }),
+}
+
+def read_yaml_table(yaml_filepath, id_key):
+    """read a SDE yaml dump into a table
+
+    Notes:
+        handles both list-of-rows (bsd) and {id: row} (fsd) layouts
+        localized names ({'en': name}) are flattened to english
+
+    Args:
+        yaml_filepath (str): path to .yaml file
+        id_key (str): SDE id column (typeID/regionID)
+
+    Returns:
+        pandas.DataFrame: SDE table
+
+    """
+    if yaml is None:
+        raise ImportError('PyYAML required to read {0}'.format(yaml_filepath))
+
+    with open(yaml_filepath, 'r') as yaml_fh:
+        raw_data = yaml.load(yaml_fh, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+    if isinstance(raw_data, dict):
+        raw_data = [dict(row, **{id_key: key}) for key, row in raw_data.items()]
+
+    data = pd.DataFrame(raw_data)
+    if 'name' in data.columns and id_key == 'typeID':
+        data['typeName'] = data['name']
+    if 'name' in data.columns and id_key == 'regionID':
+        data['regionName'] = data['name']
+    for column in data.columns:
+        data[column] = data[column].map(
+            lambda value: value.get('en') if isinstance(value, dict) else value
+        )
+
+    return data
+
+def read_sde_table(
+        sde_path,
+        table_name,
+        logger=logging.getLogger(PROGNAME)
+):
+    """read one SDE table from a sqlite dump or a folder of csv/yaml files
+
+    Args:
+        sde_path (str): path to .sqlite dump or folder with <table_name>.csv/.yaml
+        table_name (str): SDE table name (`SDE_TABLES` keys)
+        logger (:obj:`logging.logger`): logging handle
+
+    Returns:
+        pandas.DataFrame: SDE table
+
+    """
+    id_key = next(iter(SDE_TABLES[table_name][1]))
+    if path.isfile(sde_path):
+        logger.info('--reading %s from sqlite: %s', table_name, sde_path)
+        conn = sqlite3.connect(sde_path)
+        try:
+            return pd.read_sql_query('SELECT * FROM {0}'.format(table_name), conn)
+        finally:
+            conn.close()
+
+    for extension in ('.csv', '.yaml'):
+        table_filepath = path.join(sde_path, table_name + extension)
+        if not path.isfile(table_filepath):
+            continue
+        logger.info('--reading %s', table_filepath)
+        if extension == '.csv':
+            return pd.read_csv(table_filepath)
+        return read_yaml_table(table_filepath, id_key)
+
+    raise FileNotFoundError('No {0} table found in {1}'.format(table_name, sde_path))
+
+def build_payloads(data, column_map):
+    """recast SDE rows into ESI-shaped payloads
+
+    Args:
+        data (:obj:`pandas.DataFrame`): SDE table
+        column_map (:obj:`dict`): SDE column:ESI key
+
+    Returns:
+        list: (index_key, payload) pairs
+
+    """
+    id_key = next(iter(column_map))
+    data = data[[column for column in column_map if column in data.columns]]
+    data = data.rename(columns=column_map)
+    data = data.astype(object).where(data.notnull(), None)
+
+    return [
+        (int(row[column_map[id_key]]), row)
+        for row in data.to_dict(orient='records')
+    ]
+
+class SeedSDECache(cli.Application):
+    """Seeds region/type validation caches from a Static Data Export dump"""
+    __log_builder = p_logging.ProsperLogger(
+        PROGNAME,
+        HERE
+    )
+    debug = cli.Flag(
+        ['d', '--debug'],
+        help='debug mode: do not write to live database'
+    )
+    @cli.switch(
+        ['v', '--verbose'],
+        help='Enable verbose messaging'
+    )
+    def enable_verbose(self):
+        """toggle verbose logger"""
+        self.__log_builder.configure_debug_logger()
+
+    cache_path = path.join(CACHE_PATH, cache_utils.CACHE_DB)
+    @cli.switch(
+        ['c', '--db'],
+        str,
+        help='path to alternate cache database')
+    def override_cache_path(self, cache_path):
+        """override cache path"""
+        self.cache_path = cache_path
+
+    lifetime = 365
+    @cli.switch(
+        ['l', '--lifetime'],
+        int,
+        help='days the seed should outlive `sde_cache_limit`')
+    def override_lifetime(self, lifetime):
+        """override seed lifetime"""
+        self.lifetime = lifetime
+
+    def main(self, sde_path):
+        """application runtime"""
+        logger = self.__log_builder.logger
+
+        logger.info('hello world')
+        endpoint_entries = {}
+        for table_name, (endpoint_name, column_map) in SDE_TABLES.items():
+            data = read_sde_table(sde_path, table_name, logger=logger)
+            endpoint_entries[endpoint_name] = build_payloads(data, column_map)
+            logger.info(
+                '--%s: %d ids', endpoint_name, len(endpoint_entries[endpoint_name])
+            )
+
+        if self.debug:
+            return
+
+        ## stamp into the future so SDE seeds outlive `sde_cache_limit` ##
+        seed_datetime = (datetime.utcnow() + timedelta(days=self.lifetime)).timestamp()
+        row_count = cache_utils.write_id_caches(
+            endpoint_entries,
+            db_path=self.cache_path,
+            cache_datetime=seed_datetime
+        )
+        logger.info('wrote %d ids to %s', row_count, self.cache_path)
+
+if __name__ == '__main__':
+    SeedSDECache.run()
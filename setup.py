@@ -135,7 +135,7 @@ setup(
         'publicAPI':[
             'split_info.json',
             'cache/prosperAPI.json',    #including key file for installer
-            'cache/splitcache.json',
+            'cache/splitcache.db',
         ]
     },
     python_requires='>=3.5',
@@ -150,13 +150,11 @@ setup(
         'cython>=0.24',         #intelpython3 == 0.24
         'matplotlib>=2.0.0',    #required for building fbprophet (intel==1.5.1)
         'pystan==2.15.0',
-        'fbprophet>=0.3.post1', #order matters: need pystan/cython first
-        'tinydb',
+        'fbprophet>=0.5',       #order matters: need pystan/cython first
         'tinymongo',
         'ujson',
         'plumbum',
         'shortuuid',
-        'retrying',
     ],
     tests_require=[
         'pytest',  # >=3.0.0,<3.2.0',
@@ -164,6 +162,10 @@ setup(
         'pytest-flask',
         'pymysql',
     ],
+    extras_require={
+        'brotli': ['brotli'],   #precompressed `br` responses
+        'msgpack': ['msgpack'], #msgpack output format
+    },
     cmdclass={
         'test':PyTest,
         'fast':FastTest,
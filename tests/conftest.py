@@ -13,7 +13,7 @@ import prosper.common.prosper_config as p_config
 HERE = path.abspath(path.dirname(__file__))
 ROOT = path.dirname(HERE)
 
-api_config.SPLIT_CACHE_FILE = path.join(ROOT, 'publicAPI', 'cache', 'travis_splitcache.json')
+api_config.SPLIT_CACHE_FILE = path.join(ROOT, 'publicAPI', 'cache', 'travis_splitcache.db')
 
 @pytest.fixture
 def app():
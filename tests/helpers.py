@@ -1,8 +1,11 @@
 """helpers.py: a collection of helpful utilities for tests"""
 from os import path, listdir, remove
 import configparser
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import json
+import threading
 
 from tinymongo import TinyMongoClient
 import pymysql.cursors
@@ -17,7 +20,13 @@ CONN = None
 SPECIAL_CACHE_FILES = [
     'prosperAPI.json',
     'splitcache.json',
-    'travis_splitcache.json'
+    'travis_splitcache.json',
+    'splitcache.db',
+    'travis_splitcache.db',
+    'splitcache.db-wal',
+    'travis_splitcache.db-wal',
+    'splitcache.db-shm',
+    'travis_splitcache.db-shm',
 ]
 SPECIAL_CACHE_COLLECTIONS = [
     'users'
@@ -148,3 +157,57 @@ def compare_dates(
     mismatch = set(rest_dates) - set(db_dates)
 
     return list(mismatch)
+
+class DummyESIHandler(BaseHTTPRequestHandler):
+    """keep-alive handler that echos the path as JSON
+
+    Notes:
+        sends `ETag`/`Expires` and answers `If-None-Match` with 304
+        `expires_in` seconds sets `Expires`, `hits` records each request.
+        Override `payload` to serve something else
+
+    """
+    protocol_version = 'HTTP/1.1'
+    expires_in = 60
+    hits = []
+    def payload(self):
+        """JSON-able response body"""
+        return {'path': self.path}
+
+    def do_GET(self):
+        body = json.dumps(self.payload()).encode()
+        etag = '"{0}"'.format(abs(hash(body)))
+        expires = datetime.now(timezone.utc) + timedelta(seconds=self.expires_in)
+        self.hits.append((self.path, self.headers.get('If-None-Match')))
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            body = b''
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Expires', format_datetime(expires, usegmt=True))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_dummy_server(handler=DummyESIHandler):
+    """launch local http server in a background thread
+
+    Args:
+        handler (:obj:`http.server.BaseHTTPRequestHandler`): request handler
+
+    Returns:
+        (:obj:`http.server.ThreadingHTTPServer`, str): server, base url
+
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True  #keep-alive clients don't block shutdown
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server, 'http://127.0.0.1:{0}/'.format(server.server_port)
@@ -0,0 +1,284 @@
+"""test_cache_utils.py: tests for cache_utils.py"""
+from os import path, makedirs, remove
+from datetime import datetime, timedelta
+import threading
+
+import pandas as pd
+import ujson as json
+import pytest
+
+import publicAPI.cache_utils as cache_utils
+import publicAPI.exceptions as exceptions
+import helpers
+
+HERE = path.abspath(path.dirname(__file__))
+ROOT = path.dirname(HERE)
+
+TEST_CACHE_PATH = path.join(HERE, 'cache')
+TEST_DB = path.join(TEST_CACHE_PATH, 'test_cache.db')
+TEST_SPLIT_DB = path.join(TEST_CACHE_PATH, 'test_splitcache.db')
+
+DEMO_HISTORY = pd.DataFrame({
+    'date': ['2017-01-01', '2017-01-02', '2017-01-03'],
+    'avgPrice': [5.5, 5.6, 5.7],
+    'highPrice': [6.0, 6.1, 6.2],
+    'lowPrice': [5.0, 5.1, 5.2],
+    'volume': [1000, 2000, 3000],
+    'orders': [10, 20, 30],
+    'type_id': 34,
+    'region_id': 10000002,
+    'data_source': 'ESI',
+    'cache_date': '2017-01-04',
+})
+
+def test_clear_caches():
+    """remove cache files for test"""
+    makedirs(TEST_CACHE_PATH, exist_ok=True)
+    helpers.clear_caches()
+
+def test_connect_fail():
+    """make sure bad paths raise the expected error"""
+    with pytest.raises(exceptions.CacheSetupFailure):
+        cache_utils.connect(TEST_CACHE_PATH)   #directory, not a file
+
+def test_connect_reuse():
+    """one connection per thread/db, reopened if the file goes away"""
+    reuse_db = path.join(TEST_CACHE_PATH, 'test_reuse.db')
+    conn = cache_utils.connect(reuse_db)
+    assert cache_utils.connect(reuse_db) is conn
+
+    remove(reuse_db)
+    new_conn = cache_utils.connect(reuse_db)
+    assert new_conn is not conn
+    assert new_conn.execute('SELECT COUNT(*) FROM response_cache').fetchone() == (0,)
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(cache_utils.connect(reuse_db)))
+    thread.start()
+    thread.join()
+    assert results[0] is not new_conn
+
+def test_id_cache():
+    """validate id_cache round trip"""
+    dummy_data = {'butts': 1, 'stuff': True}
+    assert cache_utils.read_id_cache('dummy_handle', db_path=TEST_DB) == {}
+
+    cache_utils.write_id_cache(
+        'dummy_handle',
+        [(999, dummy_data)],
+        db_path=TEST_DB
+    )
+    cache_data = cache_utils.read_id_cache('dummy_handle', db_path=TEST_DB)
+    cache_datetime, payload = cache_data[999]
+    assert payload == dummy_data
+
+    cache_utils.write_id_cache(
+        'dummy_handle',
+        [(999, dummy_data)],
+        db_path=TEST_DB
+    )
+    new_data = cache_utils.read_id_cache('dummy_handle', db_path=TEST_DB)
+    assert len(new_data) == 1
+    assert new_data[999][0] >= cache_datetime
+
+    assert cache_utils.read_id_cache('other_handle', db_path=TEST_DB) == {}
+
+    id_index = cache_utils.read_id_index('dummy_handle', db_path=TEST_DB)
+    assert id_index == {key: entry[0] for key, entry in new_data.items()}
+    for key, entry in new_data.items():
+        assert cache_utils.read_id_payload('dummy_handle', key, db_path=TEST_DB) == entry[1]
+    assert cache_utils.read_id_payload('dummy_handle', -1, db_path=TEST_DB) is None
+
+def test_http_cache_prune():
+    """stale ESI responses are pruned, fresh ones kept"""
+    now = datetime.utcnow().timestamp()
+    cache_utils.write_http_cache('http://stale', '[1]', now - 3600, etag='"1"', db_path=TEST_DB)
+    cache_utils.write_http_cache('http://recent', '[2]', now - 60, db_path=TEST_DB)
+    cache_utils.write_http_cache('http://fresh', '[3]', now + 3600, db_path=TEST_DB)
+
+    assert cache_utils.prune_http_cache(now - 600, db_path=TEST_DB) == 1
+    assert cache_utils.read_http_cache('http://stale', db_path=TEST_DB) is None
+    assert cache_utils.read_http_cache('http://recent', db_path=TEST_DB)['body'] == '[2]'
+    assert cache_utils.read_http_cache('http://fresh', db_path=TEST_DB)['body'] == '[3]'
+
+def test_prediction_cache():
+    """validate forecast_cache replaces stale entries, per model"""
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    yesterday = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d')
+
+    cache_utils.write_prediction(1, 2, yesterday, 'old', db_path=TEST_DB)
+    assert cache_utils.read_prediction(1, 2, yesterday, db_path=TEST_DB) == 'old'
+    assert cache_utils.read_prediction(1, 2, today, db_path=TEST_DB) is None
+
+    cache_utils.write_prediction(1, 2, today, 'new', db_path=TEST_DB)
+    assert cache_utils.read_prediction(1, 2, today, db_path=TEST_DB) == 'new'
+    assert cache_utils.read_prediction(1, 2, yesterday, db_path=TEST_DB) is None
+
+    cache_utils.write_prediction(1, 2, today, 'linear', model='linear', db_path=TEST_DB)
+    assert cache_utils.read_prediction(1, 2, today, model='linear', db_path=TEST_DB) == 'linear'
+    assert cache_utils.read_prediction(1, 2, today, db_path=TEST_DB) == 'new'
+    assert cache_utils.read_prediction(1, 2, today, model='holtwinters', db_path=TEST_DB) is None
+
+def test_split_cache():
+    """validate split_cache read/write"""
+    cache_utils.write_split_history(DEMO_HISTORY, TEST_SPLIT_DB)
+
+    data = cache_utils.read_split_history(34, 10000002, TEST_SPLIT_DB)
+    assert data.empty
+
+    data = cache_utils.read_split_history(10000002, 34, TEST_SPLIT_DB)
+    assert list(data.columns.values) == cache_utils.SPLIT_COLUMNS
+    assert len(data.index) == 3
+
+    data = cache_utils.read_split_history(
+        10000002, 34, TEST_SPLIT_DB,
+        split_date='2017-01-02'
+    )
+    assert data['date'].max() == '2017-01-02'
+
+    ## rewrite does not duplicate rows ##
+    cache_utils.write_split_history(
+        DEMO_HISTORY, TEST_SPLIT_DB,
+        type_id=34,
+        region_id=10000002
+    )
+    data = cache_utils.read_split_history(10000002, 34, TEST_SPLIT_DB)
+    assert len(data.index) == 3
+
+def test_migrate_tinydb_caches():
+    """validate migration from legacy tinydb files"""
+    test_clear_caches()
+    id_cache = {'_default': {
+        '1': {'index_key': 34, 'cache_datetime': 1.0, 'payload': {'name': 'Tritanium'}}
+    }}
+    prophet_cache = {'_default': {
+        '1': {
+            'cache_date': '2017-01-01',
+            'region_id': 10000002,
+            'type_id': 34,
+            'lastWrite': 1.0,
+            'prediction': '[]'
+        }
+    }}
+    split_cache = {'_default': {
+        str(index+1): row
+        for index, row in enumerate(DEMO_HISTORY.to_dict(orient='records'))
+    }}
+    for filename, data in [
+            ('inventory_types.json', id_cache),
+            ('prophet.json', prophet_cache),
+            ('test_splitcache.json', split_cache),
+    ]:
+        with open(path.join(TEST_CACHE_PATH, filename), 'w') as json_fh:
+            json.dump(data, json_fh)
+
+    report = cache_utils.migrate_tinydb_caches(
+        cache_path=TEST_CACHE_PATH,
+        db_filename='test_cache.db'
+    )
+    assert report == {
+        'inventory_types.json': 1,
+        'prophet.json': 1,
+        'test_splitcache.json': 3
+    }
+
+    id_data = cache_utils.read_id_cache('inventory_types', db_path=TEST_DB)
+    assert id_data[34] == (1.0, {'name': 'Tritanium'})
+    assert cache_utils.read_prediction(10000002, 34, '2017-01-01', db_path=TEST_DB) == '[]'
+    assert len(cache_utils.read_split_history(10000002, 34, TEST_SPLIT_DB).index) == 3
+
+def test_response_cache():
+    """validate response_cache read/write/expiry"""
+    assert cache_utils.read_response('ohlc:1:2:json', db_path=TEST_DB) is None
+
+    now = datetime.utcnow().timestamp()
+    cache_utils.write_response(
+        'ohlc:1:2:json', b'[{"a": 1}]\n', 'application/json',
+        etag='abc', last_modified=now, expires=now + 60, db_path=TEST_DB
+    )
+    cache_utils.write_response(
+        'ohlc:1:3:json', b'[]\n', 'application/json',
+        etag='def', last_modified=now, expires=now - 1, db_path=TEST_DB
+    )
+    cached = cache_utils.read_response('ohlc:1:2:json', db_path=TEST_DB)
+    assert bytes(cached['body']) == b'[{"a": 1}]\n'
+    assert cached['etag'] == 'abc'
+    assert cached['content_type'] == 'application/json'
+    assert cache_utils.read_response('ohlc:1:3:json', db_path=TEST_DB) is None
+
+def test_response_cache_variants():
+    """precompressed bodies are picked by preference, plain body otherwise"""
+    now = datetime.utcnow().timestamp()
+    cache_utils.write_response(
+        'prophet:1:2:csv:60', b'plain', 'text/csv',
+        etag='abc', last_modified=now, expires=now + 60,
+        variants={'gzip': b'gz', 'br': b'brotli'},
+        db_path=TEST_DB
+    )
+    cached = cache_utils.read_response(
+        'prophet:1:2:csv:60', encodings=['br', 'gzip'], db_path=TEST_DB)
+    assert (cached['encoding'], bytes(cached['body'])) == ('br', b'brotli')
+    cached = cache_utils.read_response(
+        'prophet:1:2:csv:60', encodings=['deflate', 'gzip'], db_path=TEST_DB)
+    assert (cached['encoding'], bytes(cached['body'])) == ('gzip', b'gz')
+    cached = cache_utils.read_response('prophet:1:2:csv:60', db_path=TEST_DB)
+    assert (cached['encoding'], bytes(cached['body'])) == (None, b'plain')
+
+def test_write_predictions():
+    """bulk prediction writes replace older entries per pair"""
+    cache_utils.write_prediction(10000002, 34, '2017-01-01', '[1]', db_path=TEST_DB)
+    written = cache_utils.write_predictions(
+        [(10000002, 34, '[2]'), (10000043, 35, '[3]')],
+        '2017-01-02',
+        db_path=TEST_DB
+    )
+    assert written == 2
+    assert cache_utils.read_prediction(10000002, 34, '2017-01-01', db_path=TEST_DB) is None
+    assert cache_utils.read_prediction(10000002, 34, '2017-01-02', db_path=TEST_DB) == '[2]'
+    assert cache_utils.read_prediction(10000043, 35, '2017-01-02', db_path=TEST_DB) == '[3]'
+
+def test_access_counts():
+    """demand ranking for precompute"""
+    for _ in range(3):
+        cache_utils.record_access('prophet', 10000002, 34, '2017-01-02', db_path=TEST_DB)
+    cache_utils.record_access('prophet', 10000043, 35, '2017-01-03', db_path=TEST_DB)
+    cache_utils.record_access('prophet', 10000043, 35, '2016-01-01', db_path=TEST_DB)
+    cache_utils.record_access('ohlc', 10000043, 36, '2017-01-03', db_path=TEST_DB)
+
+    assert cache_utils.read_top_accessed('prophet', 5, '2017-01-01', db_path=TEST_DB) == \
+        [(10000002, 34, 3), (10000043, 35, 1)]
+    assert cache_utils.read_top_accessed('prophet', 1, '2017-01-01', db_path=TEST_DB) == \
+        [(10000002, 34, 3)]
+    assert cache_utils.prune_access_counts('2017-01-01', db_path=TEST_DB) == 1
+    assert cache_utils.read_top_accessed('prophet', 5, '2000-01-01', db_path=TEST_DB) == \
+        [(10000002, 34, 3), (10000043, 35, 1)]
+
+def test_access_counter():
+    """request counts are held in memory until flushed"""
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    counter = cache_utils.AccessCounter(flush_interval=3600, flush_size=3)
+    for _ in range(4):
+        counter.hit('counter', 10000002, 34, db_path=TEST_DB)
+    counter.hit('counter', 10000043, 35, db_path=TEST_DB)
+    assert cache_utils.read_top_accessed('counter', 5, today, db_path=TEST_DB) == []
+
+    assert counter.flush() == 2
+    assert counter.flush() == 0
+    assert cache_utils.read_top_accessed('counter', 5, today, db_path=TEST_DB) == \
+        [(10000002, 34, 4), (10000043, 35, 1)]
+
+    ## flush_size pending pairs forces a write ##
+    counter.hit('counter', 10000043, 35, db_path=TEST_DB)
+    counter.hit('counter', 10000043, 36, db_path=TEST_DB)
+    counter.hit('counter', 10000043, 37, db_path=TEST_DB)
+    assert cache_utils.read_top_accessed('counter', 5, today, db_path=TEST_DB) == \
+        [(10000002, 34, 4), (10000043, 35, 2), (10000043, 36, 1), (10000043, 37, 1)]
+
+def test_forecast_params():
+    """warm-start parameters round-trip, newest write wins"""
+    assert cache_utils.read_forecast_params(10000002, 34, db_path=TEST_DB) is None
+
+    cache_utils.write_forecast_params([(10000002, 34, '{"a": 1}')], db_path=TEST_DB)
+    cache_utils.write_forecast_params([(10000002, 34, '{"a": 2}')], db_path=TEST_DB)
+    assert cache_utils.read_forecast_params(10000002, 34, db_path=TEST_DB) == '{"a": 2}'
+    assert cache_utils.read_forecast_params(10000043, 34, db_path=TEST_DB) is None
@@ -1,6 +1,7 @@
 from os import path, listdir, remove
 import platform
 import io
+import gzip
 from datetime import datetime, timedelta
 import time
 import json
@@ -147,6 +148,31 @@ class TestODBCjson:
 
         assert set(expected_headers) == set(data.columns.values)
 
+    def test_odbc_conditional(self):
+        """repeat requests come from response cache, validators give 304"""
+        query = url_for('ohlc_endpoint', return_type='json') + \
+            '?typeID={type_id}&regionID={region_id}'.format(
+                type_id=CONFIG.get('TEST', 'nosplit_id'),
+                region_id=CONFIG.get('TEST', 'region_id')
+            )
+        req = self.client.get(query)
+        assert req._status_code == 200
+        assert req.headers['ETag']
+        assert req.headers['Last-Modified']
+
+        req_304 = self.client.get(query, headers={'If-None-Match': req.headers['ETag']})
+        assert req_304._status_code == 304
+        assert req_304.data == b''
+
+        req_200 = self.client.get(query, headers={'If-None-Match': '"butts"'})
+        assert req_200._status_code == 200
+        assert req_200.data == req.data
+
+        req_gzip = self.client.get(query, headers={'Accept-Encoding': 'gzip'})
+        assert req_gzip.headers['Content-Encoding'] == 'gzip'
+        assert req_gzip.headers['ETag'] != req.headers['ETag']
+        assert gzip.decompress(req_gzip.data) == req.data
+
     def test_odbc_bad_typeid(self):
         """make sure expected errors happen on bad typeid"""
         req = self.client.get(
@@ -305,6 +331,39 @@ class TestProphetcsv:
         )
         assert req._status_code == 405
 
+    def test_prophet_models(self):
+        """lightweight backends report the same columns"""
+        for model in ['holtwinters', 'linear']:
+            req = self.client.get(
+                url_for('prophetendpoint', return_type='csv') +
+                '?typeID={type_id}&regionID={region_id}&api={api_key}&range={range}&model={model}'.format(
+                    type_id=CONFIG.get('TEST', 'nosplit_id'),
+                    region_id=CONFIG.get('TEST', 'region_id'),
+                    api_key=TEST_API_KEY,
+                    range=CONFIG.get('TEST', 'forecast_range'),
+                    model=model
+                )
+            )
+            assert req._status_code == 200
+            with io.StringIO(req.data.decode()) as buff:
+                data = pd.read_csv(buff)
+            assert list(data.columns.values) == [
+                'date', 'avgPrice', 'yhat', 'yhat_low', 'yhat_high', 'prediction'
+            ]
+            assert data['prediction'].sum() == int(CONFIG.get('TEST', 'forecast_range'))
+
+    def test_prophet_bad_model(self):
+        """unknown backends are rejected"""
+        req = self.client.get(
+            url_for('prophetendpoint', return_type='csv') +
+            '?typeID={type_id}&regionID={region_id}&api={api_key}&model=butts'.format(
+                type_id=CONFIG.get('TEST', 'nosplit_id'),
+                region_id=CONFIG.get('TEST', 'region_id'),
+                api_key=TEST_API_KEY
+            )
+        )
+        assert req._status_code == 400
+
 @pytest.mark.prophet
 @pytest.mark.usefixtures('client_class')
 class TestProphetjson:
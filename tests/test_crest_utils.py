@@ -3,16 +3,18 @@
 from os import path, makedirs, rmdir
 from shutil import rmtree
 from datetime import datetime, timedelta
+from functools import partial
 import time
 import pandas as pd
 import numpy as np
 import requests
-from tinydb import Query
 
 import pytest
 
 import publicAPI.config as api_config
+import publicAPI.cache_utils as cache_utils
 import publicAPI.crest_utils as crest_utils
+import publicAPI.http_utils as http_utils
 import publicAPI.exceptions as exceptions
 import helpers
 
@@ -114,6 +116,42 @@ def test_esi_fetcher_errors(config=CONFIG):
             config=ROOT_CONFIG
         )
 
+def test_esi_fetcher_conditional():
+    """ESI responses are reused until Expires, then revalidated"""
+    makedirs(TEST_CACHE_PATH, exist_ok=True)
+    helpers.clear_caches()
+    server, esi_base = helpers.start_dummy_server()
+    helpers.DummyESIHandler.hits = []
+    try:
+        data = crest_utils.fetch_esi_endpoint(
+            'map_regions',
+            esi_base=esi_base,
+            region_id=1,
+            config=ROOT_CONFIG
+        )
+        data_retry = crest_utils.fetch_esi_endpoint(
+            'map_regions',
+            esi_base=esi_base,
+            region_id=1,
+            config=ROOT_CONFIG
+        )
+        assert data == data_retry
+        assert len(helpers.DummyESIHandler.hits) == 1  #not expired, no fetch
+
+        data_revalidate = crest_utils.fetch_esi_endpoint(
+            'map_regions',
+            esi_base=esi_base,
+            region_id=1,
+            cache_buster=True,
+            config=ROOT_CONFIG
+        )
+        assert data == data_revalidate
+        assert len(helpers.DummyESIHandler.hits) == 2
+        assert helpers.DummyESIHandler.hits[1][1] is not None  #If-None-Match sent
+    finally:
+        server.shutdown()
+        server.server_close()
+
 def test_endpoint_to_kwarg():
     """validate `endpoint_to_kwarg` behavior"""
     type_pair = crest_utils.endpoint_to_kwarg(
@@ -137,59 +175,6 @@ def test_endpoint_to_kwarg():
 TEST_CACHE_PATH = path.join(HERE, 'cache')
 crest_utils.CACHE_PATH = TEST_CACHE_PATH #Override default for test
 
-@pytest.mark.incremental
-class TestTinyDBHelp:
-    """validate TinyDB functions"""
-    def test_make_db(self):
-        makedirs(TEST_CACHE_PATH, exist_ok=True)
-        tdb_handle = crest_utils.setup_cache_file('dummy_handle')
-        #assert tdb_handle
-        assert path.isfile(path.join(TEST_CACHE_PATH, 'dummy_handle.json'))
-
-        tdb_handle.close()
-
-        helpers.clear_caches()
-        #rmtree(TEST_CACHE_PATH)
-        tdb_handle = crest_utils.setup_cache_file('dummy_handle')
-        #assert tdb_handle
-        assert path.isfile(path.join(TEST_CACHE_PATH, 'dummy_handle.json'))
-
-        tdb_handle.close()
-
-    def test_write_cache(self):
-        """validate write_cache behavior"""
-        tdb_handle = crest_utils.setup_cache_file('dummy_handle')
-
-        dummy_data = {'butts': 1, 'stuff': True}
-
-        crest_utils.write_cache_entry(
-            tdb_handle,
-            999,
-            dummy_data
-        )
-
-        cache_data = tdb_handle.search(Query().index_key == 999)[0]
-        assert 'cache_datetime' in cache_data.keys()
-        cache_datetime = cache_data['cache_datetime']
-        assert cache_data['index_key'] == 999
-        assert cache_data['payload'] == dummy_data
-
-
-        crest_utils.write_cache_entry(
-            tdb_handle,
-            999,
-            dummy_data
-        )
-
-        time.sleep(1)
-        new_data = tdb_handle.search(Query().index_key == 999)
-        assert len(new_data) == 1
-        assert new_data[0]['cache_datetime'] >= cache_datetime
-        assert new_data[0]['index_key'] == 999
-        assert new_data[0]['payload'] == dummy_data
-
-        tdb_handle.close()
-
 @pytest.mark.incremental
 class TestValidateID:
     """collection of tests for `validate_id` testing"""
@@ -200,6 +185,7 @@ class TestValidateID:
     def test_clear_cachefiles(self):
         """init test, clean up paths before test"""
         helpers.clear_caches()
+        crest_utils.VALIDATION_INDEX.clear()
 
     def test_happypath_types(self):
         """make sure behavior is expected for direct use"""
@@ -257,8 +243,8 @@ class TestValidateID:
 
     def test_cache_files(self):
         """make sure cache files were generated"""
-        assert path.isfile(path.join(TEST_CACHE_PATH, 'inventory_types.json'))
-        assert path.isfile(path.join(TEST_CACHE_PATH, 'map_regions.json'))
+        crest_utils.VALIDATION_INDEX.flush()
+        assert path.isfile(path.join(TEST_CACHE_PATH, cache_utils.CACHE_DB))
 
     def test_validate_bad_ids(self):
         """check behavior with bad id's"""
@@ -287,10 +273,13 @@ class TestValidateID:
             config=ROOT_CONFIG,
             cache_buster=True,
         )
-        tdb_handle = crest_utils.setup_cache_file('inventory_types')
-        type_cache = tdb_handle.search(Query().index_key == self.type_id)[0]
+        crest_utils.VALIDATION_INDEX.flush()
+        type_cache = cache_utils.read_id_cache(
+            'inventory_types',
+            db_path=path.join(TEST_CACHE_PATH, cache_utils.CACHE_DB)
+        )
 
-        assert type_info == type_cache['payload']
+        assert type_info == type_cache[self.type_id][1]
 
     def test_validate_region_cache(self):
         """make sure cachebuster and stash agree"""
@@ -300,10 +289,270 @@ class TestValidateID:
             config=ROOT_CONFIG,
             cache_buster=True,
         )
-        tdb_handle = crest_utils.setup_cache_file('map_regions')
-        type_cache = tdb_handle.search(Query().index_key == self.region_id)[0]
+        crest_utils.VALIDATION_INDEX.flush()
+        type_cache = cache_utils.read_id_cache(
+            'map_regions',
+            db_path=path.join(TEST_CACHE_PATH, cache_utils.CACHE_DB)
+        )
+
+        assert type_info == type_cache[self.region_id][1]
+
+def test_validation_index():
+    """validate `ValidationIndex` memory/disk behavior"""
+    makedirs(TEST_CACHE_PATH, exist_ok=True)
+    helpers.clear_caches()
+    index = crest_utils.ValidationIndex()
+    dummy_data = {'butts': 1, 'stuff': True}
 
-        assert type_info == type_cache['payload']
+    assert index.get('dummy_index', 999, 60) is None
+
+    index.put('dummy_index', 999, dummy_data)
+    assert index.get('dummy_index', 999, 60) == dummy_data
+    assert index.get('dummy_index', 999, -60) is None  #expired
+
+    index.flush()
+    cache_data = cache_utils.read_id_cache(
+        'dummy_index',
+        db_path=path.join(TEST_CACHE_PATH, cache_utils.CACHE_DB)
+    )
+    assert cache_data[999][1] == dummy_data
+
+    fresh_index = crest_utils.ValidationIndex()
+    assert fresh_index.get('dummy_index', 999, 60) == dummy_data
+    assert list(fresh_index.load('dummy_index')) == [999]
+    assert isinstance(fresh_index.load('dummy_index')[999], float)    #no payloads in memory
+    assert fresh_index.get('dummy_index', 998, 60) is None
+
+def test_validate_id_negative_cache(monkeypatch):
+    """bad ids should only be fetched once"""
+    makedirs(TEST_CACHE_PATH, exist_ok=True)
+    helpers.clear_caches()
+    crest_utils.VALIDATION_INDEX.clear()
+    bad_typeid = int(CONFIG.get('TEST', 'bad_typeid'))
+
+    fetch_calls = []
+    def dummy_fetch(endpoint_name, **kwargs):
+        """fake ESI 404"""
+        fetch_calls.append(endpoint_name)
+        response = requests.models.Response()
+        response.status_code = 404
+        raise requests.exceptions.HTTPError(response=response)
+    monkeypatch.setattr(crest_utils, 'fetch_esi_endpoint', dummy_fetch)
+
+    for _ in range(2):
+        with pytest.raises(exceptions.IDValidationError):
+            crest_utils.validate_id(
+                'inventory_types',
+                bad_typeid,
+                config=ROOT_CONFIG
+            )
+    assert len(fetch_calls) == 1
+
+    with pytest.raises(exceptions.IDValidationError):
+        crest_utils.validate_id(
+            'inventory_types',
+            bad_typeid,
+            cache_buster=True,
+            config=ROOT_CONFIG
+        )
+    assert len(fetch_calls) == 2
+
+    crest_utils.VALIDATION_INDEX.flush()
+    crest_utils.VALIDATION_INDEX.clear()
+
+def test_next_esi_refresh():
+    """validate daily refresh math"""
+    before = datetime(2017, 1, 1, 3, 0)
+    after = datetime(2017, 1, 1, 12, 0)
+    assert crest_utils.next_esi_refresh('11:05', now=before) == \
+        datetime(2017, 1, 1, 11, 5).timestamp()
+    assert crest_utils.next_esi_refresh('11:05', now=after) == \
+        datetime(2017, 1, 2, 11, 5).timestamp()
+
+DEMO_ESI_HISTORY = [
+    {'date': '2017-01-01', 'average': 5.5, 'highest': 6.0, 'lowest': 5.0, 'volume': 100, 'order_count': 10},
+    {'date': '2017-01-02', 'average': 5.6, 'highest': 6.1, 'lowest': 5.1, 'volume': 200, 'order_count': 20},
+]
+def test_fetch_market_history_cache(monkeypatch):
+    """repeat history fetches come from `HISTORY_CACHE`"""
+    crest_utils.HISTORY_CACHE.clear()
+    fetch_calls = []
+    def dummy_fetch(endpoint_name, **kwargs):
+        """fake ESI history"""
+        fetch_calls.append(kwargs)
+        return DEMO_ESI_HISTORY
+    monkeypatch.setattr(crest_utils, 'fetch_esi_endpoint', dummy_fetch)
+
+    data = crest_utils.fetch_market_history(10000002, 34, config=ROOT_CONFIG)
+    data['avgPrice'] = -1   #callers get their own copy
+    data_retry = crest_utils.fetch_market_history(10000002, 34, config=ROOT_CONFIG)
+    assert len(fetch_calls) == 1
+    assert list(data_retry['avgPrice']) == [5.5, 5.6]
+    assert 'orders' in data_retry.columns.values
+
+    crest_utils.fetch_market_history(10000002, 34, config=ROOT_CONFIG, cache_buster=True)
+    assert len(fetch_calls) == 2
+    crest_utils.HISTORY_CACHE.clear()
+
+def test_history_cache_lru():
+    """`HistoryCache` holds at most `max_entries`, least recently used go first"""
+    history_cache = crest_utils.HistoryCache(max_entries=2)
+    expires = datetime.utcnow().timestamp() + 60
+    frames = {key: pd.DataFrame({'avgPrice': [float(key)]}) for key in range(3)}
+
+    history_cache.put(0, frames[0], expires)
+    history_cache.put(1, frames[1], expires)
+    assert history_cache.get(0) is not None    #0 now most recent
+    history_cache.put(2, frames[2], expires)
+
+    assert history_cache.get(1) is None
+    assert list(history_cache.get(0)['avgPrice']) == [0.0]
+    assert list(history_cache.get(2)['avgPrice']) == [2.0]
+
+    history_cache.put(3, frames[0], datetime.utcnow().timestamp() - 1)
+    assert history_cache.get(3) is None    #expired
+
+class DummyHistoryHandler(helpers.DummyESIHandler):
+    """serves `DEMO_ESI_HISTORY` for every path"""
+    hits = []
+    def payload(self):
+        return DEMO_ESI_HISTORY
+
+def test_fetch_market_history_cache_buster(monkeypatch):
+    """`cache_buster` reaches ESI even while the http_cache entry is fresh"""
+    makedirs(TEST_CACHE_PATH, exist_ok=True)
+    helpers.clear_caches()
+    crest_utils.HISTORY_CACHE.clear()
+    server, esi_base = helpers.start_dummy_server(DummyHistoryHandler)
+    DummyHistoryHandler.hits = []
+    monkeypatch.setattr(
+        crest_utils, 'fetch_esi_endpoint',
+        partial(crest_utils.fetch_esi_endpoint, esi_base=esi_base)
+    )
+    try:
+        data = crest_utils.fetch_market_history(10000002, 34, config=ROOT_CONFIG)
+        crest_utils.HISTORY_CACHE.clear()
+        crest_utils.fetch_market_history(10000002, 34, config=ROOT_CONFIG)
+        assert len(DummyHistoryHandler.hits) == 1   #http_cache not expired
+
+        data_busted = crest_utils.fetch_market_history(
+            10000002, 34, config=ROOT_CONFIG, cache_buster=True
+        )
+        assert len(DummyHistoryHandler.hits) == 2
+        assert DummyHistoryHandler.hits[1][1] is not None  #revalidated
+        assert list(data_busted['avgPrice']) == list(data['avgPrice'])
+    finally:
+        server.shutdown()
+        server.server_close()
+        crest_utils.HISTORY_CACHE.clear()
+
+def test_normalize_history():
+    """history frames share one typed, sorted schema"""
+    raw_data = pd.DataFrame([
+        {'date': '2017-01-02', 'avgPrice': '5.6', 'highPrice': 6.1, 'lowPrice': 5.1, 'volume': 200, 'orders': 20.0, 'typeID': 34},
+        {'date': '2017-01-01', 'avgPrice': 5.5, 'highPrice': 6.0, 'lowPrice': 5.0, 'volume': 100, 'orders': 10, 'typeID': 34},
+        {'date': '2017-01-02T00:00:00', 'avgPrice': 5.7, 'highPrice': 6.1, 'lowPrice': 5.1, 'volume': 300, 'orders': 30, 'typeID': 34},
+    ])
+    data = crest_utils.normalize_history(raw_data)
+
+    assert list(data.columns) == crest_utils.HISTORY_COLUMNS + ['typeID']
+    assert data['date'].dtype == 'datetime64[ns]'
+    for column, dtype in crest_utils.HISTORY_DTYPES.items():
+        assert data[column].dtype == dtype
+    assert list(data['date'].dt.strftime('%Y-%m-%d')) == ['2017-01-01', '2017-01-02']
+    assert list(data['avgPrice']) == [5.5, 5.7]
+    assert list(data.index) == [0, 1]
+
+    assert list(crest_utils.normalize_history(pd.DataFrame()).columns) == \
+        crest_utils.HISTORY_COLUMNS
+    with pytest.raises(exceptions.CRESTParseError):
+        crest_utils.normalize_history(raw_data.drop(columns=['orders']))
+    with pytest.raises(exceptions.CRESTParseError):
+        crest_utils.normalize_history(raw_data.assign(volume='butts'))
+
+def test_resample_ohlc():
+    """weekly/monthly bars match a pandas resample"""
+    rand = np.random.RandomState(1234)
+    days = 120
+    data = crest_utils.normalize_history(pd.DataFrame({
+        'date': pd.date_range('2017-01-03', periods=days).strftime('%Y-%m-%d'),
+        'avgPrice': rand.rand(days),
+        'highPrice': rand.rand(days) + 1,
+        'lowPrice': rand.rand(days) - 1,
+        'volume': rand.randint(0, 1000, days),
+        'orders': rand.randint(0, 10, days),
+    }).drop(index=[10, 11, 12]))
+
+    assert crest_utils.resample_ohlc(data).equals(crest_utils.data_to_ohlc(data))
+    for interval, rule in [('1w', 'W-MON'), ('1M', 'MS')]:
+        bars = crest_utils.resample_ohlc(data, interval)
+        expected = data.set_index('date').resample(rule, label='left', closed='left').agg({
+            'avgPrice': ['first', 'last'],
+            'highPrice': 'max',
+            'lowPrice': 'min',
+            'volume': 'sum',
+        }).dropna()
+        assert list(bars['date']) == list(expected.index)
+        assert np.allclose(bars['open'], expected[('avgPrice', 'first')])
+        assert np.allclose(bars['close'], expected[('avgPrice', 'last')])
+        assert np.allclose(bars['high'], expected[('highPrice', 'max')])
+        assert np.allclose(bars['low'], expected[('lowPrice', 'min')])
+        assert list(bars['volume']) == list(expected[('volume', 'sum')])
+    assert (crest_utils.resample_ohlc(data, '1w')['date'].dt.dayofweek == 0).all()
+
+    assert crest_utils.resample_ohlc(data.iloc[0:0], '1w').empty
+    with pytest.raises(exceptions.UnsupportedFormat):
+        crest_utils.resample_ohlc(data, '5m')
+
+def test_slice_history():
+    """window slicing on sorted dates"""
+    data = crest_utils.normalize_history(pd.DataFrame({
+        'date': pd.date_range('2017-01-01', periods=10).strftime('%Y-%m-%d'),
+        'avgPrice': range(10),
+        'highPrice': range(10),
+        'lowPrice': range(10),
+        'volume': range(10),
+        'orders': range(10),
+    }))
+
+    assert crest_utils.slice_history(data).equals(data)
+    assert list(crest_utils.slice_history(data, last_n=3)['avgPrice']) == [7, 8, 9]
+    window = crest_utils.slice_history(
+        data,
+        start=datetime(2017, 1, 3),
+        end=datetime(2017, 1, 5),
+    )
+    assert list(window['avgPrice']) == [2, 3, 4]
+    assert list(crest_utils.slice_history(
+        data, start=datetime(2017, 1, 3), end=datetime(2017, 1, 5), last_n=2
+    )['avgPrice']) == [3, 4]
+    assert crest_utils.slice_history(data, end=datetime(2016, 1, 1)).empty
+    assert crest_utils.slice_history(
+        data, start=datetime(2017, 1, 5), end=datetime(2017, 1, 3)
+    ).empty
+
+def test_fetch_market_history_many(monkeypatch):
+    """multi-pair fetch reports data and errors per pair"""
+    crest_utils.HISTORY_CACHE.clear()
+    def dummy_fetch(endpoint_name, **kwargs):
+        """fake ESI history, type 0 is bad"""
+        if kwargs['type_id'] == 0:
+            raise requests.exceptions.ConnectionError('butts')
+        return DEMO_ESI_HISTORY
+    monkeypatch.setattr(crest_utils, 'fetch_esi_endpoint', dummy_fetch)
+
+    pairs = [(10000002, 34), (10000043, 34), (10000002, 0), ('10000002', '34')]
+    results, errors = crest_utils.fetch_market_history_many(
+        pairs,
+        config=ROOT_CONFIG,
+        max_concurrency=4,
+        rate_limiter=http_utils.RateLimiter(rate=100, burst=2),
+    )
+    assert sorted(results.keys()) == [(10000002, 34), (10000043, 34)]
+    assert list(results[(10000043, 34)]['avgPrice']) == [5.5, 5.6]
+    assert list(errors.keys()) == [(10000002, 0)]
+    assert isinstance(errors[(10000002, 0)], exceptions.CRESTBadMarketData)
+    crest_utils.HISTORY_CACHE.clear()
 
 def test_fetch_market_history_esi(config=CONFIG):
     """test `fetch_market_history` utility"""
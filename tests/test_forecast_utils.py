@@ -1,14 +1,16 @@
 from os import path, makedirs
 from shutil import rmtree
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 import platform
 import pandas as pd
 import numpy as np
 import requests
-from tinydb import TinyDB, Query
 
 import pytest
 
+import publicAPI.cache_utils as cache_utils
+import publicAPI.config as api_config
 import publicAPI.forecast_utils as forecast_utils
 import publicAPI.exceptions as exceptions
 import helpers
@@ -133,6 +135,45 @@ def test_parse_emd_data_fail():
     with pytest.raises(TypeError):
         data = forecast_utils.parse_emd_data(DEMO_DATA)
 
+def test_parse_emd_data_types():
+    """numeric fields come back typed, dates as text"""
+    cleandata = forecast_utils.parse_emd_data(DEMO_DATA['result'])
+
+    assert cleandata['avgPrice'].dtype == np.float64
+    assert cleandata['volume'].dtype == np.int64
+    assert cleandata['typeID'].dtype == np.int64
+    assert cleandata['date'].iloc[0] == DEMO_DATA['result'][0]['row']['date']
+    assert cleandata['highPrice'].iloc[-1] == 684.0
+
+    assert forecast_utils.parse_emd_data([]).empty
+
+def test_parse_emd_data_nulls():
+    """null numeric fields come back NaN instead of failing the parse"""
+    null_result = [{'row': dict(entry['row'])} for entry in DEMO_DATA['result']]
+    null_result[0]['row']['avgPrice'] = None
+    null_result[1]['row']['volume'] = None
+    cleandata = forecast_utils.parse_emd_data(null_result)
+
+    assert len(cleandata.index) == len(null_result)
+    assert np.isnan(cleandata['avgPrice'].iloc[0])
+    assert np.isnan(cleandata['volume'].iloc[1])
+    assert cleandata['volume'].dtype == np.float64
+    assert cleandata['orders'].dtype == np.int64
+    assert cleandata['avgPrice'].iloc[1] == float(DEMO_DATA['result'][1]['row']['avgPrice'])
+
+def test_split_emd_data():
+    """multi-pair payloads split per (region_id, type_id)"""
+    multi_result = DEMO_DATA['result'] + [
+        {'row': dict(entry['row'], typeID='34')} for entry in DEMO_DATA['result']
+    ]
+    split_data = forecast_utils.split_emd_data(multi_result)
+
+    assert set(split_data.keys()) == {(10000002, 38), (10000002, 34)}
+    for (region_id, type_id), pair_data in split_data.items():
+        assert len(pair_data.index) == len(DEMO_DATA['result'])
+        assert set(pair_data['typeID']) == {type_id}
+        assert list(pair_data.index) == list(range(len(pair_data.index)))
+
 TEST_DATA_PATH = path.join(HERE, 'sample_emd_data.csv')
 TEST_PREDICT_PATH = path.join(HERE, 'sample_emd_predict.csv')
 @pytest.mark.prophet
@@ -196,11 +237,137 @@ def test_forecast_truncate(config=CONFIG):
 
     assert expected_min_date == actual_min_date
 
+def test_lightweight_forecasts():
+    """non-prophet backends build the same report"""
+    test_data = pd.read_csv(TEST_DATA_PATH)
+    test_data['date'] = pd.to_datetime(test_data['date'])
+    forecast_range = int(CONFIG.get('TEST', 'forecast_range'))
+
+    for model in ['holtwinters', 'linear']:
+        report, params = forecast_utils.fit_forecast(
+            test_data.copy(), forecast_range, model=model
+        )
+        assert params is None
+        assert list(report.columns) == [
+            'date', 'avgPrice', 'yhat', 'yhat_low', 'yhat_high', 'prediction'
+        ]
+        assert len(report.index) == len(test_data.index) + forecast_range
+        assert report['prediction'].sum() == forecast_range
+        assert report['date'].max() == test_data['date'].max() + timedelta(days=forecast_range)
+        assert not report['yhat'].isnull().any()
+        assert (report['yhat_low'] <= report['yhat']).all()
+        assert (report['yhat'] <= report['yhat_high']).all()
+
+    with pytest.raises(ValueError):
+        forecast_utils.build_forecast(test_data, forecast_range, model='butts')
+
+def test_precision_modes():
+    """precision flags map to sample counts and their own cache entries"""
+    assert forecast_utils.precision_samples('full') is None
+    assert forecast_utils.precision_samples('fast') == api_config.UNCERTAINTY_SAMPLES
+    assert forecast_utils.precision_samples('map') == 0
+    with pytest.raises(ValueError):
+        forecast_utils.precision_samples('butts')
+
+    assert forecast_utils.cache_model_key('prophet') == 'prophet'
+    assert forecast_utils.cache_model_key('prophet', 'map') == 'prophet:map'
+    assert forecast_utils.cache_model_key('linear', 'map') == 'linear'
+
+def test_analytic_intervals():
+    """MAP bands: observation noise in history, trend uncertainty grows after"""
+    dates = pd.date_range('2017-01-01', periods=120, freq='D')
+    model = SimpleNamespace(
+        start=dates[0],
+        t_scale=dates[99] - dates[0],
+        y_scale=10.0,
+        changepoints_t=np.linspace(0.1, 0.8, 25),
+        params={
+            'sigma_obs': np.array([[0.02]]),
+            'delta': np.full((1, 25), 0.01),
+        },
+    )
+    forecast = pd.DataFrame({'ds': dates, 'yhat': np.full(len(dates), 5.0)})
+
+    lower, upper = forecast_utils.analytic_intervals(model, forecast)
+    half_width = (upper - lower) / 2
+    assert np.allclose(upper - 5.0, 5.0 - lower)
+    assert np.allclose(half_width[:100], forecast_utils.INTERVAL_Z * 10.0 * 0.02)
+    assert (np.diff(half_width[100:]) > 0).all()
+
+def test_warm_start_params():
+    """warm starts only while history grows forward"""
+    test_data = pd.read_csv(TEST_DATA_PATH)
+    test_data['date'] = pd.to_datetime(test_data['date'])
+    yesterday = test_data.iloc[:-1]
+    stored = {
+        'init': {'k': 0.1, 'm': 0.5, 'sigma_obs': 0.05, 'delta': [0.0], 'beta': [0.0]},
+        'start': yesterday['date'].min().strftime('%Y-%m-%d'),
+        'end': yesterday['date'].max().strftime('%Y-%m-%d'),
+        'end_y': float(yesterday['avgPrice'].iloc[-1]),
+    }
+
+    assert forecast_utils.warm_start_params(None, test_data) is None
+    assert forecast_utils.warm_start_params(stored, test_data) == stored['init']
+
+    ## split stitch: history rescaled ##
+    rescaled = test_data.copy()
+    rescaled['avgPrice'] = rescaled['avgPrice'] / 2
+    assert forecast_utils.warm_start_params(stored, rescaled) is None
+
+    ## backfill: older rows appear ##
+    backfill = pd.concat([
+        pd.DataFrame({'date': [test_data['date'].min() - timedelta(days=1)], 'avgPrice': [1.0]}),
+        test_data,
+    ])
+    assert forecast_utils.warm_start_params(stored, backfill) is None
+
+    ## last fitted day missing ##
+    assert forecast_utils.warm_start_params(stored, test_data.iloc[:-2]) is None
+
+def test_warm_start_rejected(monkeypatch, caplog):
+    """Stan rejecting a warm start refits cold, other errors raise"""
+    test_data = pd.read_csv(TEST_DATA_PATH)
+    test_data['date'] = pd.to_datetime(test_data['date'])
+    warm_start = {'k': 0.1, 'm': 0.5, 'sigma_obs': 0.05, 'delta': [0.0], 'beta': [0.0]}
+    warm_error = RuntimeError('Initialization failed.')
+
+    class DummyProphet(object):
+        """fbprophet stand-in: fails any warm fit with `warm_error`"""
+        def __init__(self, **kwargs):
+            self.history = None
+            self.params = {key: np.zeros(1) for key in forecast_utils.WARM_START_KEYS}
+        def fit(self, history, init=None):
+            if init is not None:
+                raise warm_error
+            self.history = history
+            return self
+        def make_future_dataframe(self, periods):
+            return pd.DataFrame({'ds': forecast_utils.future_dates(self.history['ds'], periods)})
+        def predict(self, future):
+            return future.assign(yhat=1.0, yhat_lower=0.0, yhat_upper=2.0)
+    monkeypatch.setattr(forecast_utils, 'Prophet', DummyProphet)
+
+    with caplog.at_level('WARNING', logger='publicAPI'):
+        _, params = forecast_utils.fit_forecast(
+            test_data.copy(), 10,
+            warm_start=warm_start,
+            region_id=10000002,
+            type_id=34,
+        )
+    assert params['warm'] is False
+    assert 'warm start rejected' in caplog.text
+    assert 'region_id=10000002' in caplog.text
+    assert 'Initialization failed' in caplog.text
+
+    warm_error = KeyError('beta')
+    with pytest.raises(KeyError):
+        forecast_utils.fit_forecast(test_data.copy(), 10, warm_start=warm_start)
+
 @pytest.mark.incremental
 class TestPredictCache:
     """test cache tools in Prediction toolset"""
     cache_path = path.join(HERE, 'cache')
-    cache_file = 'prophet.json'
+    cache_file = cache_utils.CACHE_DB
     cache_filepath = path.join(cache_path, cache_file)
     type_id = int(CONFIG.get('TEST', 'type_id'))
     region_id = int(CONFIG.get('TEST', 'region_id'))
@@ -220,12 +387,6 @@ class TestPredictCache:
 
         assert path.isfile(self.cache_filepath)
 
-        tdb = TinyDB(self.cache_filepath)
-
-        assert tdb.all() == []
-
-        tdb.close()
-
     def test_write_first_cache(self):
         """test write behavior on first pass (cache-buster mode)"""
         self.test_clear_existing_cache()    #blowup existing cache again
@@ -241,26 +402,31 @@ class TestPredictCache:
 
         assert path.isfile(self.cache_filepath)
 
-        tdb = TinyDB(self.cache_filepath)
+        data = forecast_utils.check_prediction_cache(
+            self.region_id,
+            self.type_id,
+            cache_path=self.cache_path
+        )
+        dummy_data['date'] = pd.to_datetime(dummy_data['date'])
 
-        data = tdb.all()[0]
+        assert data.equals(dummy_data)
 
-        keys_list = [
-            'cache_date',
-            'region_id',
-            'type_id',
-            'lastWrite',
-            'prediction'
-        ]
-        assert set(keys_list) == set(data.keys())
-        dummy_str_data = dummy_data.to_json(
-            date_format='iso',
-            orient='records'
+    def test_legacy_json_cache(self):
+        """JSON predictions written before typed caching still load"""
+        cache_utils.write_prediction(
+            self.region_id,
+            self.type_id,
+            datetime.utcnow().strftime('%Y-%m-%d'),
+            '[{"date":"2017-01-01T00:00:00.000Z","avgPrice":5.5,"prediction":false}]',
+            db_path=self.cache_filepath
+        )
+        data = forecast_utils.check_prediction_cache(
+            self.region_id,
+            self.type_id,
+            cache_path=self.cache_path
         )
-        cached_data = pd.read_json(data['prediction'])
 
-        assert data['prediction'] == dummy_str_data
-        tdb.close()
+        assert list(data['avgPrice']) == [5.5]
 
 def test_check_requested_range():
     """validate `check_requested_range()` func"""
@@ -0,0 +1,122 @@
+"""test_format_utils.py: tests for format_utils.py"""
+import gzip
+import io
+import json as std_json
+
+import numpy as np
+import pandas as pd
+import ujson as json
+
+import publicAPI.crest_utils as crest_utils
+import publicAPI.format_utils as format_utils
+
+def demo_history(days=200):
+    """build a random market history"""
+    rand = np.random.RandomState(1234)
+    return pd.DataFrame({
+        'date': pd.date_range('2016-01-01', periods=days).strftime('%Y-%m-%d'),
+        'avgPrice': rand.rand(days) * 1e6,
+        'highPrice': rand.rand(days) * 1e12 / 7,
+        'lowPrice': rand.rand(days) / 3e5,
+        'volume': rand.randint(0, 2**40, days),
+        'orders': rand.randint(0, 100, days),
+    })
+
+def legacy_json(data):
+    """old path: to_json -> json.loads -> flask-restful json.dumps"""
+    return std_json.dumps(json.loads(data.to_json(path_or_buf=None, orient='records'))) + '\n'
+
+def test_ohlc_matches_legacy():
+    """OHLC encodes exactly as the pandas round trip did"""
+    data = crest_utils.data_to_ohlc(demo_history())
+    columns = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+    assert format_utils.to_json_str(data) == legacy_json(data)
+    assert format_utils.to_csv_str(data, columns=columns) == \
+        data.to_csv(path_or_buf=None, header=True, index=False, columns=columns)
+
+    empty = data.iloc[0:0]
+    assert format_utils.to_json_str(empty) == legacy_json(empty)
+
+def test_typed_ohlc_matches_legacy():
+    """datetime64 history renders the same text dates as ESI strings did"""
+    legacy_data = crest_utils.data_to_ohlc(demo_history())
+    data = crest_utils.data_to_ohlc(crest_utils.normalize_history(demo_history()))
+    columns = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+    assert format_utils.to_json_str(data, date_format='%Y-%m-%d') == legacy_json(legacy_data)
+    assert format_utils.to_csv_str(data, columns=columns) == \
+        legacy_data.to_csv(path_or_buf=None, header=True, index=False, columns=columns)
+    assert json.loads(
+        format_utils.to_json_str(data, settings={'indent': 4}, date_format='%Y-%m-%d')
+    ) == json.loads(legacy_json(legacy_data))
+
+def test_prediction_matches_legacy():
+    """datetimes, bools, NaN and awkward strings encode as before"""
+    history = demo_history()
+    data = pd.DataFrame({
+        'date': pd.to_datetime(history['date']),
+        'avgPrice': history['avgPrice'],
+        'yhat': history['lowPrice'],
+        'yhat_low': np.nan,
+        'yhat_high': history['highPrice'],
+        'prediction': history['orders'] > 50,
+        'note': 'say "hi", ok?\n',
+    })
+    data.loc[3, 'avgPrice'] = np.nan
+
+    assert format_utils.to_json_str(data) == legacy_json(data)
+    assert format_utils.to_csv_str(data) == \
+        data.to_csv(path_or_buf=None, header=True, index=False)
+
+    pretty = format_utils.to_json_str(data, settings={'indent': 4})
+    assert json.loads(pretty) == json.loads(legacy_json(data))
+
+def test_chunked_matches_whole():
+    """streamed chunks join back to the single-shot body"""
+    data = crest_utils.data_to_ohlc(demo_history(days=1234))
+    data['date'] = pd.to_datetime(data['date'])
+
+    chunks = list(format_utils.iter_json(data, chunk_rows=500))
+    assert len(chunks) == 4
+    assert ''.join(chunks) == legacy_json(data)
+
+    chunks = list(format_utils.iter_csv(data, chunk_rows=500))
+    assert len(chunks) == 4     #header + 3 row chunks
+    assert ''.join(chunks) == data.to_csv(path_or_buf=None, header=True, index=False)
+
+def test_compress_variants():
+    """every advertised encoding gets a round-trippable variant"""
+    body = format_utils.to_csv_str(crest_utils.data_to_ohlc(demo_history())).encode()
+    variants = format_utils.compress_variants(body)
+
+    assert sorted(variants) == sorted(format_utils.content_encodings())
+    assert gzip.decompress(variants['gzip']) == body
+    assert len(variants['gzip']) < len(body) / 2
+    if format_utils.brotli is not None:
+        assert format_utils.brotli.decompress(variants['br']) == body
+
+def test_binary_formats():
+    """npy/msgpack carry the same columns and values"""
+    data = crest_utils.data_to_ohlc(demo_history())
+    columns = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+    records = np.load(io.BytesIO(format_utils.to_npy_bytes(data, columns=columns)))
+    assert list(records.dtype.names) == columns
+    assert records.dtype['date'] == np.dtype('datetime64[D]')
+    assert records.dtype['volume'] == np.dtype('<i8')
+    assert np.datetime_as_string(records['date'][0]) == data['date'].iloc[0]
+    np.testing.assert_array_equal(records['close'], data['close'].values)
+
+    decoded = format_utils.from_npy_bytes(format_utils.to_npy_bytes(data, columns=columns))
+    assert list(decoded.columns) == columns
+    assert decoded['date'].dtype == np.dtype('datetime64[ns]')
+    assert decoded.drop(columns='date').equals(data[columns].drop(columns='date'))
+
+    if format_utils.msgpack is None:
+        return
+    payload = format_utils.msgpack.unpackb(
+        format_utils.to_msgpack_bytes(data, columns=columns), raw=False)
+    assert list(payload.keys()) == columns
+    assert payload['date'] == list(data['date'])
+    assert payload['volume'] == list(data['volume'])
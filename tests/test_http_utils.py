@@ -0,0 +1,223 @@
+"""test_http_utils.py: tests for http_utils.py"""
+from os import path
+import threading
+import time
+
+import pytest
+import requests
+
+import publicAPI.exceptions as exceptions
+import publicAPI.http_utils as http_utils
+import helpers
+
+HERE = path.abspath(path.dirname(__file__))
+ROOT = path.dirname(HERE)
+
+ROOT_CONFIG = helpers.get_config(
+    path.join(ROOT, 'scripts', 'app.cfg')
+)
+
+@pytest.fixture
+def dummy_server():
+    """local http server for pool testing"""
+    server, base_url = helpers.start_dummy_server()
+    yield base_url.rstrip('/')
+    server.shutdown()
+    server.server_close()
+
+def test_session_pool_reuse(dummy_server):
+    """repeat fetches should share one keep-alive connection"""
+    pool = http_utils.SessionPool()
+    for index in range(3):
+        req = pool.get(dummy_server + '/test/{0}'.format(index))
+        req.raise_for_status()
+        assert req.json()['path'] == '/test/{0}'.format(index)
+
+    stats = pool.stats()
+    host = dummy_server.split('//')[1]
+    assert stats[host]['requests'] == 3
+    assert stats[host]['connections'] == 1
+
+    pool.close()
+    assert pool.stats() == {}
+
+def test_session_pool_fork(dummy_server):
+    """sessions are rebuilt when pid changes"""
+    pool = http_utils.SessionPool()
+    session = pool.get_session(dummy_server)
+    assert pool.get_session(dummy_server) is session
+
+    pool._pid = -1  #pretend we forked
+    assert pool.get_session(dummy_server) is not session
+
+def test_session_pool_configure():
+    """validate config hooks"""
+    pool = http_utils.SessionPool()
+    pool.configure(ROOT_CONFIG)
+    assert pool.pool_maxsize == int(ROOT_CONFIG.get('HTTP', 'pool_maxsize'))
+    assert pool.pool_block is False
+    assert pool.timeout == float(ROOT_CONFIG.get('HTTP', 'timeout'))
+
+def test_parse_expires():
+    """validate `Expires` parsing"""
+    assert http_utils.parse_expires({}) == 0.0
+    assert http_utils.parse_expires({'Expires': 'butts'}) == 0.0
+    assert http_utils.parse_expires(
+        {'Expires': 'Sat, 01 Jul 2017 11:05:00 GMT'}
+    ) == 1498907100.0
+
+def test_single_flight():
+    """concurrent identical calls run once, errors reach every caller"""
+    calls = []
+    release = threading.Event()
+    @http_utils.coalesce('key')
+    def slow_call(key, other=None):
+        """block until released"""
+        calls.append(key)
+        release.wait(5)
+        if key == 'bad':
+            raise ValueError(key)
+        return [key]
+
+    results = []
+    errors = []
+    def worker(key):
+        try:
+            results.append(slow_call(key, other=object()))
+        except ValueError as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=worker, args=(key,)) for key in ['good'] * 5 + ['bad'] * 3]
+    for thread in threads:
+        thread.start()
+    while http_utils.FLIGHTS.in_flight() < 2:
+        time.sleep(0.01)
+    time.sleep(0.1)     #let waiters pile up
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(calls) == ['bad', 'good']
+    assert results == [['good']] * 5
+    assert len(errors) == 3
+    assert http_utils.FLIGHTS.in_flight() == 0
+
+def test_rate_limiter():
+    """token bucket paces requests past the burst"""
+    limiter = http_utils.RateLimiter(rate=50, burst=2)
+    start_time = time.monotonic()
+    waits = [limiter.acquire() for _ in range(6)]
+    assert waits[:2] == [0.0, 0.0]
+    assert time.monotonic() - start_time >= 4 / 50 * 0.9
+
+    assert http_utils.RateLimiter(rate=0).acquire() == 0.0
+
+class ScriptedPool(object):
+    """stand-in `SessionPool` replaying canned status codes"""
+    def __init__(self, statuses, headers=None):
+        self.statuses = list(statuses)
+        self.headers = headers or {}
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status is None:
+            raise requests.exceptions.ConnectionError('butts')
+        if isinstance(status, Exception):
+            raise status
+        response = requests.models.Response()
+        response.status_code = status
+        response.headers.update(self.headers)
+        return response
+
+def test_retry_policy_backoff():
+    """retry 5xx/connection errors, pass 4xx straight through"""
+    policy = http_utils.RetryPolicy(backoff_base=0.001, backoff_max=0.01)
+    pool = ScriptedPool([None, 502, 200])
+    assert policy.get('http://esi/test', session_pool=pool).status_code == 200
+    assert pool.calls == 3
+    assert policy.state('http://esi/test') == 'closed'
+
+    pool = ScriptedPool([404, 200])
+    assert policy.get('http://esi/test', session_pool=pool).status_code == 404
+    assert pool.calls == 1
+
+    pool = ScriptedPool([503] * 5)
+    assert policy.get('http://esi/test', session_pool=pool).status_code == 503
+    assert pool.calls == policy.max_attempts
+
+def test_retry_policy_circuit():
+    """repeated failures trip the breaker, a good probe closes it"""
+    policy = http_utils.RetryPolicy(
+        max_attempts=1,
+        failure_threshold=2,
+        reset_timeout=0.05,
+    )
+    pool = ScriptedPool([None, None])
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            policy.get('http://esi/test', session_pool=pool)
+    assert policy.state('http://esi/test') == 'open'
+
+    with pytest.raises(exceptions.CircuitOpen):
+        policy.get('http://esi/test', session_pool=pool)
+    assert pool.calls == 2
+
+    time.sleep(0.06)
+    assert policy.state('http://esi/test') == 'half-open'
+    assert policy.get('http://esi/test', session_pool=pool).status_code == 200
+    assert policy.state('http://esi/test') == 'closed'
+
+def trip_circuit(policy, url):
+    """open `url`'s circuit and wait until it is half-open"""
+    for _ in range(policy.failure_threshold):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            policy.get(url, session_pool=ScriptedPool([None]))
+    time.sleep(policy.reset_timeout + 0.01)
+    assert policy.state(url) == 'half-open'
+
+def test_retry_policy_probe_error():
+    """a probe dying on a non-retryable error still counts, breaker recovers"""
+    policy = http_utils.RetryPolicy(max_attempts=1, failure_threshold=2, reset_timeout=0.05)
+    trip_circuit(policy, 'http://esi/test')
+
+    pool = ScriptedPool([requests.exceptions.ChunkedEncodingError('butts')])
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        policy.get('http://esi/test', session_pool=pool)
+    assert policy.state('http://esi/test') == 'open'
+
+    time.sleep(0.06)
+    assert policy.get('http://esi/test', session_pool=pool).status_code == 200
+    assert policy.state('http://esi/test') == 'closed'
+
+def test_retry_policy_probe_budget():
+    """spent error budget during half-open does not use up the probe"""
+    policy = http_utils.RetryPolicy(max_attempts=1, failure_threshold=2, reset_timeout=0.05)
+    trip_circuit(policy, 'http://esi/test')
+
+    policy._error_remain = 0
+    policy._error_reset_at = time.monotonic() + 0.05
+    pool = ScriptedPool([])
+    with pytest.raises(exceptions.CircuitOpen):
+        policy.get('http://esi/test', session_pool=pool)
+    assert pool.calls == 0
+
+    time.sleep(0.06)
+    assert policy.get('http://esi/test', session_pool=pool).status_code == 200
+    assert policy.state('http://esi/test') == 'closed'
+
+def test_retry_policy_error_limit():
+    """spent ESI error budget fails fast until reset"""
+    policy = http_utils.RetryPolicy()
+    pool = ScriptedPool([400], headers={
+        'X-Esi-Error-Limit-Remain': '0',
+        'X-Esi-Error-Limit-Reset': '30',
+    })
+    assert policy.get('http://esi/test', session_pool=pool).status_code == 400
+    with pytest.raises(exceptions.CircuitOpen):
+        policy.get('http://esi/other', session_pool=pool)
+    assert pool.calls == 1
+
+    policy.reset()
+    assert policy.get('http://esi/other', session_pool=pool).status_code == 200
@@ -0,0 +1,132 @@
+"""test_job_utils.py: tests for job_utils.py"""
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import publicAPI.cache_utils as cache_utils
+import publicAPI.exceptions as exceptions
+import publicAPI.job_utils as job_utils
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+TEST_JOB_DB = os.path.join(HERE, 'cache', 'test_jobs.db')
+
+def slow_square(value, delay):
+    """pool work: must be module-level to pickle"""
+    time.sleep(delay)
+    if value < 0:
+        raise ValueError(value)
+    return value * value
+
+def die(code):
+    """pool work: kill the worker like an OOM kill would"""
+    os._exit(code)
+
+@pytest.fixture
+def job_queue():
+    """private job queue (empty job table)"""
+    conn = cache_utils.connect(TEST_JOB_DB)
+    with conn:
+        conn.execute('DELETE FROM forecast_jobs')
+    queue = job_utils.JobQueue(max_workers=1, wait_timeout=5, max_wait=5, db_path=TEST_JOB_DB)
+    yield queue
+    queue.shutdown()
+
+@pytest.fixture
+def other_worker():
+    """second job queue on the same job table, like another web worker"""
+    queue = job_utils.JobQueue(
+        max_workers=1, wait_timeout=5, max_wait=5, poll_interval=0.05, db_path=TEST_JOB_DB
+    )
+    yield queue
+    queue.shutdown()
+
+def test_job_queue_attach(job_queue):
+    """same key attaches, callback sees the result"""
+    results = []
+    job = job_queue.submit(('a', 1), slow_square, 3, 0.5, callback=results.append)
+    same_job = job_queue.submit(('a', 1), slow_square, 3, 0.5, callback=results.append)
+    assert same_job is job
+    assert job_queue.find(('a', 1)) is job
+
+    with pytest.raises(exceptions.JobPending):
+        job_queue.wait(job, 0)
+    assert job_queue.wait(job) == 9
+    time.sleep(0.1)     #callbacks run on the pool's thread
+
+    assert results == [9]
+    assert job_queue.find(('a', 1)) is None
+    assert job_queue.get(job.job_id).to_dict()['status'] == 'done'
+    assert job_queue.get('butts') is None
+
+def test_job_queue_failure(job_queue):
+    """errors reach the waiter and the status report"""
+    job = job_queue.submit(('b', 1), slow_square, -1, 0)
+    with pytest.raises(ValueError):
+        job_queue.wait(job)
+    time.sleep(0.1)
+
+    report = job.to_dict()
+    assert report['status'] == 'failed'
+    assert 'ValueError' in report['error']
+    assert job_queue.find(('b', 1)) is None
+
+def test_job_queue_broken_pool(job_queue):
+    """a dead worker fails its job, the next submit gets a fresh pool"""
+    job = job_queue.submit(('c', 1), die, 1)
+    with pytest.raises(BrokenProcessPool):
+        job_queue.wait(job)
+    assert job.status() == 'failed'
+
+    job = job_queue.submit(('c', 1), slow_square, 4, 0)
+    assert job_queue.wait(job) == 16
+
+def test_job_queue_callback_order(job_queue):
+    """job stays attachable until its callback has cached the result"""
+    seen = []
+    def callback(result):
+        seen.append(job_queue.find(('d', 1)))
+    job = job_queue.submit(('d', 1), slow_square, 5, 0, callback=callback)
+    assert job_queue.wait(job) == 25
+    time.sleep(0.1)
+
+    assert seen == [job]
+    assert job_queue.find(('d', 1)) is None
+
+def test_job_queue_shared(job_queue, other_worker):
+    """polls and duplicate requests on another worker find the job"""
+    job = job_queue.submit(('e', 1), slow_square, 6, 0.5)
+    remote_job = other_worker.submit(('e', 1), slow_square, 6, 0.5)
+    assert remote_job.job_id == job.job_id
+    assert remote_job.future is None
+    assert other_worker.find(('e', 1)).job_id == job.job_id
+    assert other_worker.get(job.job_id).to_dict()['status'] == 'queued'
+
+    with pytest.raises(exceptions.JobPending):
+        other_worker.wait(remote_job, 0)
+    assert other_worker.wait(remote_job) is None    #done: result is in the cache
+    assert job_queue.wait(job) == 36
+
+    report = other_worker.get(job.job_id).to_dict()
+    assert report['status'] == 'done'
+    assert report['key'] == ['e', 1]
+    assert other_worker.find(('e', 1)) is None
+
+def test_job_queue_shared_failure(job_queue, other_worker):
+    """another worker's failed job raises `JobFailed` with its error"""
+    job = job_queue.submit(('f', 1), slow_square, -1, 0.2)
+    remote_job = other_worker.find(('f', 1))
+    with pytest.raises(exceptions.JobFailed):
+        other_worker.wait(remote_job)
+    assert 'ValueError' in other_worker.get(job.job_id).to_dict()['error']
+
+def test_job_queue_lost_job(job_queue):
+    """in-flight rows past `job_timeout` (dead worker) don't block the key"""
+    cache_utils.claim_job(
+        'lost', ['g', 1], time.time() - 3600, time.time() - 7200, db_path=TEST_JOB_DB
+    )
+    job = job_queue.submit(('g', 1), slow_square, 7, 0)
+    assert job.job_id != 'lost'
+    assert job_queue.wait(job) == 49
+    assert job_queue.get('lost').to_dict()['status'] == 'failed'
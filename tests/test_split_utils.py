@@ -2,7 +2,6 @@
 from os import path
 from math import floor
 from datetime import datetime, timedelta
-from tinydb import TinyDB, Query
 
 import pandas as pd
 import pytest
@@ -18,7 +17,7 @@ HERE = path.abspath(path.dirname(__file__))
 ROOT = path.dirname(HERE)
 
 SPLIT_FILE = path.join(ROOT, 'publicAPI', 'split_info.json')
-SPLIT_CACHE = path.join(ROOT, 'publicAPI', 'cache', 'travis_splitcache.json')
+SPLIT_CACHE = path.join(ROOT, 'publicAPI', 'cache', 'travis_splitcache.db')
 
 DAYS_SINCE_SPLIT = 10
 TEST_DATE = datetime.utcnow() - timedelta(days=DAYS_SINCE_SPLIT)
@@ -320,7 +319,7 @@ def prep_raw_data(
     clean_data = clean_data[split_utils.KEEP_COLUMNS]
     clean_data.sort_values(
         by='date',
-        ascending=False,
+        ascending=True,
         inplace=True
     )
     return clean_data